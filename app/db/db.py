@@ -1,19 +1,104 @@
+import asyncio
+import time
 import typing
+import uuid
+from pathlib import Path
 
+from alembic import command
+from alembic.config import Config
 from config.settings import settings
-from db.models import Base
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from db.pool import InstrumentedAsyncQueuePool
+from db.replicas import ReplicaRouter
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
-database_url = f"postgresql+asyncpg://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
-engine = create_async_engine(database_url, echo=False)
+
+def build_engine(database_url: str, connect_timeout: typing.Optional[float] = None) -> AsyncEngine:
+    """Create an engine with the pool and statement cache configured in settings."""
+    connect_args: typing.Dict[str, typing.Any] = {
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+    }
+    if settings.db_pgbouncer:
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    if connect_timeout is not None:
+        connect_args["timeout"] = connect_timeout
+    return create_async_engine(
+        database_url,
+        echo=False,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
+def pool_statistics(engine: AsyncEngine) -> typing.Dict[str, typing.Any]:
+    return typing.cast(InstrumentedAsyncQueuePool, engine.pool).statistics()
+
+
+database_url = settings.database_url
+engine = build_engine(database_url)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
 
+def build_read_router(primary: async_sessionmaker[AsyncSession]) -> ReplicaRouter:
+    engines = [build_engine(url, connect_timeout=settings.db_replica_connect_timeout) for url in settings.db_replica_urls]
+    return ReplicaRouter(primary, engines, settings.db_replica_retry_seconds)
+
+
+read_router = build_read_router(async_session_maker)
+
+# Set after a write; until the timestamp it holds, the client's reads go to the primary (read-your-writes).
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+
+ALEMBIC_CONFIG_PATH = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+def upgrade_database(revision: str = "head") -> None:
+    """Apply the Alembic migrations up to `revision`."""
+    config = Config(str(ALEMBIC_CONFIG_PATH))
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, revision)
+
+
 async def create_db_and_tables() -> None:
-    """Create database and tables."""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Create or upgrade the database schema by running the migrations."""
+    # The migration environment runs its own event loop, so it has to run in a separate thread.
+    await asyncio.to_thread(upgrade_database)
+
+
+async def prepare_database() -> None:
+    """Migrate the schema and seed reference data; run once per deployment, before serving requests."""
+    from services.exchange_rates import ExchangeRateService
+
+    await create_db_and_tables()
+    # A separate engine, so that no connection is left in the shared pool of a process about to fork workers.
+    setup_engine = build_engine(database_url)
+    try:
+        async with async_sessionmaker(setup_engine, expire_on_commit=False)() as session:
+            await ExchangeRateService.seed_default_rates(session)
+    finally:
+        await setup_engine.dispose()
+
+
+async def warm_up_pool(engine: AsyncEngine, connections: int) -> None:
+    """Open `connections` pooled connections up front so that the first requests do not pay for them."""
+
+    async def open_connection() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(open_connection() for _ in range(connections)))
 
 
 async def get_async_session() -> typing.AsyncGenerator[AsyncSession, None]:
@@ -24,6 +109,23 @@ async def get_async_session() -> typing.AsyncGenerator[AsyncSession, None]:
 SessionDep = typing.Annotated[AsyncSession, Depends(get_async_session)]
 
 
+def pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_session(request: Request) -> typing.AsyncGenerator[AsyncSession, None]:
+    """A session for read-only work: on a replica unless the client recently wrote (see PRIMARY_PIN_COOKIE)."""
+    session = async_session_maker() if pinned_to_primary(request) else await read_router.session()
+    async with session:
+        yield session
+
+
+ReadSessionDep = typing.Annotated[AsyncSession, Depends(get_read_session)]
+
+
 async def commit_and_refresh(session: AsyncSession, obj: typing.Any) -> typing.Any:
     await session.commit()
     await session.refresh(obj)
@@ -1,7 +1,26 @@
 from datetime import datetime, timezone
 
-from schemas.enums import TransactionStatusEnum, TransactionTypeEnum, UserStatusEnum
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, Numeric, String, UniqueConstraint
+from schemas.enums import (
+    AnalysisJobStatusEnum,
+    AnalyticsGranularityEnum,
+    TransactionStatusEnum,
+    TransactionTypeEnum,
+    UserStatusEnum,
+)
+from sqlalchemy import (
+    JSON,
+    Column,
+    Date,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    UniqueConstraint,
+    text,
+)
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -13,10 +32,12 @@ class User(Base):  # type: ignore[misc, valid-type]
     id = Column(Integer, primary_key=True)
     email = Column(String, nullable=False, unique=True)
     status = Column(Enum(UserStatusEnum), nullable=False, default=UserStatusEnum.ACTIVE)
-    created = Column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
+    created = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
 
     user_balance = relationship("UserBalance", back_populates="owner")
 
+    __table_args__ = (Index("ix_user_created", "created"),)
+
 
 class UserBalance(Base):  # type: ignore[misc, valid-type]
     """User balance model representing user's balance for a currency."""
@@ -25,19 +46,95 @@ class UserBalance(Base):  # type: ignore[misc, valid-type]
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     currency = Column(String, nullable=False)
     amount = Column(Numeric(precision=20, scale=8), nullable=False)
-    created = Column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
-    UniqueConstraint('user_id', 'currency', name='user_balance_user_currency_unique')
+    created = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
 
     owner = relationship("User", back_populates="user_balance")
 
+    __table_args__ = (UniqueConstraint('user_id', 'currency', name='user_balance_user_currency_unique'),)
+
 
 class Transaction(Base):  # type: ignore[misc, valid-type]
     """Transaction model representing a financial transaction."""
     __tablename__ = "transaction"
+    # Partitioned by month of `created` (see services/partitions.py), which therefore is part of the key.
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, nullable=False)
     currency = Column(String, nullable=False)
     amount = Column(Numeric(precision=20, scale=8), nullable=False)
     status = Column(Enum(TransactionStatusEnum), nullable=False, default=TransactionStatusEnum.PROCESSED)
     type = Column(Enum(TransactionTypeEnum), nullable=False)
-    created = Column(DateTime(timezone=True), nullable=False, default=datetime.now(timezone.utc))
+    created = Column(DateTime(timezone=True), primary_key=True, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_transaction_user_id_created", "user_id", "created"),
+        Index("ix_transaction_created_id", "created", "id"),
+        Index("ix_transaction_created_not_rollbacked", "created", postgresql_where=text("status <> 'ROLLBACKED'")),
+        {"postgresql_partition_by": "RANGE (created)"},
+    )
+
+
+class ExchangeRate(Base):  # type: ignore[misc, valid-type]
+    """USD exchange rate of a currency, in effect for times in [valid_from, valid_to)."""
+    __tablename__ = "exchange_rate"
+    id = Column(Integer, primary_key=True)
+    currency = Column(String, nullable=False)
+    rate_to_usd = Column(Numeric(precision=30, scale=12), nullable=False)
+    valid_from = Column(DateTime(timezone=True), nullable=False)
+    valid_to = Column(DateTime(timezone=True), nullable=True)
+    updated = Column(DateTime(timezone=True), nullable=False)
+
+    # Intervals of a currency must also not overlap, see the exchange_rate_no_overlap constraint of migration 0006.
+    __table_args__ = (UniqueConstraint("currency", "valid_from", name="exchange_rate_currency_valid_from_unique"),)
+
+
+class DailyTransactionMetrics(Base):  # type: ignore[misc, valid-type]
+    """Per-day, per-currency rollup of transaction metrics, kept up to date by the write path."""
+    __tablename__ = "daily_transaction_metrics"
+    day = Column(Date, primary_key=True)
+    currency = Column(String, primary_key=True)
+    transactions_count = Column(Integer, nullable=False, default=0)
+    not_rollbacked_transactions_count = Column(Integer, nullable=False, default=0)
+    not_rollbacked_deposit_amount = Column(Numeric(precision=30, scale=8), nullable=False, default=0)
+    not_rollbacked_withdraw_amount = Column(Numeric(precision=30, scale=8), nullable=False, default=0)
+    # USD totals converted with the rate in effect at each transaction's `created` time.
+    not_rollbacked_deposit_amount_usd = Column(Numeric(precision=40, scale=12), nullable=False, default=0)
+    not_rollbacked_withdraw_amount_usd = Column(Numeric(precision=40, scale=12), nullable=False, default=0)
+    updated = Column(DateTime(timezone=True), nullable=False)
+
+
+class DailyRegistrationMetrics(Base):  # type: ignore[misc, valid-type]
+    """Users registered per day, grouped by the number of days until their first deposit."""
+    __tablename__ = "daily_registration_metrics"
+    day = Column(Date, primary_key=True)
+    deposit_lag = Column(Integer, primary_key=True)
+    deposit_users_count = Column(Integer, nullable=False, default=0)
+    not_rollbacked_deposit_users_count = Column(Integer, nullable=False, default=0)
+    updated = Column(DateTime(timezone=True), nullable=False)
+
+
+class AnalysisJob(Base):  # type: ignore[misc, valid-type]
+    """Analysis computed in the background by a Celery worker, with its progress and result."""
+    __tablename__ = "analysis_job"
+    id = Column(Integer, primary_key=True)
+    status = Column(Enum(AnalysisJobStatusEnum), nullable=False, default=AnalysisJobStatusEnum.PENDING)
+    granularity = Column(Enum(AnalyticsGranularityEnum), nullable=False)
+    periods = Column(Integer, nullable=False)
+    end_date = Column(Date, nullable=False)
+    completed_periods = Column(Integer, nullable=False, default=0)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    created = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    started = Column(DateTime(timezone=True), nullable=True)
+    finished = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_analysis_job_granularity_periods_finished", "granularity", "periods", "finished"),
+        Index(
+            "analysis_job_active_unique",
+            "granularity",
+            "periods",
+            "end_date",
+            unique=True,
+            postgresql_where=text("status IN ('PENDING', 'RUNNING')"),
+        ),
+    )
@@ -0,0 +1,64 @@
+"""Connection pool that records how long checkouts wait for a connection."""
+
+import time
+import typing
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+# Weight of the newest sample in the moving average of checkout wait times.
+RECENT_WAIT_WEIGHT = 0.1
+
+
+class PoolWaitStats:
+    """Checkout wait time counters of one pool."""
+
+    def __init__(self) -> None:
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.recent_wait_seconds = 0.0
+
+    def record(self, wait: float) -> None:
+        self.checkouts += 1
+        self.total_wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        self.recent_wait_seconds += RECENT_WAIT_WEIGHT * (wait - self.recent_wait_seconds)
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """`AsyncAdaptedQueuePool` keeping `PoolWaitStats` for its checkouts."""
+
+    def __init__(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        self.wait_stats.waiting += 1
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.timeouts += 1
+            raise
+        finally:
+            self.wait_stats.waiting -= 1
+            self.wait_stats.record(time.perf_counter() - started)
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        """Live pool usage and checkout wait times."""
+        stats = self.wait_stats
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "waiting": stats.waiting,
+            "checkouts": stats.checkouts,
+            "timeouts": stats.timeouts,
+            "average_wait_ms": 1000 * stats.total_wait_seconds / stats.checkouts if stats.checkouts else 0.0,
+            "recent_wait_ms": 1000 * stats.recent_wait_seconds,
+            "max_wait_ms": 1000 * stats.max_wait_seconds,
+        }
@@ -0,0 +1,77 @@
+"""Routing of read-only sessions to streaming replicas."""
+
+import asyncio
+import itertools
+import time
+import typing
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+
+class ReplicaRouter:
+    """Hands out read-only sessions round-robin over the healthy replicas, falling back to the primary.
+
+    A replica that fails to connect, or whose connection is lost mid-query, is skipped for
+    `retry_seconds`. Without replicas every session comes from the primary.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker[AsyncSession],
+        engines: typing.Sequence[AsyncEngine],
+        retry_seconds: float,
+    ) -> None:
+        self.primary = primary
+        self.engines = list(engines)
+        self.retry_seconds = retry_seconds
+        self._session_makers = [async_sessionmaker(engine, expire_on_commit=False) for engine in self.engines]
+        self._unhealthy_until = [0.0] * len(self.engines)
+        self._next = itertools.count()
+        self.replica_sessions = 0
+        self.primary_fallbacks = 0
+        for index, engine in enumerate(self.engines):
+            event.listen(engine.sync_engine, "handle_error", self._on_error(index))
+
+    def _on_error(self, index: int) -> typing.Callable[[typing.Any], None]:
+        def handle_error(context: typing.Any) -> None:
+            if context.is_disconnect:
+                self.mark_unhealthy(index)
+
+        return handle_error
+
+    def mark_unhealthy(self, index: int) -> None:
+        self._unhealthy_until[index] = time.monotonic() + self.retry_seconds
+
+    def _healthy(self) -> typing.List[int]:
+        if not self.engines:
+            return []
+        now = time.monotonic()
+        start = next(self._next) % len(self.engines)
+        order = self._unhealthy_until[start:] + self._unhealthy_until[:start]
+        return [(start + i) % len(self.engines) for i, until in enumerate(order) if until <= now]
+
+    async def session(self) -> AsyncSession:
+        """A session on a healthy replica with its connection checked out, or a primary session."""
+        for index in self._healthy():
+            session = self._session_makers[index]()
+            try:
+                await session.connection()
+            except (exc.DBAPIError, OSError, asyncio.TimeoutError):
+                await session.close()
+                self.mark_unhealthy(index)
+                continue
+            self.replica_sessions += 1
+            return session
+        if self.engines:
+            self.primary_fallbacks += 1
+        return self.primary()
+
+    def statistics(self) -> typing.Dict[str, typing.Any]:
+        now = time.monotonic()
+        return {
+            "replicas": len(self.engines),
+            "healthy": sum(until <= now for until in self._unhealthy_until),
+            "replica_sessions": self.replica_sessions,
+            "primary_fallbacks": self.primary_fallbacks,
+        }
@@ -1,20 +1,62 @@
+import asyncio
 import typing
 
 import uvicorn
-from db.db import create_db_and_tables
+from config.settings import settings
+from db.db import engine, prepare_database, read_router, warm_up_pool
+from db.pool import InstrumentedAsyncQueuePool
 from fastapi import FastAPI
+from middleware.admission import AdmissionControlMiddleware
+from middleware.metrics import MetricsMiddleware
+from middleware.query_budget import QueryBudgetMiddleware
+from middleware.read_your_writes import ReadYourWritesMiddleware
+from monitoring import metrics, query_budget
+from routers.analysis import router as analysis_router
+from routers.analytics import router as analytics_router
+from routers.system import router as system_router
 from routers.transactions import router as transactions_router
 from routers.users import router as users_router
+from services.analytics_index import analytics_index
+from services.pubsub import pubsub
 
 
 async def lifespan(app: FastAPI) -> typing.AsyncGenerator[None, None]:
-    await create_db_and_tables()
+    # The schema is migrated before the workers start (see server.py), not by every worker.
+    app.state.ready = False
+    await pubsub.start()
+    await warm_up_pool(engine, settings.db_pool_size)
+    async with await read_router.session() as session:
+        await analytics_index.load(session)
+    app.state.ready = True
     yield
+    app.state.ready = False
+    await pubsub.stop()
+    for replica_engine in read_router.engines:
+        await replica_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(users_router)
 app.include_router(transactions_router)
+app.include_router(analytics_router)
+app.include_router(analysis_router)
+app.include_router(system_router)
+
+if read_router.engines and settings.db_read_your_writes_seconds > 0:
+    app.add_middleware(ReadYourWritesMiddleware, pin_seconds=settings.db_read_your_writes_seconds)
+for instrumented_engine in [engine, *read_router.engines]:
+    if settings.query_budget_enabled:
+        query_budget.instrument_engine(instrumented_engine)
+    if settings.metrics_enabled:
+        metrics.instrument_engine(instrumented_engine)
+if settings.query_budget_enabled:
+    app.add_middleware(QueryBudgetMiddleware)
+if settings.admission_enabled:
+    app.add_middleware(AdmissionControlMiddleware, pool=typing.cast(InstrumentedAsyncQueuePool, engine.pool))
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
 
 
 if __name__ == "__main__":
+    # Development server; production runs `python server.py`.
+    asyncio.run(prepare_database())
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
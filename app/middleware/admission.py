@@ -0,0 +1,103 @@
+"""ASGI middleware shedding load when the database connection pool is saturated."""
+
+import re
+import typing
+
+from config.settings import settings
+from db.pool import InstrumentedAsyncQueuePool
+from monitoring.metrics import ADMISSION_DECISIONS
+from schemas.enums import RequestPriorityEnum
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# First match wins; other requests are NORMAL. CRITICAL requests (probes, metrics) are never shed.
+ROUTE_PRIORITIES: typing.Tuple[typing.Tuple[typing.Optional[str], typing.Pattern[str], RequestPriorityEnum], ...] = (
+    (None, re.compile(r"^/(system/.*|metrics)$"), RequestPriorityEnum.CRITICAL),
+    ("POST", re.compile(r"^/transactions/[^/]+/(deposit|withdraw)$"), RequestPriorityEnum.HIGH),
+    ("PATCH", re.compile(r"^/transactions/[^/]+/rollback/[^/]+$"), RequestPriorityEnum.HIGH),
+    ("POST", re.compile(r"^/transactions/batch$"), RequestPriorityEnum.HIGH),
+    ("GET", re.compile(r"^/users$"), RequestPriorityEnum.LOW),
+    ("GET", re.compile(r"^/transactions/analysis$"), RequestPriorityEnum.LOW),
+    ("GET", re.compile(r"^/analytics$"), RequestPriorityEnum.LOW),
+    ("POST", re.compile(r"^/analysis/jobs$"), RequestPriorityEnum.LOW),
+)
+
+
+def request_priority(method: str, path: str) -> RequestPriorityEnum:
+    for route_method, pattern, priority in ROUTE_PRIORITIES:
+        if (route_method is None or route_method == method) and pattern.match(path):
+            return priority
+    return RequestPriorityEnum.NORMAL
+
+
+class AdmissionStats:
+    """Admitted and shed request counters per priority."""
+
+    def __init__(self) -> None:
+        self.admitted: typing.Dict[str, int] = {priority.value: 0 for priority in RequestPriorityEnum}
+        self.shed: typing.Dict[str, int] = {priority.value: 0 for priority in RequestPriorityEnum}
+
+    def record(self, priority: RequestPriorityEnum, admitted: bool) -> None:
+        (self.admitted if admitted else self.shed)[priority.value] += 1
+        ADMISSION_DECISIONS.labels(priority.value, "admitted" if admitted else "shed").inc()
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        return {"admitted": dict(self.admitted), "shed": dict(self.shed)}
+
+
+admission_stats = AdmissionStats()
+
+
+class AdmissionControlMiddleware:
+    """Rejects requests with 503 and `Retry-After` while the pool cannot serve them in time.
+
+    Queueing on the pool until `pool_timeout` only makes clients retry on top of the waiting requests, so
+    once the queue or the recent wait grows past the limits of a request's priority it is refused at once.
+    The wait average only counts while requests are actually waiting, so shedding stops as soon as the
+    queue drains.
+    """
+
+    def __init__(self, app: ASGIApp, pool: InstrumentedAsyncQueuePool) -> None:
+        self.app = app
+        self.pool = pool
+        capacity = settings.db_pool_size + max(settings.db_max_overflow, 0)
+        self.max_waiting = {
+            RequestPriorityEnum(priority): max(1.0, factor * capacity)
+            for priority, factor in settings.admission_queue_factors.items()
+        }
+        self.max_wait_seconds = {
+            RequestPriorityEnum(priority): limit / 1000 for priority, limit in settings.admission_max_wait_ms.items()
+        }
+
+    def admit(self, priority: RequestPriorityEnum) -> bool:
+        if priority == RequestPriorityEnum.CRITICAL:
+            return True
+        stats = self.pool.wait_stats
+        if stats.waiting >= self.max_waiting.get(priority, float("inf")):
+            return False
+        return not (stats.waiting and stats.recent_wait_seconds > self.max_wait_seconds.get(priority, float("inf")))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        priority = request_priority(scope["method"], scope["path"])
+        admitted = self.admit(priority)
+        admission_stats.record(priority, admitted)
+        if admitted:
+            await self.app(scope, receive, send)
+            return
+
+        body = b'{"detail":"Service overloaded, retry later"}'
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(settings.admission_retry_after_seconds).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
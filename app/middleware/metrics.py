@@ -0,0 +1,44 @@
+"""ASGI middleware recording the latency of every HTTP request per route."""
+
+import time
+import typing
+
+from monitoring.metrics import HTTP_REQUEST_DURATION
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Label of requests that matched no route, so unknown paths cannot blow up the label cardinality.
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    """Observes `http_request_duration_seconds` labelled by method, route template and status code.
+
+    A plain ASGI middleware rather than `BaseHTTPMiddleware`, which would add a task and a stream per
+    request. The route template (e.g. `/users/{user_id}`) is read from the scope after routing.
+    """
+
+    def __init__(self, app: ASGIApp, excluded_paths: typing.Collection[str] = ("/metrics",)) -> None:
+        self.app = app
+        self.excluded_paths = frozenset(excluded_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"], getattr(route, "path", UNMATCHED_ROUTE), str(status_code)
+            ).observe(time.perf_counter() - started)
@@ -0,0 +1,55 @@
+"""ASGI middleware reporting the statements and database time of every request."""
+
+import logging
+import typing
+
+from config.settings import settings
+from monitoring.query_budget import track_queries
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """Adds a `Server-Timing: db;...` header and logs requests over the query budgets in settings.
+
+    Requests executing the same statement shape `query_budget_repeated_statements` times or more are
+    logged as likely N+1 patterns even when they stay within the budgets.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", f'db;dur={1000 * stats.db_seconds:.2f};desc="{stats.count} queries"')
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        problems: typing.List[str] = []
+        if stats.count > settings.query_budget_max_queries:
+            problems.append(f"{stats.count} statements > {settings.query_budget_max_queries}")
+        if 1000 * stats.db_seconds > settings.query_budget_max_db_ms:
+            problems.append(f"{1000 * stats.db_seconds:.1f} ms in the database > {settings.query_budget_max_db_ms} ms")
+        repeated = stats.repeated(settings.query_budget_repeated_statements)
+        if repeated:
+            problems.append(f"likely N+1: {len(repeated)} statement shape(s) repeated")
+        if problems:
+            route = scope.get("route")
+            logger.warning(
+                "Query budget exceeded by %s %s (%s): %s",
+                scope["method"],
+                getattr(route, "path", scope["path"]),
+                "; ".join(problems),
+                stats.describe(settings.query_budget_repeated_statements),
+            )
@@ -0,0 +1,36 @@
+"""ASGI middleware pinning clients to the primary database for a while after they write."""
+
+import time
+
+from db.db import PRIMARY_PIN_COOKIE
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+class ReadYourWritesMiddleware:
+    """Sets `PRIMARY_PIN_COOKIE` on successful non-read requests.
+
+    Replicas lag behind the primary, so a client reading right after its own write could otherwise miss it.
+    """
+
+    def __init__(self, app: ASGIApp, pin_seconds: float) -> None:
+        self.app = app
+        self.pin_seconds = pin_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.pin_seconds
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie",
+                    f"{PRIMARY_PIN_COOKIE}={until:.3f}; Max-Age={int(self.pin_seconds) + 1}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
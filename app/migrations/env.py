@@ -0,0 +1,66 @@
+import asyncio
+import typing
+from logging.config import fileConfig
+
+from alembic import context
+from config.settings import settings
+from db.models import Base
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def include_name(name: typing.Optional[str], type_: str, parent_names: typing.Any) -> bool:
+    # Monthly partitions of `transaction` are managed by services/partitions.py, not by the models, and
+    # the Celery result backend creates its own tables.
+    return not (type_ == "table" and name is not None and name.startswith(("transaction_", "celery_")))
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=settings.database_url,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online() -> None:
+    engine = create_async_engine(settings.database_url, poolclass=NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif (connectable := config.attributes.get("connection")) is not None:
+    # A synchronous engine or connection passed in by the caller, e.g. by pytest-alembic.
+    if isinstance(connectable, Connection):
+        do_run_migrations(connectable)
+    else:
+        with connectable.connect() as connection:
+            do_run_migrations(connection)
+else:
+    asyncio.run(run_migrations_online())
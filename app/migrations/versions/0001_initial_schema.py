@@ -0,0 +1,124 @@
+"""Initial schema
+
+Creates the tables previously created by `metadata.create_all`. Databases that were already set up that
+way are adopted as is: tables that exist are left untouched.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    user_status = postgresql.ENUM("ACTIVE", "BLOCKED", name="userstatusenum", create_type=False)
+    transaction_status = postgresql.ENUM("PROCESSED", "ROLLBACKED", name="transactionstatusenum", create_type=False)
+    transaction_type = postgresql.ENUM("DEPOSIT", "WITHDRAW", name="transactiontypeenum", create_type=False)
+    for enum in (user_status, transaction_status, transaction_type):
+        enum.create(op.get_bind(), checkfirst=True)
+
+    if "user" not in existing:
+        op.create_table(
+            "user",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False, unique=True),
+            sa.Column("status", user_status, nullable=False),
+            sa.Column("created", sa.DateTime(timezone=True), nullable=False),
+        )
+    if "user_balance" not in existing:
+        op.create_table(
+            "user_balance",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id"), nullable=False),
+            sa.Column("currency", sa.String(), nullable=False),
+            sa.Column("amount", sa.Numeric(precision=20, scale=8), nullable=False),
+            sa.Column("created", sa.DateTime(timezone=True), nullable=False),
+        )
+    if "transaction" not in existing:
+        op.create_table(
+            "transaction",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("currency", sa.String(), nullable=False),
+            sa.Column("amount", sa.Numeric(precision=20, scale=8), nullable=False),
+            sa.Column("status", transaction_status, nullable=False),
+            sa.Column("type", transaction_type, nullable=False),
+            sa.Column("created", sa.DateTime(timezone=True), nullable=False),
+        )
+    if "exchange_rate" not in existing:
+        op.create_table(
+            "exchange_rate",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("currency", sa.String(), nullable=False),
+            sa.Column("rate_to_usd", sa.Numeric(precision=30, scale=12), nullable=False),
+            sa.Column("valid_from", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("valid_to", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("updated", sa.DateTime(timezone=True), nullable=False),
+        )
+        op.create_index("ix_exchange_rate_currency_valid_from", "exchange_rate", ["currency", "valid_from"])
+    if "daily_transaction_metrics" not in existing:
+        op.create_table(
+            "daily_transaction_metrics",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("currency", sa.String(), primary_key=True),
+            sa.Column("transactions_count", sa.Integer(), nullable=False),
+            sa.Column("not_rollbacked_transactions_count", sa.Integer(), nullable=False),
+            sa.Column("not_rollbacked_deposit_amount", sa.Numeric(precision=30, scale=8), nullable=False),
+            sa.Column("not_rollbacked_withdraw_amount", sa.Numeric(precision=30, scale=8), nullable=False),
+            sa.Column("not_rollbacked_deposit_amount_usd", sa.Numeric(precision=40, scale=12), nullable=False),
+            sa.Column("not_rollbacked_withdraw_amount_usd", sa.Numeric(precision=40, scale=12), nullable=False),
+            sa.Column("updated", sa.DateTime(timezone=True), nullable=False),
+        )
+    else:
+        # Rollups created before the USD columns existed; rerun the rollup backfill to fill them in.
+        columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("daily_transaction_metrics")}
+        for column in ("not_rollbacked_deposit_amount_usd", "not_rollbacked_withdraw_amount_usd"):
+            if column not in columns:
+                op.add_column(
+                    "daily_transaction_metrics",
+                    sa.Column(column, sa.Numeric(precision=40, scale=12), nullable=False, server_default="0"),
+                )
+    if "daily_registration_metrics" not in existing:
+        op.create_table(
+            "daily_registration_metrics",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("deposit_lag", sa.Integer(), primary_key=True),
+            sa.Column("deposit_users_count", sa.Integer(), nullable=False),
+            sa.Column("not_rollbacked_deposit_users_count", sa.Integer(), nullable=False),
+            sa.Column("updated", sa.DateTime(timezone=True), nullable=False),
+        )
+    if "analysis_cache" not in existing:
+        op.create_table(
+            "analysis_cache",
+            sa.Column("key", sa.String(), primary_key=True),
+            sa.Column("payload", sa.JSON(), nullable=False),
+            sa.Column("computed_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    for table in (
+        "analysis_cache",
+        "daily_registration_metrics",
+        "daily_transaction_metrics",
+        "exchange_rate",
+        "transaction",
+        "user_balance",
+        "user",
+    ):
+        op.drop_table(table)
+    for enum in ("transactiontypeenum", "transactionstatusenum", "userstatusenum"):
+        op.execute(f"DROP TYPE {enum}")
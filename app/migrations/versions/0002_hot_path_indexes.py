@@ -0,0 +1,73 @@
+"""Indexes for the hot query paths
+
+Built with CREATE INDEX CONCURRENTLY outside of a transaction so that writes to `transaction` and
+`user_balance` are not blocked while they build. The unique balance index is then attached as the
+`user_balance_user_currency_unique` constraint, which only takes a brief lock.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ("ix_transaction_user_id_created", 'CREATE INDEX CONCURRENTLY ix_transaction_user_id_created ON "transaction" (user_id, created)'),
+    # Keyset pagination of GET /transactions without a user filter, and counts over all statuses.
+    ("ix_transaction_created_id", 'CREATE INDEX CONCURRENTLY ix_transaction_created_id ON "transaction" (created, id)'),
+    (
+        "ix_transaction_created_not_rollbacked",
+        "CREATE INDEX CONCURRENTLY ix_transaction_created_not_rollbacked ON \"transaction\" (created) WHERE status <> 'ROLLBACKED'",
+    ),
+    ("ix_user_created", 'CREATE INDEX CONCURRENTLY ix_user_created ON "user" (created)'),
+    (
+        "user_balance_user_currency_unique",
+        "CREATE UNIQUE INDEX CONCURRENTLY user_balance_user_currency_unique ON user_balance (user_id, currency)",
+    ),
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    duplicates = bind.execute(
+        sa.text("SELECT user_id, currency FROM user_balance GROUP BY user_id, currency HAVING count(*) > 1 LIMIT 5")
+    ).all()
+    if duplicates:
+        raise RuntimeError(f"user_balance has duplicate (user_id, currency) rows, merge them before upgrading: {duplicates}")
+
+    with op.get_context().autocommit_block():
+        for name, create in INDEXES:
+            # A failed concurrent build leaves an invalid index behind; drop it so the build can be retried.
+            valid = bind.execute(
+                sa.text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"),
+                {"name": name},
+            ).scalar()
+            if valid:
+                continue
+            if valid is not None:
+                op.execute(f"DROP INDEX CONCURRENTLY {name}")
+            op.execute(create)
+
+    has_constraint = bind.execute(
+        sa.text("SELECT 1 FROM pg_constraint WHERE conname = 'user_balance_user_currency_unique'")
+    ).scalar()
+    if not has_constraint:
+        op.execute(
+            "ALTER TABLE user_balance ADD CONSTRAINT user_balance_user_currency_unique "
+            "UNIQUE USING INDEX user_balance_user_currency_unique"
+        )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE user_balance DROP CONSTRAINT IF EXISTS user_balance_user_currency_unique")
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
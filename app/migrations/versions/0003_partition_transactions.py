@@ -0,0 +1,104 @@
+"""Partition transaction by month
+
+Rebuilds `transaction` as a table partitioned by range of `created`, one partition per UTC month plus a
+default partition catching rows outside of them. The primary key becomes (id, created) as Postgres
+requires the partition key in unique constraints; ids keep coming from the same sequence.
+
+Downtime: unlike 0002, this migration is not online. It holds an EXCLUSIVE lock on `transaction` while it
+copies every row and builds the indexes, so deposits, withdrawals and rollbacks wait (or time out) for the
+whole run; reads keep working until the old table is dropped. The indexes are built on the new table inside
+the same transaction, where CONCURRENTLY would not shorten the outage (and Postgres does not support it on
+partitioned tables anyway). Run it in a maintenance window sized for a full copy of the table.
+
+Partitions are created up to `transaction_partitions_ahead_months` ahead, with the same naming and bounds
+as services/partitions.py; later ones are created by the `maintain_transaction_partitions` task.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from config.settings import settings
+from services.partitions import add_months, month_start, partition_bounds, partition_name
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, user_id, currency, amount, status, type, created"
+
+INDEXES = (
+    'CREATE INDEX ix_transaction_user_id_created ON "transaction" (user_id, created)',
+    'CREATE INDEX ix_transaction_created_id ON "transaction" (created, id)',
+    "CREATE INDEX ix_transaction_created_not_rollbacked ON \"transaction\" (created) WHERE status <> 'ROLLBACKED'",
+)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    partitioned = bind.execute(sa.text("SELECT relkind = 'p' FROM pg_class WHERE oid = '\"transaction\"'::regclass")).scalar()
+    if partitioned:
+        return
+
+    op.execute('LOCK TABLE "transaction" IN EXCLUSIVE MODE')
+    op.execute(
+        "CREATE TABLE transaction_partitioned ("
+        "id integer NOT NULL, "
+        "user_id integer NOT NULL, "
+        "currency varchar NOT NULL, "
+        "amount numeric(20, 8) NOT NULL, "
+        "status transactionstatusenum NOT NULL, "
+        "type transactiontypeenum NOT NULL, "
+        "created timestamp with time zone NOT NULL"
+        ") PARTITION BY RANGE (created)"
+    )
+
+    first = bind.execute(sa.text('SELECT min(created) FROM "transaction"')).scalar()
+    current = month_start(datetime.now(timezone.utc).date())
+    month = min(month_start(first.astimezone(timezone.utc).date()), current) if first else current
+    while month <= add_months(current, settings.transaction_partitions_ahead_months):
+        lower, upper = partition_bounds(month)
+        op.execute(f"CREATE TABLE {partition_name(month)} PARTITION OF transaction_partitioned FOR VALUES FROM ({lower}) TO ({upper})")
+        month = add_months(month, 1)
+    op.execute("CREATE TABLE transaction_default PARTITION OF transaction_partitioned DEFAULT")
+
+    op.execute(f'INSERT INTO transaction_partitioned ({COLUMNS}) SELECT {COLUMNS} FROM "transaction"')
+    op.execute("ALTER SEQUENCE transaction_id_seq OWNED BY NONE")
+    op.execute('DROP TABLE "transaction"')
+    op.execute('ALTER TABLE transaction_partitioned RENAME TO "transaction"')
+    op.execute("ALTER TABLE \"transaction\" ALTER COLUMN id SET DEFAULT nextval('transaction_id_seq')")
+    op.execute('ALTER SEQUENCE transaction_id_seq OWNED BY "transaction".id')
+    op.execute('ALTER TABLE "transaction" ADD CONSTRAINT transaction_pkey PRIMARY KEY (id, created)')
+    for create in INDEXES:
+        op.execute(create)
+    op.execute('ANALYZE "transaction"')
+
+
+def downgrade() -> None:
+    op.execute('LOCK TABLE "transaction" IN EXCLUSIVE MODE')
+    op.execute(
+        "CREATE TABLE transaction_unpartitioned ("
+        "id integer NOT NULL, "
+        "user_id integer NOT NULL, "
+        "currency varchar NOT NULL, "
+        "amount numeric(20, 8) NOT NULL, "
+        "status transactionstatusenum NOT NULL, "
+        "type transactiontypeenum NOT NULL, "
+        "created timestamp with time zone NOT NULL"
+        ")"
+    )
+    op.execute(f'INSERT INTO transaction_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM "transaction"')
+    op.execute("ALTER SEQUENCE transaction_id_seq OWNED BY NONE")
+    op.execute('DROP TABLE "transaction"')
+    op.execute('ALTER TABLE transaction_unpartitioned RENAME TO "transaction"')
+    op.execute("ALTER TABLE \"transaction\" ALTER COLUMN id SET DEFAULT nextval('transaction_id_seq')")
+    op.execute('ALTER SEQUENCE transaction_id_seq OWNED BY "transaction".id')
+    op.execute('ALTER TABLE "transaction" ADD CONSTRAINT transaction_pkey PRIMARY KEY (id)')
+    for create in INDEXES:
+        op.execute(create)
@@ -0,0 +1,41 @@
+"""Track registration deposit lags up to 31 days
+
+The registration rollup buckets users by the days until their first deposit, up to a "later or never"
+bucket. Monthly buckets of GET /analytics need lags up to 30 days, so the rollup is rebuilt with
+`REGISTRATION_LAG_DAYS` (31) as the last bucket (it was 7), by the same query as the rollup backfill.
+The rollup tables are locked against the write path while it rebuilds.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from services.metrics_rollup import REGISTRATION_LAG_DAYS, REGISTRATION_METRICS, MetricsRollupService
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREVIOUS_REGISTRATION_LAG_DAYS = 7
+
+
+def rebuild_registrations(lag_days: int) -> None:
+    op.execute("LOCK TABLE daily_transaction_metrics, daily_registration_metrics IN SHARE ROW EXCLUSIVE MODE")
+    op.execute("DELETE FROM daily_registration_metrics")
+    registrations = sa.table("daily_registration_metrics", *(sa.column(name) for name in REGISTRATION_METRICS))
+    op.execute(
+        sa.insert(registrations).from_select(REGISTRATION_METRICS, MetricsRollupService.registration_rollup_source(lag_days))
+    )
+
+
+def upgrade() -> None:
+    rebuild_registrations(REGISTRATION_LAG_DAYS)
+
+
+def downgrade() -> None:
+    rebuild_registrations(PREVIOUS_REGISTRATION_LAG_DAYS)
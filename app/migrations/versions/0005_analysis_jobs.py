@@ -0,0 +1,57 @@
+"""Analysis jobs
+
+Stores the analyses computed in the background by the `run_analysis_job` task, with their progress
+and result, so that requests never compute them inline.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    job_status = postgresql.ENUM("PENDING", "RUNNING", "SUCCESS", "FAILED", name="analysisjobstatusenum", create_type=False)
+    granularity = postgresql.ENUM("DAY", "WEEK", "MONTH", name="analyticsgranularityenum", create_type=False)
+    for enum in (job_status, granularity):
+        enum.create(op.get_bind(), checkfirst=True)
+
+    op.create_table(
+        "analysis_job",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("status", job_status, nullable=False),
+        sa.Column("granularity", granularity, nullable=False),
+        sa.Column("periods", sa.Integer(), nullable=False),
+        sa.Column("end_date", sa.Date(), nullable=False),
+        sa.Column("completed_periods", sa.Integer(), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("started", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_analysis_job_granularity_periods_finished", "analysis_job", ["granularity", "periods", "finished"])
+    # At most one pending or running job per analysis, so concurrent requests share it.
+    op.create_index(
+        "analysis_job_active_unique",
+        "analysis_job",
+        ["granularity", "periods", "end_date"],
+        unique=True,
+        postgresql_where=sa.text("status IN ('PENDING', 'RUNNING')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("analysis_job")
+    for enum in ("analyticsgranularityenum", "analysisjobstatusenum"):
+        op.execute(f"DROP TYPE {enum}")
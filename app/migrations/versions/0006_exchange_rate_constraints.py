@@ -0,0 +1,51 @@
+"""Constrain exchange rate intervals
+
+A currency gets at most one rate per `valid_from`, enforced by a unique constraint that replaces the
+plain (currency, valid_from) index, and its [valid_from, valid_to) intervals must not overlap, enforced by
+an exclusion constraint. The exclusion constraint needs the btree_gist extension (shipped with the
+standard Postgres images); on servers without it only the unique constraint is added.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+"""
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    duplicates = bind.execute(
+        sa.text("SELECT currency, valid_from FROM exchange_rate GROUP BY currency, valid_from HAVING count(*) > 1 LIMIT 5")
+    ).all()
+    if duplicates:
+        raise RuntimeError(f"exchange_rate has duplicate (currency, valid_from) rows, merge them before upgrading: {duplicates}")
+
+    op.drop_index("ix_exchange_rate_currency_valid_from", table_name="exchange_rate")
+    op.create_unique_constraint("exchange_rate_currency_valid_from_unique", "exchange_rate", ["currency", "valid_from"])
+
+    if bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")).scalar() is None:
+        logger.warning("btree_gist is not available, exchange_rate intervals are not checked for overlaps")
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute(
+        "ALTER TABLE exchange_rate ADD CONSTRAINT exchange_rate_no_overlap "
+        "EXCLUDE USING gist (currency WITH =, tstzrange(valid_from, valid_to) WITH &&)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE exchange_rate DROP CONSTRAINT IF EXISTS exchange_rate_no_overlap")
+    op.drop_constraint("exchange_rate_currency_valid_from_unique", "exchange_rate", type_="unique")
+    op.create_index("ix_exchange_rate_currency_valid_from", "exchange_rate", ["currency", "valid_from"])
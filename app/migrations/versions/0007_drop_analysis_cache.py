@@ -0,0 +1,33 @@
+"""Drop the analysis cache
+
+GET /transactions/analysis serves the results of analysis jobs, so the `analysis_cache` table, which
+held the analysis computed inside requests, is no longer read or written.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_table("analysis_cache")
+
+
+def downgrade() -> None:
+    op.create_table(
+        "analysis_cache",
+        sa.Column("key", sa.String(), primary_key=True),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("computed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
@@ -0,0 +1,157 @@
+"""Prometheus metrics of the API and the Celery workers.
+
+Set `PROMETHEUS_MULTIPROC_DIR` before start when several processes serve the same port (Celery prefork
+workers, multi-process servers); `render_latest` then aggregates the samples of every process.
+"""
+
+import functools
+import os
+import re
+import time
+import typing
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Buckets from 1 ms to 10 s; requests and queries of this service are mostly in the low milliseconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing SQL statements, by statement family.",
+    ["family"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL statements that raised an error, by statement family.", ["family"])
+ADMISSION_DECISIONS = Counter(
+    "http_admission_decisions_total", "Requests admitted or shed by admission control.", ["priority", "decision"]
+)
+ANALYSIS_TASK_DURATION = Histogram(
+    "celery_get_analysis_duration_seconds",
+    "Wall time of analysis jobs, from the start of their Celery chord to the merge.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
+ANALYSIS_RESULT_ROWS = Histogram(
+    "celery_get_analysis_result_rows",
+    "Rows (non-empty periods) in analysis job results.",
+    buckets=(0, 1, 4, 13, 26, 52, 104),
+)
+
+_TABLE = r'"?(\w+)"?'
+_STATEMENT_TABLE = {
+    "SELECT": re.compile(r"\bFROM\s+" + _TABLE, re.IGNORECASE),
+    "INSERT": re.compile(r"^\s*INSERT\s+INTO\s+" + _TABLE, re.IGNORECASE),
+    "UPDATE": re.compile(r"^\s*UPDATE\s+" + _TABLE, re.IGNORECASE),
+    "DELETE": re.compile(r"^\s*DELETE\s+FROM\s+" + _TABLE, re.IGNORECASE),
+}
+# A data-modifying statement in a CTE body or after the CTE list, as opposed to `ON CONFLICT DO UPDATE`.
+_WITH_DML = re.compile(r"[()]\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+" + _TABLE, re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=2048)
+def statement_family(statement: str) -> str:
+    """Low-cardinality label of a statement: its verb and first table, e.g. `select user_balance`.
+
+    SQLAlchemy renders the same string for every execution of a cached query, so this is parsed once
+    per distinct statement.
+    """
+    words = statement.split(None, 1)
+    if not words:
+        return "other"
+    verb = words[0].upper()
+    if verb == "WITH":
+        # Name CTE queries after the first table they write to, or the first table they read.
+        dml = _WITH_DML.search(statement)
+        if dml:
+            return f"{dml.group(1).split()[0].lower()} {dml.group(2).lower()}"
+        verb = "SELECT"
+    pattern = _STATEMENT_TABLE.get(verb)
+    if pattern is None:
+        return verb.lower() if verb.isalpha() else "other"
+    match = pattern.search(statement)
+    return f"{verb.lower()} {match.group(1).lower()}" if match else verb.lower()
+
+
+def _before_cursor_execute(conn: typing.Any, cursor: typing.Any, statement: str, *args: typing.Any) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: typing.Any, cursor: typing.Any, statement: str, *args: typing.Any) -> None:
+    started = conn.info["query_started"].pop()
+    DB_QUERY_DURATION.labels(statement_family(statement)).observe(time.perf_counter() - started)
+
+
+def _handle_error(context: typing.Any) -> None:
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+    DB_QUERY_ERRORS.labels(statement_family(context.statement or "")).inc()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Record the duration of every statement executed through `engine`."""
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class PoolCollector(Collector):
+    """Exposes `pool_statistics` of an engine as gauges, read at scrape time."""
+
+    GAUGES = {
+        "size": "Configured number of persistent connections.",
+        "checked_in": "Idle connections in the pool.",
+        "checked_out": "Connections in use.",
+        "overflow": "Connections open beyond the pool size.",
+        "waiting": "Checkouts currently waiting for a connection.",
+        "recent_wait_ms": "Moving average of checkout wait time in milliseconds.",
+    }
+
+    def __init__(self, statistics: typing.Callable[[], typing.Dict[str, typing.Any]]) -> None:
+        self.statistics = statistics
+
+    def collect(self) -> typing.Iterator[GaugeMetricFamily]:
+        stats = self.statistics()
+        for name, documentation in self.GAUGES.items():
+            yield GaugeMetricFamily(f"db_pool_{name}", documentation, value=stats[name])
+        yield GaugeMetricFamily("db_pool_checkout_timeouts", "Checkouts that timed out.", value=stats["timeouts"])
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render_latest(*collectors: Collector) -> typing.Tuple[bytes, str]:
+    """Exposition of all metrics plus `collectors` (per-process values such as pool gauges)."""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    output = generate_latest(registry)
+    if collectors:
+        extra = CollectorRegistry()
+        for collector in collectors:
+            extra.register(collector)
+        output += generate_latest(extra)
+    return output, CONTENT_TYPE_LATEST
@@ -0,0 +1,37 @@
+"""Pytest fixture asserting query budgets, enabled with `pytest_plugins = ["monitoring.pytest_plugin"]`.
+
+    async def test_post_user_query_budget(client, query_budget):
+        with query_budget(max_queries=3):
+            await client.post("/users", json={"email": "a@example.com"})
+
+The block fails when its requests execute more statements than allowed or, by default, repeat a
+statement shape as often as `query_budget_repeated_statements` (a likely N+1).
+"""
+
+import contextlib
+import typing
+
+import pytest
+from config.settings import settings
+from db.db import engine
+from monitoring.query_budget import QueryStats, instrument_engine, track_queries
+
+QueryBudget = typing.Callable[..., typing.ContextManager[QueryStats]]
+
+
+@pytest.fixture
+def query_budget() -> QueryBudget:
+    instrument_engine(engine)
+
+    @contextlib.contextmanager
+    def budget(
+        max_queries: int, max_repeated: typing.Optional[int] = None, allow_repeated: bool = False
+    ) -> typing.Iterator[QueryStats]:
+        threshold = max_repeated + 1 if max_repeated is not None else settings.query_budget_repeated_statements
+        with track_queries() as stats:
+            yield stats
+        assert stats.count <= max_queries, f"Query budget of {max_queries} exceeded: {stats.describe()}"
+        if not allow_repeated:
+            assert not stats.repeated(threshold), f"Repeated statements (likely N+1): {stats.describe(threshold)}"
+
+    return budget
@@ -0,0 +1,86 @@
+"""Per-request counting of SQL statements and database time, with detection of likely N+1 patterns.
+
+Statements are attributed to the innermost `track_queries()` block active in the current context and
+to every enclosing one, so a test can wrap several requests while each request keeps its own numbers.
+"""
+
+import contextlib
+import contextvars
+import time
+import typing
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class QueryStats:
+    """Statements executed and database time spent within one `track_queries()` block."""
+
+    def __init__(self, parent: typing.Optional["QueryStats"] = None) -> None:
+        self.parent = parent
+        self.count = 0
+        self.db_seconds = 0.0
+        # SQLAlchemy renders bound parameters as placeholders, so equal strings mean equal statement shapes.
+        self.shapes: typing.Counter[str] = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        stats: typing.Optional[QueryStats] = self
+        while stats is not None:
+            stats.count += 1
+            stats.db_seconds += seconds
+            stats.shapes[statement] += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int) -> typing.List[typing.Tuple[str, int]]:
+        """Statement shapes executed at least `threshold` times, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def describe(self, threshold: int = 2) -> str:
+        lines = [f"{self.count} statements, {1000 * self.db_seconds:.1f} ms in the database"]
+        lines.extend(f"  {count}x {' '.join(shape.split())[:200]}" for shape, count in self.repeated(threshold))
+        return "\n".join(lines)
+
+
+current_query_stats: contextvars.ContextVar[typing.Optional[QueryStats]] = contextvars.ContextVar(
+    "current_query_stats", default=None
+)
+
+
+@contextlib.contextmanager
+def track_queries() -> typing.Iterator[QueryStats]:
+    """Collect the statements executed in the current context (including its tasks started inside)."""
+    stats = QueryStats(parent=current_query_stats.get())
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+
+def _before_cursor_execute(conn: typing.Any, cursor: typing.Any, statement: str, *args: typing.Any) -> None:
+    if current_query_stats.get() is not None:
+        conn.info.setdefault("budget_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: typing.Any, cursor: typing.Any, statement: str, *args: typing.Any) -> None:
+    stats = current_query_stats.get()
+    started = conn.info.get("budget_started")
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+def _handle_error(context: typing.Any) -> None:
+    started = context.connection.info.get("budget_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Attribute the statements executed through `engine` to the active `track_queries()` block."""
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
@@ -0,0 +1,48 @@
+from config.settings import settings
+from db.db import SessionDep
+from db.models import AnalysisJob
+from fastapi import APIRouter, status
+from schemas.exceptions import BadRequestDataException
+from schemas.pydantic_models import RequestAnalysisJobModel, ResponseAnalysisJobModel
+from services.analysis_jobs import AnalysisJobService, job_progress
+
+router = APIRouter()
+
+
+def job_response(job: AnalysisJob) -> ResponseAnalysisJobModel:
+    return ResponseAnalysisJobModel(
+        id=job.id,
+        status=job.status,
+        granularity=job.granularity,
+        periods=job.periods,
+        end_date=job.end_date,
+        progress=job_progress(job),
+        created=job.created,
+        started=job.started,
+        finished=job.finished,
+        error=job.error,
+        result=job.result,
+    )
+
+
+@router.post("/analysis/jobs", response_model=ResponseAnalysisJobModel, status_code=status.HTTP_202_ACCEPTED)
+async def post_analysis_job(request: RequestAnalysisJobModel, session: SessionDep) -> ResponseAnalysisJobModel:
+    """Queue an analysis of `periods` days, weeks or months ending at `end_date` (today by default).
+
+    A pending or running job with the same parameters is returned instead of queueing another one.
+    """
+    if request.periods > settings.analytics_max_buckets:
+        raise BadRequestDataException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Analysis can span at most {settings.analytics_max_buckets} periods",
+        )
+
+    job = await AnalysisJobService.submit_job(session, request.granularity, request.periods, request.end_date)
+    return job_response(job)
+
+
+@router.get("/analysis/jobs/{job_id}", response_model=ResponseAnalysisJobModel, status_code=status.HTTP_200_OK)
+async def get_analysis_job(job_id: int, session: SessionDep) -> ResponseAnalysisJobModel:
+
+    job = await AnalysisJobService.select_job(session, job_id)
+    return job_response(job)
@@ -0,0 +1,39 @@
+from datetime import date
+
+from config.settings import settings
+from db.db import ReadSessionDep
+from fastapi import APIRouter, Query, status
+from schemas.enums import AnalyticsGranularityEnum
+from schemas.exceptions import BadRequestDataException
+from schemas.pydantic_models import AnalyticsBucketModel, ResponseAnalyticsModel
+from services.analytics_index import analytics_index, bucket_count
+
+router = APIRouter()
+
+
+@router.get("/analytics", response_model=ResponseAnalyticsModel, status_code=status.HTTP_200_OK)
+async def get_analytics(
+    session: ReadSessionDep,
+    dt_from: date = Query(alias="from"),
+    dt_to: date = Query(alias="to"),
+    granularity: AnalyticsGranularityEnum = AnalyticsGranularityEnum.WEEK,
+) -> ResponseAnalyticsModel:
+    """Get the transaction analysis metrics of every day, week or month in [from, to], oldest first.
+
+    Weeks end on `to`; the first bucket is cut at `from`, as are calendar months at both ends.
+    """
+    if dt_from > dt_to:
+        raise BadRequestDataException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="`from` is after `to`")
+    if bucket_count(dt_from, dt_to, granularity) > settings.analytics_max_buckets:
+        raise BadRequestDataException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Range spans more than {settings.analytics_max_buckets} buckets",
+        )
+
+    await analytics_index.ensure_fresh(session)
+    return ResponseAnalyticsModel(
+        from_date=dt_from,
+        to_date=dt_to,
+        granularity=granularity,
+        buckets=[AnalyticsBucketModel(**bucket) for bucket in analytics_index.query(dt_from, dt_to, granularity)],
+    )
@@ -0,0 +1,25 @@
+"""orjson-based response for list endpoints that return plain dicts built from database rows."""
+
+import typing
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+def _default(value: typing.Any) -> typing.Any:
+    # Pydantic serializes Decimal fields as strings; keep the same output on the fast path.
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+
+class FastJSONResponse(ORJSONResponse):
+    """JSON response encoded by orjson, producing the same output as the Pydantic response models.
+
+    Returning it from an endpoint skips FastAPI's `response_model` validation, so content must already
+    match the declared model.
+    """
+
+    def render(self, content: typing.Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
@@ -0,0 +1,56 @@
+import typing
+
+from db.db import engine, pool_statistics, read_router
+from fastapi import APIRouter, Request, Response, status
+from middleware.admission import admission_stats
+from monitoring.metrics import PoolCollector, render_latest
+from services.coalescer import deposit_coalescer
+from services.user_status_cache import user_status_cache
+
+router = APIRouter()
+
+
+@router.get("/system/ready", response_model=typing.Dict[str, typing.Any], status_code=status.HTTP_200_OK)
+async def get_readiness(request: Request, response: Response) -> typing.Dict[str, typing.Any]:
+    """Readiness probe: 200 once the worker started up and warmed its connection pool, 503 before."""
+    ready = getattr(request.app.state, "ready", False)
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": ready, "pool": pool_statistics(engine)}
+
+
+@router.get("/system/admission", response_model=typing.Dict[str, typing.Any], status_code=status.HTTP_200_OK)
+async def get_admission_stats() -> typing.Dict[str, typing.Any]:
+    """Requests admitted and shed by admission control since startup, per priority."""
+    return admission_stats.as_dict()
+
+
+@router.get("/system/coalescer", response_model=typing.Dict[str, typing.Any], status_code=status.HTTP_200_OK)
+async def get_coalescer_stats() -> typing.Dict[str, typing.Any]:
+    """Deposit coalescing batch sizes and wait times since startup."""
+    return deposit_coalescer.stats.as_dict()
+
+
+@router.get("/system/pool", response_model=typing.Dict[str, typing.Any], status_code=status.HTTP_200_OK)
+async def get_pool_stats() -> typing.Dict[str, typing.Any]:
+    """Live database connection pool usage and checkout wait times."""
+    return pool_statistics(engine)
+
+
+@router.get("/system/replicas", response_model=typing.Dict[str, typing.Any], status_code=status.HTTP_200_OK)
+async def get_replica_stats() -> typing.Dict[str, typing.Any]:
+    """Read replica health and how many read sessions they served or fell back to the primary."""
+    return read_router.statistics()
+
+
+@router.get("/system/user-status-cache", response_model=typing.Dict[str, typing.Any], status_code=status.HTTP_200_OK)
+async def get_user_status_cache_stats() -> typing.Dict[str, typing.Any]:
+    """User status cache size and hit/miss counters since startup."""
+    return user_status_cache.as_dict()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """Prometheus exposition of request, query, pool and task metrics."""
+    content, media_type = render_latest(PoolCollector(lambda: pool_statistics(engine)))
+    return Response(content=content, media_type=media_type)
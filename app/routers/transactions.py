@@ -1,66 +1,79 @@
-import json
+import logging
 import typing
+from datetime import datetime, timezone
 from decimal import Decimal
 
-from db.db import SessionDep
-from fastapi import APIRouter, status
-from schemas.enums import CurrencyEnum, TransactionStatusEnum, TransactionTypeEnum, UserStatusEnum
-from schemas.exceptions import (
-    CreateTransactionForBlockedUserException,
-    TransactionAlreadyRollbackedException,
-    UpdateTransactionForBlockedUserException,
+from config.settings import settings
+from db.db import ReadSessionDep, SessionDep
+from fastapi import APIRouter, Query, status
+from routers.responses import FastJSONResponse
+from schemas.enums import BatchModeEnum, CurrencyEnum, TransactionStatusEnum, TransactionTypeEnum
+from schemas.exceptions import AnalysisNotReadyException
+from schemas.pydantic_models import (
+    BatchTransactionResultModel,
+    RequestBatchTransactionsModel,
+    RequestTransactionModel,
+    ResponseBatchTransactionsModel,
+    TransactionModel,
+    TransactionPageModel,
 )
-from schemas.pydantic_models import RequestTransactionModel, TransactionModel
-from services.balance import BalanceService
-from services.celery.tasks import make_analysis
+from services.analysis_jobs import WEEKLY_ANALYSIS_GRANULARITY, WEEKLY_ANALYSIS_PERIODS, AnalysisJobService
+from services.coalescer import deposit_coalescer
+from services.ledger import LedgerService
 from services.transactions import TransactionService
-from services.users import UserService
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-@router.get("/transactions", response_model=typing.List[TransactionModel], status_code=status.HTTP_200_OK)
+@router.get("/transactions", response_model=TransactionPageModel, status_code=status.HTTP_200_OK)
 async def get_transactions(
-    session: SessionDep,
+    session: ReadSessionDep,
     user_id: typing.Optional[int] = None,
-) -> typing.List[TransactionModel]:
+    currency: typing.Optional[CurrencyEnum] = None,
+    transaction_status: typing.Optional[TransactionStatusEnum] = Query(None, alias="status"),
+    transaction_type: typing.Optional[TransactionTypeEnum] = Query(None, alias="type"),
+    created_from: typing.Optional[datetime] = None,
+    created_to: typing.Optional[datetime] = None,
+    cursor: typing.Optional[str] = None,
+    limit: int = Query(settings.transactions_page_size, ge=1, le=settings.transactions_max_page_size),
+) -> FastJSONResponse:
+    """Get one page of transactions, newest first, optionally filtered.
+
+    The response is `{"items": [...], "next_cursor": ...}` rather than a bare list of transactions, and
+    holds at most `limit` items (`transactions_page_size` by default). Pass `next_cursor` back as `cursor`,
+    with the same filters, to get the next page; it is null on the last page. A cursor used with other
+    filters than the ones it was issued for is rejected with 400.
+    """
+    filters: typing.Dict[str, typing.Any] = {
+        "user_id": user_id,
+        "currency": currency,
+        "status": transaction_status,
+        "type": transaction_type,
+        "created_from": created_from,
+        "created_to": created_to,
+    }
+    transactions = await TransactionService.select_transactions(
+        session,
+        **filters,
+        cursor=TransactionService.decode_cursor(cursor, filters) if cursor is not None else None,
+        limit=limit + 1,
+    )
 
-    transactions = await TransactionService.select_transactions(session, user_id)
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = TransactionService.encode_cursor(transactions[-1], filters)
 
-    results = []
-    for t in transactions:
-        result = TransactionModel(
-            **{
-                "id": t.id,
-                "user_id": t.user_id,
-                "currency": CurrencyEnum(t.currency),
-                "amount": t.amount,
-                "status": TransactionStatusEnum(t.status),
-                "type": TransactionTypeEnum(t.type),
-                "created": t.created
-            }
-        )
-        results.append(result)
-    return results
+    # Rows come straight from the database with valid values, so build the payload directly instead of
+    # validating a TransactionModel per row and then the whole page again.
+    return FastJSONResponse({"items": [t._asdict() for t in transactions], "next_cursor": next_cursor})
 
 
 @router.post("/transactions/{user_id}/withdraw", response_model=TransactionModel, status_code=status.HTTP_200_OK)
 async def post_withdraw_transaction(user_id: int, transaction: RequestTransactionModel, session: SessionDep):
-    user = await UserService.select_user(session, user_id)
-
-    if user.status != UserStatusEnum.ACTIVE:
-        raise CreateTransactionForBlockedUserException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{user_id}` is blocked"
-        )
-
-    await BalanceService.subtract_balance(
-        session=session,
-        user_id=user_id,
-        currency=transaction.currency,
-        amount=Decimal(transaction.amount),
-    )
-
-    new_transaction = await TransactionService.create_transaction(session, user_id, transaction.currency, float(transaction.amount), type=TransactionTypeEnum.WITHDRAW)
+    new_transaction = await LedgerService.withdraw(session, user_id, transaction.currency, Decimal(transaction.amount))
 
     return TransactionModel(
         id=new_transaction.id,
@@ -75,22 +88,10 @@ async def post_withdraw_transaction(user_id: int, transaction: RequestTransactio
 
 @router.post("/transactions/{user_id}/deposit", response_model=TransactionModel, status_code=status.HTTP_200_OK)
 async def post_deposit_transaction(user_id: int, transaction: RequestTransactionModel, session: SessionDep):
-    user = await UserService.select_user(session, user_id)
-
-    if user.status != UserStatusEnum.ACTIVE:
-        raise CreateTransactionForBlockedUserException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{user_id}` is blocked"
-        )
-
-    await BalanceService.add_balance(session, user_id, transaction.currency, Decimal(transaction.amount))
-
-    new_transaction = await TransactionService.create_transaction(
-        session=session,
-        user_id=user_id,
-        currency=transaction.currency,
-        amount=float(transaction.amount),
-        type=TransactionTypeEnum.DEPOSIT
-    )
+    if settings.deposit_coalescing_enabled:
+        new_transaction = await deposit_coalescer.deposit(user_id, transaction.currency, Decimal(transaction.amount))
+    else:
+        new_transaction = await LedgerService.deposit(session, user_id, transaction.currency, Decimal(transaction.amount))
 
     return TransactionModel(
         id=new_transaction.id,
@@ -105,38 +106,12 @@ async def post_deposit_transaction(user_id: int, transaction: RequestTransaction
 
 @router.patch("/transactions/{user_id}/rollback/{transaction_id}", response_model=TransactionModel)
 async def patch_rollback_transaction(user_id: int, transaction_id: int, session: SessionDep):
+    """Rollback a transaction of the user, reverting its change to the user's balance.
 
-    db_user = await UserService.select_user(session, user_id)
-
-    if db_user.status == UserStatusEnum.BLOCKED:
-        raise UpdateTransactionForBlockedUserException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=f"User with id=`{user_id}` is blocked"
-        )
-
-    db_transaction = await TransactionService.select_transaction(session, transaction_id)
-
-    if db_transaction.status == TransactionStatusEnum.ROLLBACKED:
-        raise TransactionAlreadyRollbackedException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Transaction with id=`{transaction_id}` is already rollbacked"
-        )
-
-    if db_transaction.type == TransactionTypeEnum.WITHDRAW:
-        await BalanceService.add_balance(
-            session=session,
-            user_id=user_id,
-            currency=db_transaction.currency,
-            amount=Decimal(db_transaction.amount),
-        )
-    else:
-        await BalanceService.subtract_balance(
-            session=session,
-            user_id=user_id,
-            currency=db_transaction.currency,
-            amount=Decimal(db_transaction.amount),
-        )
-
-    transaction = await TransactionService.update_transaction(session, transaction_id, TransactionStatusEnum.ROLLBACKED)
+    A transaction of another user is rejected with 400: earlier versions applied the reversal to the
+    balance of the user in the path instead of the transaction's owner.
+    """
+    transaction = await LedgerService.rollback(session, user_id, transaction_id)
 
     return TransactionModel(
         id=transaction.id,
@@ -149,17 +124,53 @@ async def patch_rollback_transaction(user_id: int, transaction_id: int, session:
     )
 
 
+@router.post("/transactions/batch", response_model=ResponseBatchTransactionsModel, status_code=status.HTTP_200_OK)
+async def post_batch_transactions(batch: RequestBatchTransactionsModel, session: SessionDep) -> ResponseBatchTransactionsModel:
+    outcomes = await LedgerService.apply_batch(session, batch.items, atomic=batch.mode == BatchModeEnum.ATOMIC)
+
+    results = []
+    for index, (t, error) in enumerate(outcomes):
+        transaction = None
+        if t is not None:
+            transaction = TransactionModel(
+                id=t.id,
+                user_id=t.user_id,
+                currency=CurrencyEnum(t.currency),
+                amount=t.amount,
+                status=TransactionStatusEnum(t.status),
+                type=TransactionTypeEnum(t.type),
+                created=t.created
+            )
+        results.append(BatchTransactionResultModel(
+            index=index, applied=t is not None, transaction=transaction, error=error.detail if error is not None else None
+        ))
+
+    applied_count = sum(result.applied for result in results)
+    return ResponseBatchTransactionsModel(
+        applied_count=applied_count, rejected_count=len(results) - applied_count, results=results
+    )
+
+
 @router.get("/transactions/analysis", response_model=typing.List[typing.Dict[str, typing.Any]], status_code=status.HTTP_200_OK)
 async def get_transaction_analysis(session: SessionDep) -> typing.List[typing.Dict[str, typing.Any]]:
-    """Get transaction analysis for the last 52 weeks."""
-
-    try:
-        with open('analysis.json', 'r') as f:
-            results: typing.List[typing.Dict[str, typing.Any]] = json.load(f)
+    """Get transaction analysis for the last 52 weeks, as computed by the latest finished analysis job.
 
-    except FileNotFoundError:
-        await make_analysis(session)
-        with open('analysis.json', 'r') as f:
-            results = typing.cast(typing.List[typing.Dict[str, typing.Any]], json.load(f))
+    A new job is queued once that result is older than `analysis_job_refresh_seconds` or ends before today;
+    until the first job finishes, 503 is returned with a Retry-After header.
+    """
+    job = await AnalysisJobService.select_latest_finished_job(session, WEEKLY_ANALYSIS_GRANULARITY, WEEKLY_ANALYSIS_PERIODS)
+    now = datetime.now(timezone.utc)
+    if job is not None and job.end_date >= now.date() and (now - job.finished).total_seconds() < settings.analysis_job_refresh_seconds:
+        return typing.cast(typing.List[typing.Dict[str, typing.Any]], job.result)
 
-    return results
+    try:
+        await AnalysisJobService.submit_job(session, WEEKLY_ANALYSIS_GRANULARITY, WEEKLY_ANALYSIS_PERIODS)
+    except Exception:
+        logger.exception("Could not queue the weekly analysis job")
+    if job is not None:
+        return typing.cast(typing.List[typing.Dict[str, typing.Any]], job.result)
+    raise AnalysisNotReadyException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Analysis is being computed, retry later",
+        headers={"Retry-After": str(settings.analysis_job_retry_after_seconds)},
+    )
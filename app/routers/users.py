@@ -1,18 +1,21 @@
 import typing
 from datetime import datetime, timezone
 
-from db.db import SessionDep
+from db.db import ReadSessionDep, SessionDep
 from fastapi import APIRouter, status
-from schemas.enums import CurrencyEnum, UserStatusEnum
+from routers.responses import FastJSONResponse
+from schemas.enums import UserStatusEnum
 from schemas.exceptions import BadRequestDataException, UserAlreadyBlockedException
 from schemas.pydantic_models import (
+    RequestBulkUsersModel,
     RequestUserModel,
     RequestUserUpdateModel,
-    ResponseUserBalanceModel,
+    ResponseBulkUsersModel,
     ResponseUserModel,
+    ResponseUserNetWorthModel,
     UserModel,
 )
-from services.balance import BalanceService
+from services.exchange_rates import ExchangeRateService
 from services.users import UserService
 
 router = APIRouter()
@@ -20,26 +23,22 @@ router = APIRouter()
 
 @router.get("/users", response_model=typing.List[ResponseUserModel], status_code=status.HTTP_200_OK)
 async def get_users(
-    session: SessionDep,
+    session: ReadSessionDep,
     user_id: typing.Optional[int] = None,
     email: typing.Optional[str] = None,
     user_status: typing.Optional[str] = None,
-) -> typing.List[ResponseUserModel]:
+) -> FastJSONResponse:
 
-    users_with_balances = await UserService.select_users_with_balances(session, user_id, email, user_status)
-    results = []
-    for user in users_with_balances:
-        result = ResponseUserModel(
-            id=user.id, email=user.email, status=UserStatusEnum(user.status), created=user.created
-        )
-        balances_list = [
-            ResponseUserBalanceModel(currency=CurrencyEnum(b.currency), amount=float(b.amount))
-            for b in user.user_balance
-        ]
-        balances_list = sorted(balances_list, key=lambda x: x.amount if x.amount is not None else 0.0)
-        result.balances = balances_list
-        results.append(result)
-    return sorted(results, key=lambda x: x.created if x.created else datetime.min.replace(tzinfo=timezone.utc))
+    rows = await UserService.select_user_balance_rows(session, user_id, email, user_status)
+    # Build the payload directly from the rows, already sorted by user creation time and balance amount,
+    # instead of validating a model per user and balance.
+    results: typing.List[typing.Dict[str, typing.Any]] = []
+    for row in rows:
+        if not results or results[-1]["id"] != row.id:
+            results.append({"id": row.id, "email": row.email, "status": row.status, "created": row.created, "balances": []})
+        if row.currency is not None:
+            results[-1]["balances"].append({"currency": row.currency, "amount": float(row.amount)})
+    return FastJSONResponse(results)
 
 
 @router.post("/users", status_code=status.HTTP_200_OK)
@@ -47,13 +46,32 @@ async def post_user(user: RequestUserModel, session: SessionDep):
 
     new_user = await UserService.create_user(session, user)
 
-    for currency in CurrencyEnum:
-        await BalanceService.create_balance(session, new_user.id, currency)
-
     result = UserModel(id=new_user.id, email=new_user.email, status=UserStatusEnum(new_user.status), created=new_user.created)
     return result
 
 
+@router.post("/users/bulk", response_model=ResponseBulkUsersModel, status_code=status.HTTP_200_OK)
+async def post_users_bulk(users: RequestBulkUsersModel, session: SessionDep) -> ResponseBulkUsersModel:
+
+    created, existing = await UserService.create_users(session, users.emails)
+
+    return ResponseBulkUsersModel(
+        created=[UserModel(id=u.id, email=u.email, status=UserStatusEnum(u.status), created=u.created) for u in created],
+        existing=existing,
+    )
+
+
+@router.get("/users/{user_id}/net-worth", response_model=ResponseUserNetWorthModel, status_code=status.HTTP_200_OK)
+async def get_user_net_worth(
+    user_id: int, session: ReadSessionDep, at: typing.Optional[datetime] = None
+) -> ResponseUserNetWorthModel:
+    """Get the sum of user's balances in USD at the exchange rates in effect at `at` (now by default)."""
+
+    at = at or datetime.now(timezone.utc)
+    amount_usd = await ExchangeRateService.get_user_net_worth(session, user_id, at)
+    return ResponseUserNetWorthModel(user_id=user_id, at=at, amount_usd=amount_usd)
+
+
 @router.patch("/users/{user_id}", response_model=UserModel)
 async def patch_user(user_id: int, user: RequestUserUpdateModel, session: SessionDep):
     if user_id < 0:
@@ -34,3 +34,36 @@ class TransactionTypeEnum(StrEnum):
 
     DEPOSIT = "DEPOSIT"
     WITHDRAW = "WITHDRAW"
+
+
+class BatchModeEnum(StrEnum):
+    """Enumeration of batch transaction modes."""
+
+    ATOMIC = "ATOMIC"
+    BEST_EFFORT = "BEST_EFFORT"
+
+
+class RequestPriorityEnum(StrEnum):
+    """Enumeration of request priorities used by admission control."""
+
+    CRITICAL = "CRITICAL"
+    HIGH = "HIGH"
+    NORMAL = "NORMAL"
+    LOW = "LOW"
+
+
+class AnalyticsGranularityEnum(StrEnum):
+    """Enumeration of analytics bucket sizes."""
+
+    DAY = "DAY"
+    WEEK = "WEEK"
+    MONTH = "MONTH"
+
+
+class AnalysisJobStatusEnum(StrEnum):
+    """Enumeration of analysis job states."""
+
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCESS = "SUCCESS"
+    FAILED = "FAILED"
@@ -43,3 +43,19 @@ class UpdateTransactionForBlockedUserException(HTTPException):
 
 class TransactionAlreadyRollbackedException(HTTPException):
     """Exception raised when transaction is already rollbacked."""
+
+
+class InvalidCursorException(HTTPException):
+    """Exception raised when a pagination cursor cannot be decoded."""
+
+
+class TransactionBatchRolledBackException(HTTPException):
+    """Exception raised for batch items not applied because another item of an atomic batch failed."""
+
+
+class AnalysisJobNotExistsException(HTTPException):
+    """Exception raised when analysis job does not exist."""
+
+
+class AnalysisNotReadyException(HTTPException):
+    """Exception raised when no analysis has been computed yet."""
@@ -1,12 +1,20 @@
 """Pydantic models for request/response validation."""
 
 import typing
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 
 from fastapi import status
-from pydantic import BaseModel, EmailStr, field_validator
-from schemas.enums import CurrencyEnum, TransactionStatusEnum, TransactionTypeEnum, UserStatusEnum
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from schemas.enums import (
+    AnalysisJobStatusEnum,
+    AnalyticsGranularityEnum,
+    BatchModeEnum,
+    CurrencyEnum,
+    TransactionStatusEnum,
+    TransactionTypeEnum,
+    UserStatusEnum,
+)
 from schemas.exceptions import BadRequestDataException
 
 
@@ -16,6 +24,12 @@ class RequestUserModel(BaseModel):
     email: EmailStr
 
 
+class RequestBulkUsersModel(BaseModel):
+    """Model for bulk user creation request."""
+
+    emails: typing.List[EmailStr] = Field(max_length=100_000)
+
+
 class RequestUserUpdateModel(BaseModel):
     """Model for user update request."""
 
@@ -46,6 +60,21 @@ class UserModel(BaseModel):
     created: typing.Optional[datetime] = None
 
 
+class ResponseBulkUsersModel(BaseModel):
+    """Model for bulk user creation response."""
+
+    created: typing.List[UserModel]
+    existing: typing.List[str]
+
+
+class ResponseUserNetWorthModel(BaseModel):
+    """Model for user's balances valued in USD."""
+
+    user_id: int
+    at: datetime
+    amount_usd: Decimal
+
+
 class UserBalanceModel(BaseModel):
     """Model for user balance data."""
 
@@ -85,3 +114,87 @@ class TransactionModel(BaseModel):
     status: typing.Optional[TransactionStatusEnum] = None
     type: typing.Optional[TransactionTypeEnum] = None
     created: typing.Optional[datetime] = None
+
+
+class TransactionPageModel(BaseModel):
+    """Model for one keyset page of transactions."""
+
+    items: typing.List[TransactionModel]
+    next_cursor: typing.Optional[str] = None
+
+
+class RequestBatchTransactionItemModel(RequestTransactionModel):
+    """Model for one item of a batch transaction request."""
+    user_id: int
+    type: TransactionTypeEnum
+
+
+class RequestBatchTransactionsModel(BaseModel):
+    """Model for batch transaction request."""
+
+    mode: BatchModeEnum = BatchModeEnum.ATOMIC
+    items: typing.List[RequestBatchTransactionItemModel] = Field(max_length=10_000)
+
+
+class BatchTransactionResultModel(BaseModel):
+    """Model for the outcome of one batch item."""
+
+    index: int
+    applied: bool
+    transaction: typing.Optional[TransactionModel] = None
+    error: typing.Optional[str] = None
+
+
+class ResponseBatchTransactionsModel(BaseModel):
+    """Model for batch transaction response."""
+
+    applied_count: int
+    rejected_count: int
+    results: typing.List[BatchTransactionResultModel]
+
+
+class AnalyticsBucketModel(BaseModel):
+    """Model for the transaction metrics of one analytics bucket, both dates inclusive."""
+
+    start_date: date
+    end_date: date
+    registered_users_count: int
+    registered_and_deposit_users_count: int
+    registered_and_not_rollbacked_deposit_users_count: int
+    not_rollbacked_deposit_amount: float
+    not_rollbacked_withdraw_amount: float
+    transactions_count: int
+    not_rollbacked_transactions_count: int
+
+
+class ResponseAnalyticsModel(BaseModel):
+    """Model for analytics over a date range."""
+
+    from_date: date
+    to_date: date
+    granularity: AnalyticsGranularityEnum
+    buckets: typing.List[AnalyticsBucketModel]
+
+
+class RequestAnalysisJobModel(BaseModel):
+    """Model for analysis job creation request; the window is `periods` buckets ending at `end_date`."""
+
+    granularity: AnalyticsGranularityEnum = AnalyticsGranularityEnum.WEEK
+    periods: int = Field(52, ge=1)
+    end_date: typing.Optional[date] = None
+
+
+class ResponseAnalysisJobModel(BaseModel):
+    """Model for analysis job status; `result` is set once the job succeeded."""
+
+    id: int
+    status: AnalysisJobStatusEnum
+    granularity: AnalyticsGranularityEnum
+    periods: int
+    end_date: date
+    progress: float
+    created: datetime
+    started: typing.Optional[datetime] = None
+    finished: typing.Optional[datetime] = None
+    error: typing.Optional[str] = None
+    result: typing.Optional[typing.List[typing.Dict[str, typing.Any]]] = None
@@ -0,0 +1,83 @@
+"""Production server: a Gunicorn master supervising uvicorn workers running on uvloop with httptools.
+
+    python server.py            # migrate the database, then serve with SERVER_WORKERS workers
+    python server.py --migrate  # only migrate, e.g. from a deployment job
+
+The master migrates the schema once before forking, instead of every worker racing to do it in its
+lifespan. Workers are recycled after `server_max_requests` requests and stopped gracefully on SIGTERM;
+SIGHUP reloads them one by one. Readiness of a worker is reported by GET /system/ready.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import typing
+
+from config.settings import settings
+from db.db import prepare_database
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+
+class AppWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+
+def on_starting(server: typing.Any) -> None:
+    asyncio.run(prepare_database())
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Aggregate the metrics of all workers; must be set before they import prometheus_client.
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+
+def child_exit(server: typing.Any, worker: typing.Any) -> None:
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    def __init__(self, options: typing.Dict[str, typing.Any]) -> None:
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> typing.Any:
+        from main import app
+
+        return app
+
+
+def server_options() -> typing.Dict[str, typing.Any]:
+    return {
+        "bind": settings.server_bind,
+        "workers": settings.server_workers or multiprocessing.cpu_count(),
+        "worker_class": AppWorker,
+        "max_requests": settings.server_max_requests,
+        "max_requests_jitter": settings.server_max_requests_jitter,
+        "graceful_timeout": settings.server_graceful_timeout,
+        "timeout": settings.server_timeout,
+        "keepalive": settings.server_keepalive,
+        "on_starting": on_starting,
+        "child_exit": child_exit,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the API in production.")
+    parser.add_argument("--migrate", action="store_true", help="only migrate the database and exit")
+    args = parser.parse_args()
+
+    if args.migrate:
+        asyncio.run(prepare_database())
+        return
+    Server(server_options()).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Analysis jobs: analyses computed by Celery workers, tracked and stored in the `analysis_job` table."""
+
+import typing
+from datetime import date, datetime, timedelta, timezone
+
+from config.settings import settings
+from db.models import AnalysisJob
+from fastapi import status
+from schemas.enums import AnalysisJobStatusEnum, AnalyticsGranularityEnum
+from schemas.exceptions import AnalysisJobNotExistsException
+from services.analytics import AMOUNT_FIELDS, ANALYSIS_FIELDS
+from services.analytics_index import bucket_ranges
+from services.celery.celery import celery_app
+from services.partitions import add_months
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Parameters of the analysis served by GET /transactions/analysis.
+WEEKLY_ANALYSIS_GRANULARITY = AnalyticsGranularityEnum.WEEK
+WEEKLY_ANALYSIS_PERIODS = 52
+
+RUN_ANALYSIS_JOB_TASK = "services.celery.tasks.run_analysis_job"
+
+# At most one job per analysis is in these states at a time (see the analysis_job_active_unique index).
+ACTIVE_JOB_STATUSES = (AnalysisJobStatusEnum.PENDING, AnalysisJobStatusEnum.RUNNING)
+
+
+def analysis_buckets(
+    granularity: AnalyticsGranularityEnum, periods: int, end_date: date
+) -> typing.List[typing.Tuple[date, date]]:
+    """The `periods` buckets ending at `end_date`, oldest first; the last month is cut at `end_date`."""
+    if granularity == AnalyticsGranularityEnum.DAY:
+        start = end_date - timedelta(days=periods - 1)
+    elif granularity == AnalyticsGranularityEnum.WEEK:
+        start = end_date - timedelta(weeks=periods) + timedelta(days=1)
+    else:
+        start = add_months(end_date.replace(day=1), -(periods - 1))
+    return bucket_ranges(start, end_date, granularity)
+
+
+def build_analysis_results(buckets: typing.Sequence[typing.Dict[str, typing.Any]]) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Turn per-bucket metrics, oldest first, into the analysis payload: newest first, empty buckets skipped."""
+    results = []
+    for bucket in reversed(buckets):
+        if any(bucket[field] > 0 for field in ANALYSIS_FIELDS):
+            result: typing.Dict[str, typing.Any] = {"start_date": str(bucket["start_date"]), "end_date": str(bucket["end_date"])}
+            for field in ANALYSIS_FIELDS:
+                result[field] = float(bucket[field]) if field in AMOUNT_FIELDS else int(bucket[field])
+            results.append(result)
+    return results
+
+
+def job_progress(job: AnalysisJob) -> float:
+    if job.status == AnalysisJobStatusEnum.SUCCESS:
+        return 1.0
+    return float(job.completed_periods) / float(job.periods)
+
+
+class AnalysisJobService:
+
+    @staticmethod
+    async def create_job(
+        session: AsyncSession, granularity: AnalyticsGranularityEnum, periods: int, end_date: typing.Optional[date] = None
+    ) -> typing.Optional[AnalysisJob]:
+        """Create a pending job, or return None when one with the same parameters is already pending or running.
+
+        Active jobs created more than `analysis_job_timeout_seconds` ago are marked as failed first.
+        """
+        end_date = end_date or datetime.now(timezone.utc).date()
+        now = datetime.now(timezone.utc)
+        same_analysis = (
+            AnalysisJob.granularity == granularity,
+            AnalysisJob.periods == periods,
+            AnalysisJob.end_date == end_date,
+            AnalysisJob.status.in_(ACTIVE_JOB_STATUSES),
+        )
+        await session.execute(
+            update(AnalysisJob)
+            .where(*same_analysis, AnalysisJob.created < now - timedelta(seconds=settings.analysis_job_timeout_seconds))
+            .values(status=AnalysisJobStatusEnum.FAILED, error="Timed out", finished=now)
+        )
+        q = (
+            insert(AnalysisJob)
+            .values(
+                status=AnalysisJobStatusEnum.PENDING,
+                granularity=granularity,
+                periods=periods,
+                end_date=end_date,
+                completed_periods=0,
+                created=now,
+            )
+            .on_conflict_do_nothing(
+                index_elements=[AnalysisJob.granularity, AnalysisJob.periods, AnalysisJob.end_date],
+                index_where=AnalysisJob.status.in_(ACTIVE_JOB_STATUSES),
+            )
+            .returning(AnalysisJob)
+        )
+        job: typing.Optional[AnalysisJob] = (await session.execute(q)).scalar()
+        await session.commit()
+        return job
+
+    @staticmethod
+    async def select_active_job(
+        session: AsyncSession, granularity: AnalyticsGranularityEnum, periods: int, end_date: date
+    ) -> typing.Optional[AnalysisJob]:
+        q = select(AnalysisJob).where(
+            AnalysisJob.granularity == granularity,
+            AnalysisJob.periods == periods,
+            AnalysisJob.end_date == end_date,
+            AnalysisJob.status.in_(ACTIVE_JOB_STATUSES),
+        )
+        job: typing.Optional[AnalysisJob] = (await session.execute(q)).scalar_one_or_none()
+        return job
+
+    @staticmethod
+    def enqueue_job(job: AnalysisJob) -> None:
+        celery_app.send_task(RUN_ANALYSIS_JOB_TASK, args=[job.id])
+
+    @staticmethod
+    async def submit_job(
+        session: AsyncSession, granularity: AnalyticsGranularityEnum, periods: int, end_date: typing.Optional[date] = None
+    ) -> AnalysisJob:
+        """Create a job and queue it, or return the pending or running job with the same parameters."""
+        end_date = end_date or datetime.now(timezone.utc).date()
+        while True:
+            job = await AnalysisJobService.create_job(session, granularity, periods, end_date)
+            if job is not None:
+                break
+            # The active job may finish between the insert and this select; then create another one.
+            active = await AnalysisJobService.select_active_job(session, granularity, periods, end_date)
+            if active is not None:
+                return active
+
+        try:
+            AnalysisJobService.enqueue_job(job)
+        except Exception as e:
+            await AnalysisJobService.fail_job(session, typing.cast(int, job.id), f"Could not be queued: {e}")
+            raise
+        return job
+
+    @staticmethod
+    async def select_job(session: AsyncSession, job_id: int) -> AnalysisJob:
+        job = (await session.execute(select(AnalysisJob).where(AnalysisJob.id == job_id))).scalar_one_or_none()
+        if job is None:
+            raise AnalysisJobNotExistsException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Analysis job with id=`{job_id}` does not exist"
+            )
+        return job
+
+    @staticmethod
+    async def select_latest_finished_job(
+        session: AsyncSession, granularity: AnalyticsGranularityEnum, periods: int
+    ) -> typing.Optional[AnalysisJob]:
+        q = (
+            select(AnalysisJob)
+            .where(
+                AnalysisJob.granularity == granularity,
+                AnalysisJob.periods == periods,
+                AnalysisJob.status == AnalysisJobStatusEnum.SUCCESS,
+            )
+            .order_by(AnalysisJob.finished.desc())
+            .limit(1)
+        )
+        job: typing.Optional[AnalysisJob] = (await session.execute(q)).scalar()
+        return job
+
+    @staticmethod
+    async def fail_job(session: AsyncSession, job_id: int, error: str) -> None:
+        await session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id)
+            .values(status=AnalysisJobStatusEnum.FAILED, error=error, finished=datetime.now(timezone.utc))
+        )
+        await session.commit()
+
+    @staticmethod
+    async def start_job(session: AsyncSession, job_id: int) -> typing.Optional[typing.List[typing.Tuple[date, date]]]:
+        """Mark the job as running and return its buckets, oldest first, or None when it already succeeded."""
+        job = await AnalysisJobService.select_job(session, job_id)
+        if job.status == AnalysisJobStatusEnum.SUCCESS:
+            return None
+        job.status = AnalysisJobStatusEnum.RUNNING
+        job.started = datetime.now(timezone.utc)
+        job.completed_periods = 0
+        await session.commit()
+        return analysis_buckets(job.granularity, job.periods, job.end_date)
+
+    @staticmethod
+    async def record_progress(session: AsyncSession, job_id: int, periods: int) -> None:
+        await session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id)
+            .values(completed_periods=func.least(AnalysisJob.completed_periods + periods, AnalysisJob.periods))
+        )
+        await session.commit()
+
+    @staticmethod
+    async def finish_job(session: AsyncSession, job_id: int, results: typing.List[typing.Dict[str, typing.Any]]) -> AnalysisJob:
+        job = await AnalysisJobService.select_job(session, job_id)
+        job.status = AnalysisJobStatusEnum.SUCCESS
+        job.completed_periods = job.periods
+        job.result = results
+        job.finished = datetime.now(timezone.utc)
+        await session.commit()
+        return job
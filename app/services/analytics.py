@@ -0,0 +1,118 @@
+"""Single-pass aggregate queries for the weekly transaction analysis."""
+
+import typing
+from datetime import date, timedelta
+
+from db.models import ExchangeRate, Transaction, User
+from schemas.enums import TransactionStatusEnum
+from services.exchange_rates import ExchangeRateService
+from services.queries import utc_day, utc_day_range
+from sqlalchemy import Date, and_, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+ANALYSIS_FIELDS = (
+    "registered_users_count",
+    "registered_and_deposit_users_count",
+    "registered_and_not_rollbacked_deposit_users_count",
+    "not_rollbacked_deposit_amount",
+    "not_rollbacked_withdraw_amount",
+    "transactions_count",
+    "not_rollbacked_transactions_count",
+)
+
+AMOUNT_FIELDS = ("not_rollbacked_deposit_amount", "not_rollbacked_withdraw_amount")
+
+
+class AnalyticsService:
+
+    @staticmethod
+    async def get_weekly_analysis(session: AsyncSession, end_date: date, weeks: int = 52) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Compute the analysis metrics for `weeks` weeks ending at `end_date` in one grouped query.
+
+        Weeks are numbered backwards from `end_date`, week 0 covering `end_date - 6 days` to `end_date`.
+        Weeks where every metric is zero are skipped, as in the original per-week implementation.
+        """
+        dt_gt = end_date - timedelta(weeks=weeks) + timedelta(days=1)
+        end = literal(end_date, Date)
+        not_rollbacked = Transaction.status != TransactionStatusEnum.ROLLBACKED
+
+        transaction_week = (end - utc_day(Transaction.created)) // 7
+        transaction_in_range = utc_day_range(Transaction.created, dt_gt, end_date)
+        usd_amount = Transaction.amount * ExchangeRate.rate_to_usd
+
+        transactions = (
+            select(
+                transaction_week.label("week"),
+                func.count().label("transactions_count"),
+                func.count().filter(not_rollbacked).label("not_rollbacked_transactions_count"),
+                func.sum(usd_amount).filter(not_rollbacked & (Transaction.amount > 0)).label("not_rollbacked_deposit_amount"),
+                func.sum(usd_amount).filter(not_rollbacked & (Transaction.amount < 0)).label("not_rollbacked_withdraw_amount"),
+            )
+            .select_from(Transaction)
+            .outerjoin(ExchangeRate, ExchangeRateService.rate_in_effect(Transaction.currency, Transaction.created))
+            .where(transaction_in_range)
+            .group_by(transaction_week)
+            .cte("transactions")
+        )
+
+        user_week = (end - utc_day(User.created)) // 7
+        registered = (
+            select(User.id.label("user_id"), user_week.label("week"))
+            .where(utc_day_range(User.created, dt_gt, end_date))
+            .cte("registered")
+        )
+        deposits = (
+            select(
+                Transaction.user_id,
+                transaction_week.label("week"),
+                func.bool_or(not_rollbacked).label("not_rollbacked"),
+            )
+            .where(transaction_in_range & (Transaction.amount > 0))
+            .group_by(Transaction.user_id, transaction_week)
+            .cte("deposits")
+        )
+        registrations = (
+            select(
+                registered.c.week,
+                func.count().label("registered_users_count"),
+                func.count(deposits.c.user_id).label("registered_and_deposit_users_count"),
+                func.count().filter(deposits.c.not_rollbacked).label("registered_and_not_rollbacked_deposit_users_count"),
+            )
+            .select_from(
+                registered.outerjoin(
+                    deposits,
+                    and_(deposits.c.user_id == registered.c.user_id, deposits.c.week == registered.c.week),
+                )
+            )
+            .group_by(registered.c.week)
+            .cte("registrations")
+        )
+
+        q = select(
+            func.coalesce(transactions.c.week, registrations.c.week).label("week"),
+            *(func.coalesce(registrations.c[field], 0).label(field) for field in ANALYSIS_FIELDS[:3]),
+            *(func.coalesce(transactions.c[field], 0).label(field) for field in ANALYSIS_FIELDS[3:]),
+        ).select_from(transactions.join(registrations, transactions.c.week == registrations.c.week, full=True))
+        rows = {int(row.week): row for row in (await session.execute(q)).all()}
+        return AnalyticsService.build_weekly_results(rows, end_date, weeks)
+
+    @staticmethod
+    def build_weekly_results(
+        rows: typing.Mapping[int, typing.Any], end_date: date, weeks: int
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Turn per-week aggregate rows, keyed by week number, into the analysis payload."""
+        results = []
+        dt_lt = end_date
+        for week in range(weeks):
+            row = rows.get(week)
+            result: typing.Dict[str, typing.Any] = {
+                "start_date": str(dt_lt - timedelta(days=6)),
+                "end_date": str(dt_lt),
+            }
+            for field in ANALYSIS_FIELDS:
+                value = getattr(row, field) if row is not None else 0
+                result[field] = float(value) if field in AMOUNT_FIELDS else int(value)
+            if any(result[field] > 0 for field in ANALYSIS_FIELDS):
+                results.append(result)
+            dt_lt -= timedelta(weeks=1)
+        return results
@@ -0,0 +1,291 @@
+"""In-memory prefix sums over the daily rollups, answering analytics for any date range in O(buckets)."""
+
+import asyncio
+import time
+import typing
+from datetime import date, timedelta
+from decimal import Decimal
+
+from config.settings import settings
+from db.models import DailyRegistrationMetrics, DailyTransactionMetrics
+from schemas.enums import AnalyticsGranularityEnum
+from services.analytics import AMOUNT_FIELDS, ANALYSIS_FIELDS
+from services.metrics_rollup import REGISTRATION_LAG_DAYS
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Transaction metrics summed over currencies, USD amounts for the amount fields.
+TRANSACTION_COLUMNS = {
+    "transactions_count": DailyTransactionMetrics.transactions_count,
+    "not_rollbacked_transactions_count": DailyTransactionMetrics.not_rollbacked_transactions_count,
+    "not_rollbacked_deposit_amount": DailyTransactionMetrics.not_rollbacked_deposit_amount_usd,
+    "not_rollbacked_withdraw_amount": DailyTransactionMetrics.not_rollbacked_withdraw_amount_usd,
+}
+# Amounts are kept as integers in units of 1e-12 USD (the scale of the rollup columns), so sums are exact.
+AMOUNT_SCALE = 10**12
+
+# Rollup rows updated this long before the last refresh are read again, covering writes that committed late.
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+def bucket_count(dt_from: date, dt_to: date, granularity: AnalyticsGranularityEnum) -> int:
+    days = (dt_to - dt_from).days + 1
+    if granularity == AnalyticsGranularityEnum.DAY:
+        return days
+    if granularity == AnalyticsGranularityEnum.WEEK:
+        return -(-days // 7)
+    return (dt_to.year - dt_from.year) * 12 + dt_to.month - dt_from.month + 1
+
+
+def bucket_ranges(
+    dt_from: date, dt_to: date, granularity: AnalyticsGranularityEnum
+) -> typing.List[typing.Tuple[date, date]]:
+    """Inclusive (start, end) days of each bucket in [dt_from, dt_to], oldest first.
+
+    Weeks end on `dt_to`, like the weekly analysis, and months are calendar months; the first bucket
+    (and, for months, the last one) is cut at the range boundaries.
+    """
+    buckets = []
+    if granularity == AnalyticsGranularityEnum.DAY:
+        day = dt_from
+        while day <= dt_to:
+            buckets.append((day, day))
+            day += timedelta(days=1)
+    elif granularity == AnalyticsGranularityEnum.WEEK:
+        end = dt_to
+        while end >= dt_from:
+            buckets.append((max(end - timedelta(days=6), dt_from), end))
+            end -= timedelta(weeks=1)
+        buckets.reverse()
+    else:
+        start = dt_from
+        while start <= dt_to:
+            next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+            buckets.append((start, min(next_month - timedelta(days=1), dt_to)))
+            start = next_month
+    return buckets
+
+
+class AnalyticsIndex:
+    """Daily metrics of the rollup tables held as prefix sums, one slot per day from the oldest rollup.
+
+    A bucket's transaction metrics are prefix differences. A registration counts as depositing within
+    a bucket when the first deposit came at most as many days after it as remain until the bucket's
+    end, so registrations keep, per day, cumulative counts by deposit lag: the last `lag_days - 1` days
+    of a bucket are read from those, the days before from prefix sums of users who deposited within
+    `lag_days`. A bucket therefore costs O(lag_days) at most.
+
+    The index is loaded once and then refreshed from the rollup rows updated since the last refresh,
+    at most every `refresh_seconds`. Rows deleted by a rollup backfill are picked up by a full reload,
+    triggered when a table shrinks and otherwise every `full_reload_seconds`.
+    """
+
+    def __init__(self, lag_days: int, refresh_seconds: float, full_reload_seconds: float) -> None:
+        self.lag_days = lag_days
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self.start: typing.Optional[date] = None
+        self._daily: typing.Dict[str, typing.List[int]] = {}
+        self._prefix: typing.Dict[str, typing.List[int]] = {}
+        # Per day, `lag_days` cumulative counts: users who first deposited within 0, 1, ... days.
+        self._deposit_by_lag: typing.List[int] = []
+        self._not_rollbacked_by_lag: typing.List[int] = []
+        self._row_counts: typing.Tuple[int, int] = (0, 0)
+        self._refreshed_at = 0.0
+        self._loaded_at = 0.0
+        self._watermark: typing.Any = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def days(self) -> int:
+        return len(self._daily.get("transactions_count", []))
+
+    def _reset(self, start: typing.Optional[date], days: int) -> None:
+        self.start = start
+        fields = [*TRANSACTION_COLUMNS, "registered_users_count", "deposit_within_lag", "not_rollbacked_within_lag"]
+        self._daily = {field: [0] * days for field in fields}
+        self._prefix = {field: [0] * (days + 1) for field in fields}
+        self._deposit_by_lag = [0] * (days * self.lag_days)
+        self._not_rollbacked_by_lag = [0] * (days * self.lag_days)
+
+    def _extend(self, end: date) -> None:
+        """Add zeroed days up to `end`."""
+        extra = (end - typing.cast(date, self.start)).days + 1 - self.days
+        if extra <= 0:
+            return
+        for field, values in self._daily.items():
+            values.extend([0] * extra)
+            self._prefix[field].extend([self._prefix[field][-1]] * extra)
+        self._deposit_by_lag.extend([0] * (extra * self.lag_days))
+        self._not_rollbacked_by_lag.extend([0] * (extra * self.lag_days))
+
+    async def _fetch(
+        self, session: AsyncSession, days: typing.Optional[typing.Collection[date]] = None
+    ) -> typing.Tuple[typing.Sequence[typing.Any], typing.Sequence[typing.Any]]:
+        transactions = select(
+            DailyTransactionMetrics.day,
+            *(func.sum(column).label(field) for field, column in TRANSACTION_COLUMNS.items()),
+        ).group_by(DailyTransactionMetrics.day)
+        registrations = select(
+            DailyRegistrationMetrics.day,
+            DailyRegistrationMetrics.deposit_lag,
+            DailyRegistrationMetrics.deposit_users_count,
+            DailyRegistrationMetrics.not_rollbacked_deposit_users_count,
+        )
+        if days is not None:
+            transactions = transactions.where(DailyTransactionMetrics.day.in_(days))
+            registrations = registrations.where(DailyRegistrationMetrics.day.in_(days))
+        return (await session.execute(transactions)).all(), (await session.execute(registrations)).all()
+
+    async def _versions(self, session: AsyncSession) -> typing.Tuple[typing.Tuple[int, int], typing.Any]:
+        row = (
+            await session.execute(
+                select(
+                    select(func.count()).select_from(DailyTransactionMetrics).scalar_subquery(),
+                    select(func.count()).select_from(DailyRegistrationMetrics).scalar_subquery(),
+                    func.greatest(
+                        select(func.max(DailyTransactionMetrics.updated)).scalar_subquery(),
+                        select(func.max(DailyRegistrationMetrics.updated)).scalar_subquery(),
+                    ),
+                )
+            )
+        ).one()
+        return (int(row[0]), int(row[1])), row[2]
+
+    async def load(self, session: AsyncSession) -> None:
+        """Rebuild the whole index from the rollup tables."""
+        row_counts, watermark = await self._versions(session)
+        transactions, registrations = await self._fetch(session)
+        days = [row.day for row in transactions] + [row.day for row in registrations]
+        if days:
+            self._reset(min(days), (max(days) - min(days)).days + 1)
+        else:
+            self._reset(None, 0)
+        self._apply(transactions, registrations, set(days))
+        self._row_counts, self._watermark = row_counts, watermark
+        self._refreshed_at = self._loaded_at = time.monotonic()
+
+    async def refresh(self, session: AsyncSession) -> None:
+        """Apply the rollup rows changed since the last refresh, or reload if that cannot be done in place."""
+        if self.start is None or time.monotonic() - self._loaded_at > self.full_reload_seconds:
+            await self.load(session)
+            return
+        row_counts, watermark = await self._versions(session)
+        if row_counts[0] < self._row_counts[0] or row_counts[1] < self._row_counts[1]:
+            await self.load(session)
+            return
+        if watermark is not None and watermark != self._watermark:
+            since = self._watermark - REFRESH_OVERLAP if self._watermark is not None else None
+            changed: typing.Set[date] = set()
+            for model in (DailyTransactionMetrics, DailyRegistrationMetrics):
+                q = select(model.day).distinct()
+                if since is not None:
+                    q = q.where(model.updated >= since)
+                changed.update((await session.execute(q)).scalars())
+            if changed and min(changed) < self.start:
+                await self.load(session)
+                return
+            if changed:
+                transactions, registrations = await self._fetch(session, changed)
+                self._extend(max(changed))
+                self._apply(transactions, registrations, changed)
+        self._row_counts, self._watermark = row_counts, watermark
+        self._refreshed_at = time.monotonic()
+
+    async def ensure_fresh(self, session: AsyncSession) -> None:
+        if time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return
+        async with self._lock:
+            if time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+                await self.refresh(session)
+
+    def _apply(
+        self, transactions: typing.Sequence[typing.Any], registrations: typing.Sequence[typing.Any], days: typing.Set[date]
+    ) -> None:
+        """Overwrite the given days with the fetched rows (days without rows become zero) and redo prefix sums."""
+        if not days:
+            return
+        start = typing.cast(date, self.start)
+        lag_days = self.lag_days
+        indexes = sorted((day - start).days for day in days)
+        for i in indexes:
+            for values in self._daily.values():
+                values[i] = 0
+            self._deposit_by_lag[i * lag_days:(i + 1) * lag_days] = [0] * lag_days
+            self._not_rollbacked_by_lag[i * lag_days:(i + 1) * lag_days] = [0] * lag_days
+
+        for row in transactions:
+            i = (row.day - start).days
+            for field in TRANSACTION_COLUMNS:
+                value = getattr(row, field) or 0
+                self._daily[field][i] = int(Decimal(value) * AMOUNT_SCALE) if field in AMOUNT_FIELDS else int(value)
+
+        for row in registrations:
+            i = (row.day - start).days
+            self._daily["registered_users_count"][i] += row.deposit_users_count
+            if row.deposit_lag < lag_days:
+                for k in range(row.deposit_lag, lag_days):
+                    self._deposit_by_lag[i * lag_days + k] += row.deposit_users_count
+                    self._not_rollbacked_by_lag[i * lag_days + k] += row.not_rollbacked_deposit_users_count
+        for i in indexes:
+            self._daily["deposit_within_lag"][i] = self._deposit_by_lag[(i + 1) * lag_days - 1]
+            self._daily["not_rollbacked_within_lag"][i] = self._not_rollbacked_by_lag[(i + 1) * lag_days - 1]
+
+        first = indexes[0]
+        for field, values in self._daily.items():
+            prefix = self._prefix[field]
+            for i in range(first, len(values)):
+                prefix[i + 1] = prefix[i] + values[i]
+
+    def _range_sum(self, field: str, first: int, last: int) -> int:
+        """Sum of `field` over day indexes [first, last], clipped to the indexed days."""
+        first, last = max(first, 0), min(last, self.days - 1)
+        if first > last:
+            return 0
+        prefix = self._prefix[field]
+        return prefix[last + 1] - prefix[first]
+
+    def _deposited_within_bucket(self, by_lag: typing.List[int], within_lag_field: str, first: int, last: int) -> int:
+        # Days at least `lag_days - 1` before the bucket's end: every deposit within `lag_days` counts.
+        total = self._range_sum(within_lag_field, first, last - self.lag_days + 1)
+        for i in range(max(first, last - self.lag_days + 2, 0), min(last, self.days - 1) + 1):
+            total += by_lag[i * self.lag_days + (last - i)]
+        return total
+
+    def query(
+        self, dt_from: date, dt_to: date, granularity: AnalyticsGranularityEnum
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Metrics of every bucket in [dt_from, dt_to], oldest first, with the fields of the weekly analysis."""
+        results = []
+        for start, end in bucket_ranges(dt_from, dt_to, granularity):
+            result: typing.Dict[str, typing.Any] = {"start_date": start, "end_date": end}
+            if self.start is None:
+                result.update({field: 0.0 if field in AMOUNT_FIELDS else 0 for field in ANALYSIS_FIELDS})
+                results.append(result)
+                continue
+            first, last = (start - self.start).days, (end - self.start).days
+            result["registered_users_count"] = self._range_sum("registered_users_count", first, last)
+            result["registered_and_deposit_users_count"] = self._deposited_within_bucket(
+                self._deposit_by_lag, "deposit_within_lag", first, last
+            )
+            result["registered_and_not_rollbacked_deposit_users_count"] = self._deposited_within_bucket(
+                self._not_rollbacked_by_lag, "not_rollbacked_within_lag", first, last
+            )
+            for field in TRANSACTION_COLUMNS:
+                value = self._range_sum(field, first, last)
+                result[field] = float(Decimal(value) / AMOUNT_SCALE) if field in AMOUNT_FIELDS else value
+            results.append(result)
+        return results
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "start": self.start,
+            "days": self.days,
+            "lag_days": self.lag_days,
+            "seconds_since_refresh": time.monotonic() - self._refreshed_at if self._refreshed_at else None,
+        }
+
+
+analytics_index = AnalyticsIndex(
+    REGISTRATION_LAG_DAYS, settings.analytics_index_refresh_seconds, settings.analytics_index_full_reload_seconds
+)
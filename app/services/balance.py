@@ -1,50 +1,25 @@
-from decimal import Decimal
-from typing import cast
+import typing
+from datetime import datetime, timezone
 
-from db.db import commit_and_refresh
 from db.models import UserBalance
-from fastapi import status
 from schemas.enums import CurrencyEnum
-from schemas.exceptions import NegativeBalanceException
-from sqlalchemy import select
+from sqlalchemy import ARRAY, Integer, String, func, insert, literal, select, true
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class BalanceService:
 
     @staticmethod
-    async def create_balance(session: AsyncSession, user_id: int, currency: CurrencyEnum) -> UserBalance:
-        """Create balance for user in database."""
-
-        user_balance = UserBalance(user_id=user_id, currency=currency, amount=0)
-        session.add(user_balance)
-        await commit_and_refresh(session, user_balance)
-        return user_balance
-
-    @staticmethod
-    async def select_balance(session: AsyncSession, user_id: int, currency: CurrencyEnum) -> UserBalance:
-        """Select balance for user in database."""
-        q = select(UserBalance).where(UserBalance.user_id == user_id, UserBalance.currency == currency)
-        result = await session.execute(q)
-        user_balance = result.scalar_one()
-        return cast(UserBalance, user_balance)
-
-    @staticmethod
-    async def add_balance(session: AsyncSession, user_id: int, currency: CurrencyEnum, amount: Decimal) -> UserBalance:
-        """Add balance for user in database."""
-        result = await session.execute(select(UserBalance).where(UserBalance.user_id == user_id, UserBalance.currency == currency))
-        user_balance = result.scalar_one()
-        user_balance.amount += amount
-        await commit_and_refresh(session, user_balance)
-        return cast(UserBalance, user_balance)
-
-    @staticmethod
-    async def subtract_balance(session: AsyncSession, user_id: int, currency: CurrencyEnum, amount: Decimal) -> UserBalance:
-        """Subtract balance for user in database."""
-        result = await session.execute(select(UserBalance).where(UserBalance.user_id == user_id, UserBalance.currency == currency))
-        user_balance = result.scalar_one()
-        if user_balance.amount - amount < 0:
-            raise NegativeBalanceException(status_code=status.HTTP_400_BAD_REQUEST, detail="Negative balance")
-        user_balance.amount -= amount
-        await commit_and_refresh(session, user_balance)
-        return cast(UserBalance, user_balance)
+    async def create_balances(session: AsyncSession, user_ids: typing.Sequence[int]) -> None:
+        """Create zero balances in every currency for each user with one multi-row insert, without committing."""
+        if not user_ids:
+            return
+        users = func.unnest(literal(list(user_ids), ARRAY(Integer))).table_valued("user_id").render_derived()
+        currencies = func.unnest(literal([currency.value for currency in CurrencyEnum], ARRAY(String))).table_valued("currency").render_derived()
+        source = select(
+            users.c.user_id,
+            currencies.c.currency,
+            literal(0, UserBalance.amount.type),
+            literal(datetime.now(timezone.utc), UserBalance.created.type),
+        ).select_from(users.join(currencies, true()))
+        await session.execute(insert(UserBalance).from_select(["user_id", "currency", "amount", "created"], source))
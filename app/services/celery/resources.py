@@ -0,0 +1,97 @@
+"""Event loop and database engine shared by all tasks of a Celery worker process."""
+
+import asyncio
+import typing
+
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+from config.settings import settings
+from db.db import build_engine, build_read_router
+from db.replicas import ReplicaRouter
+from monitoring.metrics import instrument_engine, multiprocess_enabled
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess, start_http_server
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+T = typing.TypeVar("T")
+
+
+class WorkerResources:
+    """Owns one event loop and one engine per worker process and runs async tasks on them.
+
+    Resources are created when the process starts (after the prefork pool forked it) and disposed
+    on shutdown. They are also created lazily on first use, which covers the solo pool and tasks
+    run eagerly.
+    """
+
+    def __init__(self) -> None:
+        self.loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self.engine: typing.Optional[AsyncEngine] = None
+        self.session_maker: typing.Optional[async_sessionmaker[AsyncSession]] = None
+        self.read_router: typing.Optional[ReplicaRouter] = None
+
+    def start(self) -> None:
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.engine = build_engine(settings.database_url)
+        if settings.metrics_enabled:
+            instrument_engine(self.engine)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.read_router = build_read_router(self.session_maker)
+        if settings.metrics_enabled:
+            for replica_engine in self.read_router.engines:
+                instrument_engine(replica_engine)
+
+    def stop(self) -> None:
+        if self.loop is None:
+            return
+        try:
+            for engine in [self.engine, *(self.read_router.engines if self.read_router else [])]:
+                if engine is not None:
+                    self.loop.run_until_complete(engine.dispose())
+        finally:
+            self.loop.close()
+            self.loop, self.engine, self.session_maker, self.read_router = None, None, None, None
+
+    def run(self, func: typing.Callable[[AsyncSession], typing.Awaitable[T]], read_only: bool = False) -> T:
+        """Run `func` with a fresh session on the worker's loop and return its result.
+
+        `read_only` work gets a replica session when replicas are configured.
+        """
+        self.start()
+
+        async def with_session() -> T:
+            if read_only:
+                session = await typing.cast(ReplicaRouter, self.read_router).session()
+            else:
+                session = typing.cast(async_sessionmaker[AsyncSession], self.session_maker)()
+            async with session:
+                return await func(session)
+
+        return typing.cast(asyncio.AbstractEventLoop, self.loop).run_until_complete(with_session())
+
+
+worker_resources = WorkerResources()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs: typing.Any) -> None:
+    """Serve the metrics of all pool processes from the main worker process."""
+    if not settings.metrics_enabled or not settings.celery_metrics_port:
+        return
+    registry = REGISTRY
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(settings.celery_metrics_port, registry=registry)
+
+
+@worker_process_init.connect
+def start_worker_resources(**kwargs: typing.Any) -> None:
+    worker_resources.start()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_worker_resources(**kwargs: typing.Any) -> None:
+    worker_resources.stop()
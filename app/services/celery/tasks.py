@@ -1,75 +1,112 @@
-import asyncio
-import json
-from datetime import datetime, timedelta, timezone
+import typing
+from datetime import date
 
-from celery import shared_task
+from celery import chord, shared_task
 from config.settings import settings
-from services.queries import QueryService
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from monitoring.metrics import ANALYSIS_RESULT_ROWS, ANALYSIS_TASK_DURATION
+from services.analysis_jobs import (
+    WEEKLY_ANALYSIS_GRANULARITY,
+    WEEKLY_ANALYSIS_PERIODS,
+    AnalysisJobService,
+    build_analysis_results,
+)
+from services.celery.resources import worker_resources
+from services.metrics_rollup import MetricsRollupService
+from services.partitions import PartitionService
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
 
 @shared_task
 def get_analysis():
+    """Queue the 52-week analysis served by GET /transactions/analysis, unless it is already pending or running."""
+    job_id = worker_resources.run(create_weekly_analysis_job)
+    if job_id is not None:
+        start_analysis_job(job_id)
+    return job_id
 
-    async def run():
-
-        base_url = f"postgresql+asyncpg://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
-        engine = create_async_engine(
-            base_url,
-            echo=False,
-        )
-        Session = async_sessionmaker(engine, expire_on_commit=False)
-        async with Session() as session:
-            return await make_analysis(session)
-
-    loop = asyncio.new_event_loop()
-    try:
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(run())
-    finally:
-        loop.close()
-
-
-# TODO optimize
-async def make_analysis(session: AsyncSession):
-
-    dt_gt = datetime.now(timezone.utc).date() - timedelta(weeks=1) + timedelta(days=1)
-    dt_lt = datetime.now(timezone.utc).date()
-    results = []
-    for i in range(52):
-        registered_users_count = await QueryService.get_registered_users_count(session=session, dt_gt=dt_gt, dt_lt=dt_lt)
-        registered_and_deposit_users_count = await QueryService.get_registered_and_deposit_users_count(session=session, dt_gt=dt_gt, dt_lt=dt_lt)
-        registered_and_not_rollbacked_deposit_users_count = await QueryService.get_registered_and_not_rollbacked_deposit_users_count(session=session, dt_gt=dt_gt, dt_lt=dt_lt)
-        not_rollbacked_deposit_amount = await QueryService.get_not_rollbacked_deposit_amount(session=session, dt_gt=dt_gt, dt_lt=dt_lt)
-        not_rollbacked_withdraw_amount = await QueryService.get_not_rollbacked_withdraw_amount(session=session, dt_gt=dt_gt, dt_lt=dt_lt)
-        transactions_count = await QueryService.get_transactions_count(session=session, dt_gt=dt_gt, dt_lt=dt_lt)
-        not_rollbacked_transactions_count = await QueryService.get_not_rollbacked_transactions_count(session=session, dt_gt=dt_gt, dt_lt=dt_lt)
-        result = {
-            "start_date": str(dt_gt),
-            "end_date": str(dt_lt),
-            "registered_users_count": registered_users_count,
-            "registered_and_deposit_users_count": registered_and_deposit_users_count,
-            "registered_and_not_rollbacked_deposit_users_count": registered_and_not_rollbacked_deposit_users_count,
-            "not_rollbacked_deposit_amount": not_rollbacked_deposit_amount,
-            "not_rollbacked_withdraw_amount": not_rollbacked_withdraw_amount,
-            "transactions_count": transactions_count,
-            "not_rollbacked_transactions_count": not_rollbacked_transactions_count,
-        }
-        for field in (
-            "registered_users_count",
-            "registered_and_deposit_users_count",
-            "registered_and_not_rollbacked_deposit_users_count",
-            "not_rollbacked_deposit_amount",
-            "not_rollbacked_withdraw_amount",
-            "transactions_count",
-            "not_rollbacked_transactions_count",
-        ):
-            field_value = result[field]
-            if isinstance(field_value, (int, float)) and field_value > 0:
-                results.append(result)
-                break
-        dt_gt -= timedelta(weeks=1)
-        dt_lt -= timedelta(weeks=1)
-
-    with open('analysis.json', 'w') as f:
-        json.dump(results, f)
+
+async def create_weekly_analysis_job(session: AsyncSession) -> typing.Optional[int]:
+    """Create the job, or return None when the same analysis is already pending or running."""
+    job = await AnalysisJobService.create_job(session, WEEKLY_ANALYSIS_GRANULARITY, WEEKLY_ANALYSIS_PERIODS)
+    return None if job is None else typing.cast(int, job.id)
+
+
+@shared_task
+def run_analysis_job(job_id: int):
+    start_analysis_job(job_id)
+
+
+def start_analysis_job(job_id: int) -> None:
+    """Fan the job out as a chord: one task per chunk of periods, each with its own session, then a merge.
+
+    A failing chunk is retried on its own; the job is marked as failed once a chunk runs out of retries.
+    """
+    buckets = worker_resources.run(lambda session: AnalysisJobService.start_job(session, job_id))
+    if buckets is None:
+        return
+    size = settings.analysis_job_chunk_periods
+    chunks = [[(str(start), str(end)) for start, end in buckets[i:i + size]] for i in range(0, len(buckets), size)]
+    chord(analyze_analysis_chunk.s(job_id, chunk) for chunk in chunks)(
+        merge_analysis_chunks.s(job_id).on_error(fail_analysis_job.s(job_id))
+    )
+
+
+@shared_task(
+    ignore_result=False,
+    autoretry_for=(Exception,),
+    max_retries=settings.analysis_job_chunk_max_retries,
+    retry_backoff=True,
+)
+def analyze_analysis_chunk(job_id: int, buckets: typing.List[typing.Tuple[str, str]]):
+    return worker_resources.run(lambda session: analyze_chunk(session, job_id, buckets), read_only=True)
+
+
+async def analyze_chunk(
+    session: AsyncSession, job_id: int, buckets: typing.List[typing.Tuple[str, str]]
+) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Compute the metrics of the given periods, oldest first, and count them into the job's progress."""
+
+    metrics = await MetricsRollupService.get_bucket_analysis(
+        session, [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in buckets]
+    )
+    async with typing.cast(async_sessionmaker[AsyncSession], worker_resources.session_maker)() as primary:
+        await AnalysisJobService.record_progress(primary, job_id, len(metrics))
+    return [{**bucket, "start_date": str(bucket["start_date"]), "end_date": str(bucket["end_date"])} for bucket in metrics]
+
+
+@shared_task
+def merge_analysis_chunks(chunks: typing.List[typing.List[typing.Dict[str, typing.Any]]], job_id: int):
+    results = build_analysis_results([bucket for chunk in chunks for bucket in chunk])
+    worker_resources.run(lambda session: finish_analysis_job(session, job_id, results))
+    return {"job_id": job_id, "rows": len(results)}
+
+
+async def finish_analysis_job(session: AsyncSession, job_id: int, results: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """Store the merged result and record how long the job took."""
+
+    job = await AnalysisJobService.finish_job(session, job_id, results)
+    ANALYSIS_TASK_DURATION.observe((job.finished - job.started).total_seconds())
+    ANALYSIS_RESULT_ROWS.observe(len(results))
+
+
+@shared_task
+def fail_analysis_job(request: typing.Any, exc: BaseException, traceback: typing.Any, job_id: int):
+    worker_resources.run(lambda session: AnalysisJobService.fail_job(session, job_id, str(exc) or type(exc).__name__))
+
+
+@shared_task
+def maintain_transaction_partitions():
+    return worker_resources.run(maintain_partitions)
+
+
+async def maintain_partitions(session: AsyncSession) -> typing.Dict[str, typing.List[str]]:
+    """Create the upcoming monthly partitions of `transaction` and archive those past the retention period."""
+
+    created = await PartitionService.ensure_partitions(session, settings.transaction_partitions_ahead_months)
+    archived = await PartitionService.archive_old_partitions(
+        session,
+        typing.cast(AsyncEngine, worker_resources.engine),
+        settings.transaction_retention_months,
+        settings.transaction_archive_dir,
+    )
+    return {"created": created, "archived": [str(path) for path in archived]}
@@ -0,0 +1,131 @@
+"""In-process coalescing of concurrent deposits to the same balance row."""
+
+import asyncio
+import time
+import typing
+from decimal import Decimal
+
+from config.settings import settings
+from db.db import async_session_maker
+from fastapi import HTTPException
+from schemas.enums import CurrencyEnum, TransactionTypeEnum
+from schemas.pydantic_models import RequestBatchTransactionItemModel
+from services.ledger import LedgerService
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+class PendingDeposit:
+    """A deposit waiting for its group to be flushed."""
+
+    def __init__(self, item: RequestBatchTransactionItemModel, future: "asyncio.Future[Row]") -> None:
+        self.item = item
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+class CoalescerStats:
+    """Counters describing how deposits were grouped."""
+
+    def __init__(self) -> None:
+        self.deposits = 0
+        self.batches = 0
+        self.max_batch_size = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_batch(self, pending: typing.Sequence[PendingDeposit]) -> None:
+        now = time.perf_counter()
+        self.batches += 1
+        self.deposits += len(pending)
+        self.max_batch_size = max(self.max_batch_size, len(pending))
+        for deposit in pending:
+            wait = now - deposit.enqueued
+            self.total_wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "deposits": self.deposits,
+            "batches": self.batches,
+            "average_batch_size": self.deposits / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "average_wait_ms": 1000 * self.total_wait_seconds / self.deposits if self.deposits else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_seconds,
+        }
+
+
+class DepositCoalescer:
+    """Group deposits to the same (user, currency) arriving within a short window into one write.
+
+    The first deposit for a key opens a window of `window_ms`; every deposit for that key arriving
+    before the window closes (or until `max_batch_size` is reached) is applied together through
+    `LedgerService.apply_batch`, i.e. one balance update and one multi-row ledger insert. Each caller
+    still receives its own transaction row or exception. A deposit that ends up alone in its window
+    takes the regular single-statement path.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession], window_ms: float, max_batch_size: int) -> None:
+        self.session_maker = session_maker
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.stats = CoalescerStats()
+        self._pending: typing.Dict[typing.Tuple[int, str], typing.List[PendingDeposit]] = {}
+        self._timers: typing.Dict[typing.Tuple[int, str], asyncio.TimerHandle] = {}
+        self._flushes: typing.Set[asyncio.Task] = set()
+
+    async def deposit(self, user_id: int, currency: CurrencyEnum, amount: Decimal) -> Row:
+        loop = asyncio.get_running_loop()
+        key = (user_id, str(currency))
+        item = RequestBatchTransactionItemModel(user_id=user_id, currency=currency, amount=amount, type=TransactionTypeEnum.DEPOSIT)
+        pending = PendingDeposit(item, loop.create_future())
+
+        group = self._pending.setdefault(key, [])
+        group.append(pending)
+        if len(group) == 1:
+            self._timers[key] = loop.call_later(self.window, self._start_flush, key)
+        if len(group) >= self.max_batch_size:
+            self._start_flush(key)
+        return await pending.future
+
+    def _start_flush(self, key: typing.Tuple[int, str]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group = self._pending.pop(key, None)
+        if not group:
+            return
+        task = asyncio.create_task(self._flush(group))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, group: typing.List[PendingDeposit]) -> None:
+        self.stats.record_batch(group)
+        outcomes: typing.List[typing.Tuple[typing.Optional[Row], typing.Optional[HTTPException]]]
+        try:
+            async with self.session_maker() as session:
+                if len(group) == 1:
+                    item = group[0].item
+                    outcomes = [(await LedgerService.deposit(session, item.user_id, item.currency, item.amount), None)]
+                else:
+                    outcomes = await LedgerService.apply_batch(session, [pending.item for pending in group], atomic=False)
+        except Exception as e:
+            for pending in group:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        for pending, (row, error) in zip(group, outcomes):
+            if pending.future.done():
+                continue
+            if error is not None:
+                pending.future.set_exception(error)
+            elif row is not None:
+                pending.future.set_result(row)
+
+
+deposit_coalescer = DepositCoalescer(
+    async_session_maker,
+    window_ms=settings.deposit_coalescing_window_ms,
+    max_batch_size=settings.deposit_coalescing_max_batch_size,
+)
@@ -0,0 +1,208 @@
+"""Time-versioned USD exchange rates, converted in SQL or through an in-memory snapshot."""
+
+import argparse
+import asyncio
+import bisect
+import logging
+import time
+import typing
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from config.settings import settings
+from db.models import ExchangeRate, User, UserBalance
+from fastapi import status
+from schemas.enums import CurrencyEnum
+from schemas.exceptions import UserNotExistsException
+from sqlalchemy import DateTime, and_, func, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Rates the table is seeded with, valid from `EPOCH` until the first explicit change.
+DEFAULT_RATES_TO_USD = {
+    CurrencyEnum.USD: Decimal("1"),
+    CurrencyEnum.EUR: Decimal("0.9342"),
+    CurrencyEnum.AUD: Decimal("0.5447"),
+    CurrencyEnum.CAD: Decimal("0.6162"),
+    CurrencyEnum.ARS: Decimal("0.0009"),
+    CurrencyEnum.PLN: Decimal("0.2343"),
+    CurrencyEnum.BTC: Decimal("100000.0"),
+    CurrencyEnum.ETH: Decimal("3557.3476"),
+    CurrencyEnum.DOGE: Decimal("0.3627"),
+    CurrencyEnum.USDT: Decimal("0.9709"),
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class RateSnapshot:
+    """All rate intervals per currency, sorted by `valid_from`."""
+
+    def __init__(self, rates: typing.Iterable[ExchangeRate], version: typing.Tuple[int, typing.Optional[datetime]]) -> None:
+        self.version = version
+        self._starts: typing.Dict[str, typing.List[datetime]] = {}
+        self._intervals: typing.Dict[str, typing.List[typing.Tuple[typing.Optional[datetime], Decimal]]] = {}
+        for rate in sorted(rates, key=lambda r: (r.currency, r.valid_from)):
+            self._starts.setdefault(rate.currency, []).append(rate.valid_from)
+            self._intervals.setdefault(rate.currency, []).append((rate.valid_to, Decimal(rate.rate_to_usd)))
+
+    def rate_at(self, currency: str, at: datetime) -> typing.Optional[Decimal]:
+        """Rate of `currency` in effect at `at`, or None when no interval covers it."""
+        starts = self._starts.get(str(currency))
+        if not starts:
+            return None
+        i = bisect.bisect_right(starts, at) - 1
+        if i < 0:
+            return None
+        valid_to, rate = self._intervals[str(currency)][i]
+        return rate if valid_to is None or at < valid_to else None
+
+    def to_usd(self, currency: str, amount: Decimal, at: datetime) -> Decimal:
+        """Convert `amount` at the rate in effect at `at`; amounts without a rate count as zero, as in SQL sums."""
+        rate = self.rate_at(currency, at)
+        return Decimal(amount) * rate if rate is not None else Decimal(0)
+
+
+class ExchangeRateCache:
+    """Process-wide snapshot of the `exchange_rate` table.
+
+    The snapshot is reloaded when this process changes a rate, and otherwise when a cheap version
+    query (row count and last update) shows another process did, checked at most every
+    `refresh_seconds`.
+    """
+
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: typing.Optional[RateSnapshot] = None
+        self._checked_at = 0.0
+
+    async def get(self, session: AsyncSession) -> RateSnapshot:
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.refresh_seconds:
+            return self._snapshot
+        version = tuple((await session.execute(select(func.count(), func.max(ExchangeRate.updated)))).one())
+        if self._snapshot is None or self._snapshot.version != version:
+            rates = (await session.execute(select(ExchangeRate))).scalars().all()
+            self._snapshot = RateSnapshot(rates, typing.cast(typing.Tuple[int, typing.Optional[datetime]], version))
+        self._checked_at = now
+        return self._snapshot
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+
+exchange_rate_cache = ExchangeRateCache(settings.exchange_rate_refresh_seconds)
+
+
+class ExchangeRateService:
+
+    @staticmethod
+    def rate_in_effect(currency: typing.Any, at: typing.Any) -> typing.Any:
+        """Join condition matching the `exchange_rate` row of `currency` in effect at `at`."""
+        return and_(
+            ExchangeRate.currency == currency,
+            ExchangeRate.valid_from <= at,
+            or_(ExchangeRate.valid_to.is_(None), ExchangeRate.valid_to > at),
+        )
+
+    @staticmethod
+    async def seed_default_rates(session: AsyncSession) -> None:
+        """Insert `DEFAULT_RATES_TO_USD` for currencies that have no rate yet.
+
+        Rates inserted concurrently by another process win over ours, through the table's constraints.
+        """
+        existing = set((await session.execute(select(ExchangeRate.currency).distinct())).scalars().all())
+        now = datetime.now(timezone.utc)
+        missing = [
+            {"currency": currency.value, "rate_to_usd": rate, "valid_from": EPOCH, "valid_to": None, "updated": now}
+            for currency, rate in DEFAULT_RATES_TO_USD.items()
+            if currency.value not in existing
+        ]
+        if missing:
+            q = insert(ExchangeRate).values(missing).on_conflict_do_nothing().returning(ExchangeRate.id)
+            inserted = (await session.execute(q)).scalars().all()
+            await session.commit()
+            if inserted:
+                exchange_rate_cache.invalidate()
+
+    @staticmethod
+    async def set_rate(session: AsyncSession, currency: CurrencyEnum, rate_to_usd: Decimal, valid_from: datetime) -> ExchangeRate:
+        """Make `rate_to_usd` the rate of `currency` from `valid_from` on, closing the interval it starts in.
+
+        The rollups store USD amounts converted when transactions are recorded, so a change with
+        `valid_from` in the past must be followed by `python -m services.metrics_rollup --start <day>`.
+        """
+        now = datetime.now(timezone.utc)
+        current = (
+            await session.execute(
+                select(ExchangeRate)
+                .where(ExchangeRate.currency == currency.value, ExchangeRate.valid_from <= valid_from)
+                .order_by(ExchangeRate.valid_from.desc())
+                .limit(1)
+                .with_for_update()
+            )
+        ).scalar()
+        following = (
+            await session.execute(
+                select(func.min(ExchangeRate.valid_from)).where(ExchangeRate.currency == currency.value, ExchangeRate.valid_from > valid_from)
+            )
+        ).scalar()
+        if current is not None and current.valid_from == valid_from:
+            current.rate_to_usd = rate_to_usd
+            current.updated = now
+            rate = current
+        else:
+            if current is not None:
+                await session.execute(
+                    update(ExchangeRate).where(ExchangeRate.id == current.id).values(valid_to=valid_from, updated=now)
+                )
+            rate = ExchangeRate(currency=currency.value, rate_to_usd=rate_to_usd, valid_from=valid_from, valid_to=following, updated=now)
+            session.add(rate)
+        await session.commit()
+        exchange_rate_cache.invalidate()
+        return rate
+
+    @staticmethod
+    async def get_user_net_worth(session: AsyncSession, user_id: int, at: typing.Optional[datetime] = None) -> Decimal:
+        """Sum of the user's balances in USD at the rates in effect at `at` (now by default)."""
+        if (await session.execute(select(User.id).where(User.id == user_id))).scalar() is None:
+            raise UserNotExistsException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{user_id}` does not exist")
+        moment = literal(at, DateTime(timezone=True)) if at is not None else func.now()
+        q = (
+            select(func.coalesce(func.sum(UserBalance.amount * ExchangeRate.rate_to_usd), 0))
+            .select_from(UserBalance)
+            .join(ExchangeRate, ExchangeRateService.rate_in_effect(UserBalance.currency, moment))
+            .where(UserBalance.user_id == user_id)
+        )
+        return Decimal((await session.execute(q)).scalar_one())
+
+
+async def main() -> None:
+    """Change a rate: `python -m services.exchange_rates EUR 0.9342 --valid-from 2026-10-17T00:00:00+00:00`."""
+    from db.db import async_session_maker
+
+    parser = argparse.ArgumentParser(description="Set the USD exchange rate of a currency from a given time on.")
+    parser.add_argument("currency", type=CurrencyEnum, choices=list(CurrencyEnum))
+    parser.add_argument("rate_to_usd", type=Decimal)
+    parser.add_argument(
+        "--valid-from", type=datetime.fromisoformat, default=None, help="start of the rate, in UTC unless given; defaults to now"
+    )
+    args = parser.parse_args()
+
+    valid_from = args.valid_from or datetime.now(timezone.utc)
+    if valid_from.tzinfo is None:
+        valid_from = valid_from.replace(tzinfo=timezone.utc)
+    async with async_session_maker() as session:
+        await ExchangeRateService.set_rate(session, args.currency, args.rate_to_usd, valid_from)
+    if valid_from < datetime.now(timezone.utc):
+        logger.warning(
+            "The rate applies to past transactions, rebuild the rollups from %s: python -m services.metrics_rollup --start %s",
+            valid_from.date(),
+            valid_from.date(),
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,342 @@
+"""Atomic balance changes: status check, conditional balance update and ledger write in one statement."""
+
+import typing
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from db.models import Transaction, User, UserBalance
+from fastapi import HTTPException, status
+from schemas.enums import CurrencyEnum, TransactionStatusEnum, TransactionTypeEnum, UserStatusEnum
+from schemas.exceptions import (
+    CreateTransactionForBlockedUserException,
+    NegativeBalanceException,
+    TransactionAlreadyRollbackedException,
+    TransactionBatchRolledBackException,
+    TransactionDoesNotBelongToUserException,
+    TransactionNotExistsException,
+    UpdateTransactionForBlockedUserException,
+    UserNotExistsException,
+)
+from schemas.pydantic_models import RequestBatchTransactionItemModel
+from services.metrics_rollup import MetricsRollupService
+from services.user_status_cache import user_status_cache
+from sqlalchemy import (
+    ARRAY,
+    Integer,
+    Numeric,
+    String,
+    and_,
+    any_,
+    case,
+    cast,
+    func,
+    insert,
+    literal,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.user_id,
+    Transaction.currency,
+    Transaction.amount,
+    Transaction.status,
+    Transaction.type,
+    Transaction.created,
+)
+
+
+class LedgerService:
+
+    @staticmethod
+    async def deposit(session: AsyncSession, user_id: int, currency: CurrencyEnum, amount: Decimal) -> Row:
+        """Credit `amount` to the user's balance and record a DEPOSIT transaction."""
+        return await LedgerService._apply(session, user_id, currency, amount, amount, TransactionTypeEnum.DEPOSIT)
+
+    @staticmethod
+    async def withdraw(session: AsyncSession, user_id: int, currency: CurrencyEnum, amount: Decimal) -> Row:
+        """Debit `amount` from the user's balance and record a WITHDRAW transaction."""
+        return await LedgerService._apply(session, user_id, currency, -amount, amount, TransactionTypeEnum.WITHDRAW)
+
+    @staticmethod
+    async def _apply(
+        session: AsyncSession,
+        user_id: int,
+        currency: CurrencyEnum,
+        delta: Decimal,
+        amount: Decimal,
+        type: TransactionTypeEnum,
+    ) -> Row:
+        """Run the whole balance change as a single statement and commit it.
+
+        The balance is only updated when the user is active and the new balance stays non-negative,
+        and the transaction row is only inserted when the balance update matched, so concurrent
+        withdrawals cannot overdraw an account. When the user's status is in `user_status_cache`, a
+        blocked user is rejected without touching the database and an active one skips the user lookup.
+        """
+        cached = user_status_cache.get(user_id)
+        if cached is not None and cached.status != UserStatusEnum.ACTIVE:
+            raise CreateTransactionForBlockedUserException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{user_id}` is blocked"
+            )
+
+        balance_conditions = [UserBalance.user_id == user_id, UserBalance.currency == currency, UserBalance.amount + delta >= 0]
+        target_user = select(User.status, User.created).where(User.id == user_id).cte("target_user")
+        if cached is None:
+            balance_conditions.append(select(target_user.c.status).where(target_user.c.status == UserStatusEnum.ACTIVE).exists())
+        balance = (
+            update(UserBalance)
+            .where(*balance_conditions)
+            .values(amount=UserBalance.amount + delta)
+            .returning(UserBalance.amount)
+            .cte("balance")
+        )
+        new_transaction = (
+            insert(Transaction)
+            .from_select(
+                ["user_id", "currency", "amount", "status", "type", "created"],
+                select(
+                    literal(user_id),
+                    literal(str(currency)),
+                    literal(amount, Transaction.amount.type),
+                    literal(TransactionStatusEnum.PROCESSED, Transaction.status.type),
+                    literal(type, Transaction.type.type),
+                    literal(datetime.now(timezone.utc), Transaction.created.type),
+                ).select_from(balance),
+            )
+            .returning(*TRANSACTION_COLUMNS)
+            .cte("new_transaction")
+        )
+
+        if cached is not None:
+            q = select(balance.c.amount.label("balance"), *new_transaction.c).select_from(
+                balance.outerjoin(new_transaction, true())
+            )
+            row = (await session.execute(q)).one_or_none()
+            user_created = cached.created
+        else:
+            q = select(
+                target_user.c.status.label("user_status"),
+                target_user.c.created.label("user_created"),
+                balance.c.amount.label("balance"),
+                *new_transaction.c,
+            ).select_from(target_user.outerjoin(balance, true()).outerjoin(new_transaction, true()))
+            row = (await session.execute(q)).one_or_none()
+
+            if row is None:
+                raise UserNotExistsException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{user_id}` does not exist"
+                )
+            user_status_cache.set(user_id, row.user_status, row.user_created)
+            if row.user_status != UserStatusEnum.ACTIVE:
+                raise CreateTransactionForBlockedUserException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{user_id}` is blocked"
+                )
+            user_created = row.user_created
+        if row is None or row.id is None:
+            raise NegativeBalanceException(status_code=status.HTTP_400_BAD_REQUEST, detail="Negative balance")
+
+        await MetricsRollupService.record_transactions(session, [row], user_created={user_id: user_created})
+        await session.commit()
+        return row
+
+    @staticmethod
+    async def rollback(session: AsyncSession, user_id: int, transaction_id: int) -> Row:
+        """Mark the user's transaction as ROLLBACKED and revert its balance change in a single statement.
+
+        Rejects unknown users, blocked users, unknown transactions, transactions of other users, transactions
+        already rollbacked and reversals that would make the balance negative.
+        """
+        cached = user_status_cache.get(user_id)
+        if cached is not None and cached.status == UserStatusEnum.BLOCKED:
+            raise UpdateTransactionForBlockedUserException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"User with id=`{user_id}` is blocked"
+            )
+        target_user = select(User.status, User.created).where(User.id == user_id).cte("target_user")
+        target = (
+            select(Transaction.user_id, Transaction.currency, Transaction.amount, Transaction.status, Transaction.type)
+            .where(Transaction.id == transaction_id)
+            .with_for_update()
+            .cte("target_transaction")
+        )
+        delta = case((target.c.type == TransactionTypeEnum.WITHDRAW, target.c.amount), else_=-target.c.amount)
+        balance = (
+            update(UserBalance)
+            .where(
+                UserBalance.user_id == user_id,
+                UserBalance.currency == target.c.currency,
+                target.c.user_id == user_id,
+                target.c.status != TransactionStatusEnum.ROLLBACKED,
+                UserBalance.amount + delta >= 0,
+                select(target_user.c.status).where(target_user.c.status != UserStatusEnum.BLOCKED).exists(),
+            )
+            .values(amount=UserBalance.amount + delta)
+            .returning(UserBalance.amount)
+            .cte("balance")
+        )
+        rollbacked = (
+            update(Transaction)
+            .where(Transaction.id == transaction_id, select(balance.c.amount).exists())
+            .values(status=TransactionStatusEnum.ROLLBACKED)
+            .returning(*TRANSACTION_COLUMNS)
+            .cte("rollbacked")
+        )
+        q = select(
+            target_user.c.status.label("user_status"),
+            target_user.c.created.label("user_created"),
+            target.c.user_id.label("owner_id"),
+            target.c.status.label("previous_status"),
+            *rollbacked.c,
+        ).select_from(
+            target_user.outerjoin(target, true()).outerjoin(rollbacked, true())
+        )
+        row = (await session.execute(q)).one_or_none()
+
+        if row is None:
+            raise UserNotExistsException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{user_id}` does not exist"
+            )
+        user_status_cache.set(user_id, row.user_status, row.user_created)
+        if row.user_status == UserStatusEnum.BLOCKED:
+            raise UpdateTransactionForBlockedUserException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"User with id=`{user_id}` is blocked"
+            )
+        if row.owner_id is None:
+            raise TransactionNotExistsException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Transaction with id=`{transaction_id}` does not exist"
+            )
+        if row.owner_id != user_id:
+            raise TransactionDoesNotBelongToUserException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Transaction with id=`{transaction_id}` does not belong to user with id=`{user_id}`"
+            )
+        if row.previous_status == TransactionStatusEnum.ROLLBACKED:
+            raise TransactionAlreadyRollbackedException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Transaction with id=`{transaction_id}` is already rollbacked"
+            )
+        if row.id is None:
+            raise NegativeBalanceException(status_code=status.HTTP_400_BAD_REQUEST, detail="Negative balance")
+
+        await MetricsRollupService.record_rollbacks(session, [row], user_created={user_id: row.user_created})
+        await session.commit()
+        return row
+
+    @staticmethod
+    async def apply_batch(
+        session: AsyncSession, items: typing.Sequence[RequestBatchTransactionItemModel], atomic: bool
+    ) -> typing.List[typing.Tuple[typing.Optional[Row], typing.Optional[HTTPException]]]:
+        """Apply many deposits and withdrawals in one database transaction.
+
+        Items are checked in order against the locked balances; the balance changes are then written
+        as one aggregated delta per (user, currency) and the ledger rows with one multi-row insert.
+        Returns the inserted transaction or the exception rejecting it per item. In atomic mode nothing is
+        written if any item is rejected.
+        """
+        user_ids = sorted({item.user_id for item in items})
+        users = {
+            row.id: row
+            for row in await session.execute(
+                select(User.id, User.status, User.created).where(User.id == any_(literal(user_ids, ARRAY(Integer))))
+            )
+        }
+
+        for row in users.values():
+            user_status_cache.set(row.id, row.status, row.created)
+
+        keys = sorted({(item.user_id, str(item.currency)) for item in items})
+        requested = func.unnest(
+            literal([user_id for user_id, _ in keys], ARRAY(Integer)),
+            literal([currency for _, currency in keys], ARRAY(String)),
+        ).table_valued("user_id", "currency").render_derived()
+        balances: typing.Dict[typing.Tuple[int, str], Decimal] = {
+            (row.user_id, row.currency): row.amount
+            for row in await session.execute(
+                select(UserBalance.user_id, UserBalance.currency, UserBalance.amount)
+                .join(requested, and_(UserBalance.user_id == requested.c.user_id, UserBalance.currency == requested.c.currency))
+                .order_by(UserBalance.user_id, UserBalance.currency)
+                .with_for_update(of=UserBalance)
+            )
+        }
+
+        errors: typing.List[typing.Optional[HTTPException]] = []
+        deltas: typing.Dict[typing.Tuple[int, str], Decimal] = defaultdict(Decimal)
+        for item in items:
+            user = users.get(item.user_id)
+            key = (item.user_id, str(item.currency))
+            delta = item.amount if item.type == TransactionTypeEnum.DEPOSIT else -item.amount
+            if user is None:
+                errors.append(UserNotExistsException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{item.user_id}` does not exist"
+                ))
+            elif user.status != UserStatusEnum.ACTIVE:
+                errors.append(CreateTransactionForBlockedUserException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id=`{item.user_id}` is blocked"
+                ))
+            elif key not in balances or balances[key] + delta < 0:
+                errors.append(NegativeBalanceException(status_code=status.HTTP_400_BAD_REQUEST, detail="Negative balance"))
+            else:
+                errors.append(None)
+                balances[key] += delta
+                deltas[key] += delta
+
+        if atomic and any(errors):
+            await session.rollback()
+            return [
+                (None, error or TransactionBatchRolledBackException(
+                    status_code=status.HTTP_409_CONFLICT, detail="Not applied: another item of the atomic batch was rejected"
+                ))
+                for error in errors
+            ]
+
+        accepted = [item for item, error in zip(items, errors) if error is None]
+        rows: typing.List[Row] = []
+        if accepted:
+            changed = func.unnest(
+                literal([user_id for user_id, _ in deltas], ARRAY(Integer)),
+                literal([currency for _, currency in deltas], ARRAY(String)),
+                literal(list(deltas.values()), ARRAY(Numeric)),
+            ).table_valued("user_id", "currency", "delta").render_derived()
+            await session.execute(
+                update(UserBalance)
+                .where(UserBalance.user_id == changed.c.user_id, UserBalance.currency == changed.c.currency)
+                .values(amount=UserBalance.amount + changed.c.delta)
+            )
+
+            new_transactions = func.unnest(
+                literal([item.user_id for item in accepted], ARRAY(Integer)),
+                literal([str(item.currency) for item in accepted], ARRAY(String)),
+                literal([item.amount for item in accepted], ARRAY(Numeric)),
+                literal([str(item.type) for item in accepted], ARRAY(String)),
+            ).table_valued("user_id", "currency", "amount", "type", with_ordinality="position").render_derived()
+            # Ids are drawn from the sequence in the order the rows are selected, so sorting the returned
+            # rows by id lines them up with `accepted`.
+            q = (
+                insert(Transaction)
+                .from_select(
+                    ["user_id", "currency", "amount", "status", "type", "created"],
+                    select(
+                        new_transactions.c.user_id,
+                        new_transactions.c.currency,
+                        new_transactions.c.amount,
+                        literal(TransactionStatusEnum.PROCESSED, Transaction.status.type),
+                        cast(new_transactions.c.type, Transaction.type.type),
+                        literal(datetime.now(timezone.utc), Transaction.created.type),
+                    ).order_by(new_transactions.c.position),
+                )
+                .returning(*TRANSACTION_COLUMNS)
+            )
+            rows = sorted((await session.execute(q)).all(), key=lambda row: row.id)
+            await MetricsRollupService.record_transactions(
+                session, rows, user_created={user_id: user.created for user_id, user in users.items()}
+            )
+        await session.commit()
+
+        inserted = iter(rows)
+        return [(next(inserted), None) if error is None else (None, error) for error in errors]
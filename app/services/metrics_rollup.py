@@ -0,0 +1,482 @@
+"""Incrementally maintained daily rollups backing the transaction analysis."""
+
+import argparse
+import asyncio
+import typing
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+from db.models import DailyRegistrationMetrics, DailyTransactionMetrics, ExchangeRate, Transaction, User
+from schemas.enums import TransactionStatusEnum
+from services.analytics import AMOUNT_FIELDS, ANALYSIS_FIELDS, AnalyticsService
+from services.exchange_rates import ExchangeRateService, exchange_rate_cache
+from services.queries import utc_day, utc_day_range
+from sqlalchemy import (
+    Date,
+    Integer,
+    Select,
+    and_,
+    cast,
+    column,
+    delete,
+    func,
+    literal,
+    literal_column,
+    select,
+    text,
+    union_all,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Registrations are bucketed by the number of days until the user's first deposit. A window only ever
+# counts a deposit made within `REGISTRATION_LAG_DAYS` of registration, so later deposits (or none at
+# all) share the last bucket. Monthly buckets of GET /analytics need up to 31 days.
+REGISTRATION_LAG_DAYS = 31
+
+REGISTRATION_METRICS = ("day", "deposit_lag", "deposit_users_count", "not_rollbacked_deposit_users_count", "updated")
+
+TRANSACTION_METRICS = (
+    "transactions_count",
+    "not_rollbacked_transactions_count",
+    "not_rollbacked_deposit_amount",
+    "not_rollbacked_withdraw_amount",
+    "not_rollbacked_deposit_amount_usd",
+    "not_rollbacked_withdraw_amount_usd",
+)
+
+
+class MetricsRollupService:
+
+    @staticmethod
+    async def record_registrations(session: AsyncSession, users: typing.Iterable[typing.Union[User, Row]]) -> None:
+        """Count newly created users (models, or rows returned by a bulk insert) into the registration rollup."""
+        deltas: typing.Dict[typing.Tuple[date, int], typing.List[int]] = defaultdict(lambda: [0, 0])
+        for user in users:
+            delta = deltas[(user.created.astimezone(timezone.utc).date(), REGISTRATION_LAG_DAYS)]
+            delta[0] += 1
+            delta[1] += 1
+        await MetricsRollupService._apply_registration_deltas(session, deltas)
+
+    @staticmethod
+    async def record_transactions(
+        session: AsyncSession,
+        transactions: typing.Iterable[Row],
+        user_created: typing.Optional[typing.Mapping[int, datetime]] = None,
+    ) -> None:
+        """Count newly inserted transaction rows (as returned by the ledger statements) into the rollups.
+
+        Passing the owners' registration times in `user_created` lets deposits of users registered
+        long ago skip the registration lag query. USD amounts are converted at the rate in effect at
+        each transaction's `created` time.
+        """
+        transactions = list(transactions)
+        rates = await exchange_rate_cache.get(session)
+        deltas: typing.Dict[typing.Tuple[date, str], typing.List[typing.Any]] = defaultdict(MetricsRollupService._empty_transaction_delta)
+        for transaction in transactions:
+            delta = deltas[(transaction.created.astimezone(timezone.utc).date(), str(transaction.currency))]
+            delta[0] += 1
+            if transaction.status != TransactionStatusEnum.ROLLBACKED:
+                delta[1] += 1
+                usd_amount = rates.to_usd(transaction.currency, transaction.amount, transaction.created)
+                if transaction.amount > 0:
+                    delta[2] += Decimal(transaction.amount)
+                    delta[4] += usd_amount
+                elif transaction.amount < 0:
+                    delta[3] += Decimal(transaction.amount)
+                    delta[5] += usd_amount
+        await MetricsRollupService._apply_transaction_deltas(session, deltas)
+
+        deposits = [t for t in transactions if t.amount > 0]
+        if deposits:
+            await MetricsRollupService._refresh_deposit_lags(
+                session, deposits, inserted_ids=[t.id for t in deposits], rollbacked_ids=[], user_created=user_created
+            )
+
+    @staticmethod
+    async def record_rollbacks(
+        session: AsyncSession,
+        transactions: typing.Iterable[Row],
+        user_created: typing.Optional[typing.Mapping[int, datetime]] = None,
+    ) -> None:
+        """Remove transactions that were just rollbacked from the not-rollbacked metrics."""
+        transactions = list(transactions)
+        rates = await exchange_rate_cache.get(session)
+        deltas: typing.Dict[typing.Tuple[date, str], typing.List[typing.Any]] = defaultdict(MetricsRollupService._empty_transaction_delta)
+        for transaction in transactions:
+            delta = deltas[(transaction.created.astimezone(timezone.utc).date(), str(transaction.currency))]
+            delta[1] -= 1
+            usd_amount = rates.to_usd(transaction.currency, transaction.amount, transaction.created)
+            if transaction.amount > 0:
+                delta[2] -= Decimal(transaction.amount)
+                delta[4] -= usd_amount
+            elif transaction.amount < 0:
+                delta[3] -= Decimal(transaction.amount)
+                delta[5] -= usd_amount
+        await MetricsRollupService._apply_transaction_deltas(session, deltas)
+
+        deposits = [t for t in transactions if t.amount > 0]
+        if deposits:
+            await MetricsRollupService._refresh_deposit_lags(
+                session, deposits, inserted_ids=[], rollbacked_ids=[t.id for t in deposits], user_created=user_created
+            )
+
+    @staticmethod
+    def _empty_transaction_delta() -> typing.List[typing.Any]:
+        """Counts, native deposit/withdraw amounts and USD deposit/withdraw amounts, in `TRANSACTION_METRICS` order."""
+        return [0, 0, Decimal(0), Decimal(0), Decimal(0), Decimal(0)]
+
+    @staticmethod
+    async def _apply_transaction_deltas(session: AsyncSession, deltas: typing.Mapping[typing.Tuple[date, str], typing.Sequence[typing.Any]]) -> None:
+        if not deltas:
+            return
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                "day": day,
+                "currency": currency,
+                **dict(zip(TRANSACTION_METRICS, delta)),
+                "updated": now,
+            }
+            for (day, currency), delta in sorted(deltas.items())
+        ]
+        q = insert(DailyTransactionMetrics).values(rows)
+        q = q.on_conflict_do_update(
+            index_elements=[DailyTransactionMetrics.day, DailyTransactionMetrics.currency],
+            set_={
+                **{
+                    field: getattr(DailyTransactionMetrics, field) + getattr(q.excluded, field)
+                    for field in TRANSACTION_METRICS
+                },
+                "updated": q.excluded.updated,
+            },
+        )
+        await session.execute(q)
+
+    @staticmethod
+    async def _apply_registration_deltas(session: AsyncSession, deltas: typing.Mapping[typing.Tuple[date, int], typing.Sequence[int]]) -> None:
+        deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                "day": day,
+                "deposit_lag": lag,
+                "deposit_users_count": delta[0],
+                "not_rollbacked_deposit_users_count": delta[1],
+                "updated": now,
+            }
+            for (day, lag), delta in sorted(deltas.items())
+        ]
+        q = insert(DailyRegistrationMetrics).values(rows)
+        q = q.on_conflict_do_update(
+            index_elements=[DailyRegistrationMetrics.day, DailyRegistrationMetrics.deposit_lag],
+            set_={
+                "deposit_users_count": DailyRegistrationMetrics.deposit_users_count + q.excluded.deposit_users_count,
+                "not_rollbacked_deposit_users_count": (
+                    DailyRegistrationMetrics.not_rollbacked_deposit_users_count + q.excluded.not_rollbacked_deposit_users_count
+                ),
+                "updated": q.excluded.updated,
+            },
+        )
+        await session.execute(q)
+
+    @staticmethod
+    def _lag_window(
+        transaction_created: typing.Any, user_created: typing.Any, lag_days: int = REGISTRATION_LAG_DAYS
+    ) -> typing.Any:
+        """Timestamp bounds implied by `0 <= lag < lag_days`, usable by the (user_id, created) index."""
+        return and_(
+            transaction_created > user_created - timedelta(days=1),
+            transaction_created < user_created + timedelta(days=lag_days),
+        )
+
+    @staticmethod
+    async def _refresh_deposit_lags(
+        session: AsyncSession,
+        deposits: typing.Sequence[Row],
+        inserted_ids: typing.Sequence[int],
+        rollbacked_ids: typing.Sequence[int],
+        user_created: typing.Optional[typing.Mapping[int, datetime]] = None,
+    ) -> None:
+        """Move users between lag buckets after their deposits were inserted or rollbacked.
+
+        The lags before the change are derived from the current rows by ignoring the inserted
+        transactions and treating the rollbacked ones as still processed, so no per-user state is stored.
+        """
+        if user_created is not None:
+            deposits = [
+                t for t in deposits
+                if 0 <= (t.created.astimezone(timezone.utc).date() - user_created[t.user_id].astimezone(timezone.utc).date()).days < REGISTRATION_LAG_DAYS
+            ]
+            if not deposits:
+                return
+        user_ids = sorted({t.user_id for t in deposits})
+        # Serialize concurrent deposits of a user (e.g. in different currencies, which lock different
+        # balances): otherwise neither sees the other's insert and both move the user out of the same
+        # bucket. The lag query below is a new statement, so it sees what the lock holder committed.
+        # FOR NO KEY UPDATE does not conflict with the key share locks of foreign key checks.
+        await session.execute(select(User.id).where(User.id.in_(user_ids)).order_by(User.id).with_for_update(key_share=True))
+        earliest_day = min(t.created.astimezone(timezone.utc).date() for t in deposits)
+        reg_day = utc_day(User.created)
+        lag = utc_day(Transaction.created) - reg_day
+        in_lag_window = MetricsRollupService._lag_window(Transaction.created, User.created)
+        inserted = Transaction.id.in_(inserted_ids)
+        rollbacked = Transaction.id.in_(rollbacked_ids)
+        not_rollbacked = Transaction.status != TransactionStatusEnum.ROLLBACKED
+
+        q = (
+            select(
+                reg_day.label("day"),
+                func.min(lag).label("lag"),
+                func.min(lag).filter(~inserted).label("previous_lag"),
+                func.min(lag).filter(not_rollbacked).label("not_rollbacked_lag"),
+                func.min(lag).filter(~inserted & (not_rollbacked | rollbacked)).label("previous_not_rollbacked_lag"),
+            )
+            .select_from(User)
+            .join(
+                Transaction,
+                and_(Transaction.user_id == User.id, Transaction.amount > 0, lag >= 0, lag < REGISTRATION_LAG_DAYS, in_lag_window),
+            )
+            .where(
+                User.id.in_(user_ids),
+                User.created >= datetime.combine(earliest_day - timedelta(days=REGISTRATION_LAG_DAYS - 1), time.min, tzinfo=timezone.utc),
+            )
+            .group_by(User.id)
+        )
+        deltas: typing.Dict[typing.Tuple[date, int], typing.List[int]] = defaultdict(lambda: [0, 0])
+
+        def bucket(value: typing.Optional[int]) -> int:
+            return REGISTRATION_LAG_DAYS if value is None else int(value)
+
+        for row in (await session.execute(q)).all():
+            if bucket(row.previous_lag) != bucket(row.lag):
+                deltas[(row.day, bucket(row.previous_lag))][0] -= 1
+                deltas[(row.day, bucket(row.lag))][0] += 1
+            if bucket(row.previous_not_rollbacked_lag) != bucket(row.not_rollbacked_lag):
+                deltas[(row.day, bucket(row.previous_not_rollbacked_lag))][1] -= 1
+                deltas[(row.day, bucket(row.not_rollbacked_lag))][1] += 1
+        await MetricsRollupService._apply_registration_deltas(session, deltas)
+
+    @staticmethod
+    async def get_weekly_analysis(session: AsyncSession, end_date: date, weeks: int = 52) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Read the weekly analysis from the rollups; same payload as `AnalyticsService.get_weekly_analysis`."""
+        dt_gt = end_date - timedelta(weeks=weeks) + timedelta(days=1)
+        end = literal(end_date, Date)
+
+        transaction_week = (end - DailyTransactionMetrics.day) // 7
+        transactions = (
+            select(
+                transaction_week.label("week"),
+                func.sum(DailyTransactionMetrics.transactions_count).label("transactions_count"),
+                func.sum(DailyTransactionMetrics.not_rollbacked_transactions_count).label("not_rollbacked_transactions_count"),
+                func.sum(DailyTransactionMetrics.not_rollbacked_deposit_amount_usd).label("not_rollbacked_deposit_amount"),
+                func.sum(DailyTransactionMetrics.not_rollbacked_withdraw_amount_usd).label("not_rollbacked_withdraw_amount"),
+            )
+            .where(DailyTransactionMetrics.day >= dt_gt, DailyTransactionMetrics.day <= end_date)
+            .group_by(transaction_week)
+            .cte("transactions")
+        )
+
+        # A user registered `n` days before the end of its week counts as depositing in that week
+        # when the first deposit came at most `n` days after registration.
+        days_to_week_end = (end - DailyRegistrationMetrics.day) % 7
+        in_week = DailyRegistrationMetrics.deposit_lag <= days_to_week_end
+        registration_week = (end - DailyRegistrationMetrics.day) // 7
+        registrations = (
+            select(
+                registration_week.label("week"),
+                func.sum(DailyRegistrationMetrics.deposit_users_count).label("registered_users_count"),
+                func.sum(DailyRegistrationMetrics.deposit_users_count).filter(in_week).label("registered_and_deposit_users_count"),
+                func.sum(DailyRegistrationMetrics.not_rollbacked_deposit_users_count)
+                .filter(in_week)
+                .label("registered_and_not_rollbacked_deposit_users_count"),
+            )
+            .where(DailyRegistrationMetrics.day >= dt_gt, DailyRegistrationMetrics.day <= end_date)
+            .group_by(registration_week)
+            .cte("registrations")
+        )
+
+        q = select(
+            func.coalesce(transactions.c.week, registrations.c.week).label("week"),
+            *(func.coalesce(registrations.c[field], 0).label(field) for field in ANALYSIS_FIELDS[:3]),
+            *(func.coalesce(transactions.c[field], 0).label(field) for field in ANALYSIS_FIELDS[3:]),
+        ).select_from(transactions.join(registrations, transactions.c.week == registrations.c.week, full=True))
+        rows = {int(row.week): row for row in (await session.execute(q)).all()}
+        return AnalyticsService.build_weekly_results(rows, end_date, weeks)
+
+    @staticmethod
+    async def get_bucket_analysis(
+        session: AsyncSession, buckets: typing.Sequence[typing.Tuple[date, date]]
+    ) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Read the analysis metrics of arbitrary inclusive day ranges from the rollups, one dict per bucket.
+
+        Buckets longer than `REGISTRATION_LAG_DAYS` days would miss later deposits of their first days.
+        """
+        bucket_values = values(
+            column("bucket", Integer), column("start_date", Date), column("end_date", Date), name="buckets", literal_binds=True
+        ).data([(i, start, end) for i, (start, end) in enumerate(buckets)])
+        # Literal VALUES are typed as text by Postgres.
+        start_date, end_date = cast(bucket_values.c.start_date, Date), cast(bucket_values.c.end_date, Date)
+
+        transactions = (
+            select(
+                bucket_values.c.bucket,
+                func.sum(DailyTransactionMetrics.transactions_count).label("transactions_count"),
+                func.sum(DailyTransactionMetrics.not_rollbacked_transactions_count).label("not_rollbacked_transactions_count"),
+                func.sum(DailyTransactionMetrics.not_rollbacked_deposit_amount_usd).label("not_rollbacked_deposit_amount"),
+                func.sum(DailyTransactionMetrics.not_rollbacked_withdraw_amount_usd).label("not_rollbacked_withdraw_amount"),
+            )
+            .select_from(bucket_values)
+            .join(DailyTransactionMetrics, DailyTransactionMetrics.day.between(start_date, end_date))
+            .group_by(bucket_values.c.bucket)
+        )
+        in_bucket = DailyRegistrationMetrics.deposit_lag <= end_date - DailyRegistrationMetrics.day
+        registrations = (
+            select(
+                bucket_values.c.bucket,
+                func.sum(DailyRegistrationMetrics.deposit_users_count).label("registered_users_count"),
+                func.sum(DailyRegistrationMetrics.deposit_users_count).filter(in_bucket).label("registered_and_deposit_users_count"),
+                func.sum(DailyRegistrationMetrics.not_rollbacked_deposit_users_count)
+                .filter(in_bucket)
+                .label("registered_and_not_rollbacked_deposit_users_count"),
+            )
+            .select_from(bucket_values)
+            .join(DailyRegistrationMetrics, DailyRegistrationMetrics.day.between(start_date, end_date))
+            .group_by(bucket_values.c.bucket)
+        )
+
+        results: typing.List[typing.Dict[str, typing.Any]] = [{"start_date": start, "end_date": end} for start, end in buckets]
+        rows = {row.bucket: row for row in (await session.execute(registrations)).all()}
+        for i, result in enumerate(results):
+            for field in ANALYSIS_FIELDS[:3]:
+                result[field] = int(getattr(rows[i], field) or 0) if i in rows else 0
+        rows = {row.bucket: row for row in (await session.execute(transactions)).all()}
+        for i, result in enumerate(results):
+            for field in ANALYSIS_FIELDS[3:]:
+                value = getattr(rows[i], field) or 0 if i in rows else 0
+                result[field] = float(value) if field in AMOUNT_FIELDS else int(value)
+        return results
+
+    @staticmethod
+    async def backfill(session: AsyncSession, dt_gt: date, dt_lt: date, chunk_days: int = 30) -> None:
+        """Rebuild the rollups for days in [dt_gt, dt_lt] from `transaction` and `user`, one chunk per commit.
+
+        Each chunk locks the rollup tables against concurrent writers, so the rebuilt rows and the
+        deltas applied by the write path never double count.
+        """
+        chunk_start = dt_gt
+        while chunk_start <= dt_lt:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), dt_lt)
+            await session.execute(text("LOCK TABLE daily_transaction_metrics, daily_registration_metrics IN SHARE ROW EXCLUSIVE MODE"))
+            await MetricsRollupService._backfill_transactions(session, chunk_start, chunk_end)
+            await MetricsRollupService._backfill_registrations(session, chunk_start, chunk_end)
+            await session.commit()
+            chunk_start = chunk_end + timedelta(days=1)
+
+    @staticmethod
+    async def _backfill_transactions(session: AsyncSession, dt_gt: date, dt_lt: date) -> None:
+        await session.execute(
+            delete(DailyTransactionMetrics).where(DailyTransactionMetrics.day >= dt_gt, DailyTransactionMetrics.day <= dt_lt)
+        )
+        day = utc_day(Transaction.created)
+        not_rollbacked = Transaction.status != TransactionStatusEnum.ROLLBACKED
+        usd_amount = Transaction.amount * ExchangeRate.rate_to_usd
+        source = (
+            select(
+                day,
+                Transaction.currency,
+                func.count(),
+                func.count().filter(not_rollbacked),
+                func.coalesce(func.sum(Transaction.amount).filter(not_rollbacked & (Transaction.amount > 0)), 0),
+                func.coalesce(func.sum(Transaction.amount).filter(not_rollbacked & (Transaction.amount < 0)), 0),
+                func.coalesce(func.sum(usd_amount).filter(not_rollbacked & (Transaction.amount > 0)), 0),
+                func.coalesce(func.sum(usd_amount).filter(not_rollbacked & (Transaction.amount < 0)), 0),
+                func.now(),
+            )
+            .select_from(Transaction)
+            .outerjoin(ExchangeRate, ExchangeRateService.rate_in_effect(Transaction.currency, Transaction.created))
+            .where(utc_day_range(Transaction.created, dt_gt, dt_lt))
+            .group_by(day, Transaction.currency)
+        )
+        await session.execute(
+            insert(DailyTransactionMetrics).from_select(["day", "currency", *TRANSACTION_METRICS, "updated"], source)
+        )
+
+    @staticmethod
+    async def _backfill_registrations(session: AsyncSession, dt_gt: date, dt_lt: date) -> None:
+        await session.execute(
+            delete(DailyRegistrationMetrics).where(DailyRegistrationMetrics.day >= dt_gt, DailyRegistrationMetrics.day <= dt_lt)
+        )
+        source = MetricsRollupService.registration_rollup_source(REGISTRATION_LAG_DAYS, dt_gt, dt_lt)
+        await session.execute(insert(DailyRegistrationMetrics).from_select(REGISTRATION_METRICS, source))
+
+    @staticmethod
+    def registration_rollup_source(
+        lag_days: int, dt_gt: typing.Optional[date] = None, dt_lt: typing.Optional[date] = None
+    ) -> Select:
+        """Rows of `daily_registration_metrics` (columns `REGISTRATION_METRICS`) computed from `user` and `transaction`.
+
+        Covers the users registered on days [dt_gt, dt_lt], or all of them; migrations rebuilding the
+        rollup with another `lag_days` use it too.
+        """
+        reg_day = utc_day(User.created)
+        lag = utc_day(Transaction.created) - reg_day
+        in_lag_window = MetricsRollupService._lag_window(Transaction.created, User.created, lag_days)
+        not_rollbacked = Transaction.status != TransactionStatusEnum.ROLLBACKED
+        users = (
+            select(
+                reg_day.label("day"),
+                func.coalesce(func.min(lag), lag_days).label("lag"),
+                func.coalesce(func.min(lag).filter(not_rollbacked), lag_days).label("not_rollbacked_lag"),
+            )
+            .select_from(User)
+            .outerjoin(
+                Transaction,
+                and_(Transaction.user_id == User.id, Transaction.amount > 0, lag >= 0, lag < lag_days, in_lag_window),
+            )
+            .group_by(User.id)
+        )
+        if dt_gt is not None and dt_lt is not None:
+            users = users.where(utc_day_range(User.created, dt_gt, dt_lt))
+        users_cte = users.cte("users")
+        buckets = union_all(
+            select(users_cte.c.day, users_cte.c.lag, literal_column("1").label("deposit"), literal_column("0").label("not_rollbacked")),
+            select(users_cte.c.day, users_cte.c.not_rollbacked_lag, literal_column("0"), literal_column("1")),
+        ).subquery("buckets")
+        return select(
+            buckets.c.day,
+            buckets.c.lag,
+            func.sum(buckets.c.deposit),
+            func.sum(buckets.c.not_rollbacked),
+            func.now(),
+        ).group_by(buckets.c.day, buckets.c.lag)
+
+
+async def main() -> None:
+    """Backfill the rollups from existing data: `python -m services.metrics_rollup --chunk-days 30`."""
+    from db.db import async_session_maker
+
+    parser = argparse.ArgumentParser(description="Rebuild the daily metrics rollups from existing data.")
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="first day to rebuild, defaults to the oldest row")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last day to rebuild, defaults to today")
+    parser.add_argument("--chunk-days", type=int, default=30, help="days rebuilt per database transaction")
+    args = parser.parse_args()
+
+    async with async_session_maker() as session:
+        dt_gt = args.start
+        if dt_gt is None:
+            oldest = await session.execute(
+                select(func.least(select(utc_day(func.min(User.created))).scalar_subquery(), select(utc_day(func.min(Transaction.created))).scalar_subquery()))
+            )
+            dt_gt = oldest.scalar() or datetime.now(timezone.utc).date()
+        dt_lt = args.end or datetime.now(timezone.utc).date()
+        await MetricsRollupService.backfill(session, dt_gt, dt_lt, chunk_days=args.chunk_days)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
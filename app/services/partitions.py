@@ -0,0 +1,154 @@
+"""Monthly range partitions of the `transaction` table: creation ahead of time and archival of old months."""
+
+import gzip
+import logging
+import os
+import re
+import typing
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "transaction"
+DEFAULT_PARTITION = "transaction_default"
+PARTITION_NAME = re.compile(r"^transaction_p(\d{4})(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"transaction_p{month:%Y%m}"
+
+
+def partition_bounds(month: date) -> typing.Tuple[str, str]:
+    """UTC timestamps bounding the month, as literals for partition DDL."""
+    return f"'{month:%Y-%m-%d} 00:00:00+00'", f"'{add_months(month, 1):%Y-%m-%d} 00:00:00+00'"
+
+
+class PartitionService:
+
+    @staticmethod
+    async def list_partitions(session: AsyncSession) -> typing.Dict[date, bool]:
+        """Monthly partition tables by month, mapped to whether they are attached to `transaction`."""
+        rows = await session.execute(
+            text(
+                "SELECT c.relname, i.inhparent IS NOT NULL AS attached FROM pg_class c "
+                "LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = CAST(:parent AS regclass) "
+                "WHERE c.relkind IN ('r', 'p') AND c.relname LIKE 'transaction\\_p%' "
+                "AND c.relnamespace = CAST(current_schema() AS regnamespace)"
+            ),
+            {"parent": f'"{PARENT_TABLE}"'},
+        )
+        partitions = {}
+        for name, attached in rows:
+            match = PARTITION_NAME.match(name)
+            if match:
+                partitions[date(int(match.group(1)), int(match.group(2)), 1)] = attached
+        return dict(sorted(partitions.items()))
+
+    @staticmethod
+    async def create_partition(session: AsyncSession, month: date) -> None:
+        """Create and attach the partition of `month`, moving its rows out of the default partition.
+
+        Attaching a bare table validated by a CHECK constraint, instead of `CREATE TABLE ... PARTITION OF`,
+        works even when rows of that month already landed in the default partition.
+        """
+        name = partition_name(month)
+        lower, upper = partition_bounds(month)
+        for statement in (
+            f'CREATE TABLE {name} (LIKE "{PARENT_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK (created >= {lower} AND created < {upper})",
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created >= {lower} AND created < {upper} RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            f'ALTER TABLE "{PARENT_TABLE}" ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})',
+            f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds",
+        ):
+            await session.execute(text(statement))
+        await session.commit()
+
+    @staticmethod
+    async def ensure_partitions(
+        session: AsyncSession, months_ahead: int, today: typing.Optional[date] = None
+    ) -> typing.List[str]:
+        """Create the missing partitions from the current month up to `months_ahead` months ahead.
+
+        Months with rows in the default partition (e.g. loaded after the migration) get their own
+        partition as well, so that queries on them are pruned too.
+        """
+        current = month_start(today or datetime.now(timezone.utc).date())
+        existing = await PartitionService.list_partitions(session)
+        stray = await session.execute(
+            text(f"SELECT DISTINCT CAST(date_trunc('month', created AT TIME ZONE 'UTC') AS date) FROM {DEFAULT_PARTITION}")
+        )
+        months = {add_months(current, offset) for offset in range(months_ahead + 1)} | set(stray.scalars())
+        created = []
+        for month in sorted(months):
+            if month not in existing:
+                await PartitionService.create_partition(session, month)
+                created.append(partition_name(month))
+        return created
+
+    @staticmethod
+    async def archive_partition(engine: AsyncEngine, month: date, archive_dir: str, attached: bool = True) -> Path:
+        """Detach the partition of `month`, export it to `<archive_dir>/<partition>.csv.gz` and drop it.
+
+        Each step can be retried: a partition already detached by an interrupted run is exported again.
+        """
+        name = partition_name(month)
+        if attached:
+            async with engine.begin() as conn:
+                # Detaching locks the whole table; give up rather than queue behind long-running queries.
+                await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                await conn.execute(text(f'ALTER TABLE "{PARENT_TABLE}" DETACH PARTITION {name}'))
+
+        path = Path(archive_dir) / f"{name}.csv.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(".gz.partial")
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = typing.cast(asyncpg.Connection, raw.driver_connection)
+            with gzip.open(partial, "wb") as archive:
+
+                async def write(chunk: bytes) -> None:
+                    archive.write(chunk)
+
+                await driver.copy_from_table(name, output=write, format="csv", header=True)
+        os.replace(partial, path)
+
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        return path
+
+    @staticmethod
+    async def archive_old_partitions(
+        session: AsyncSession,
+        engine: AsyncEngine,
+        retention_months: int,
+        archive_dir: str,
+        today: typing.Optional[date] = None,
+    ) -> typing.List[Path]:
+        """Archive the partitions of months ending more than `retention_months` months ago (0 keeps all)."""
+        if retention_months <= 0:
+            return []
+        cutoff = add_months(month_start(today or datetime.now(timezone.utc).date()), -retention_months)
+        partitions = await PartitionService.list_partitions(session)
+        await session.commit()
+        archived = []
+        for month, attached in partitions.items():
+            if month >= cutoff:
+                break
+            archived.append(await PartitionService.archive_partition(engine, month, archive_dir, attached))
+            logger.info("Archived transactions of %s to %s", f"{month:%Y-%m}", archived[-1])
+        return archived
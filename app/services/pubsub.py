@@ -0,0 +1,135 @@
+"""Minimal publish/subscribe used to broadcast cache invalidations to every API worker."""
+
+import asyncio
+import logging
+import typing
+
+import asyncpg
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = typing.Callable[[str], None]
+ReconnectHandler = typing.Callable[[], None]
+
+
+class InMemoryPubSub:
+    """Delivers messages to the subscribers of this process only; a stand-in for tests and single-process runs."""
+
+    def __init__(self) -> None:
+        self._handlers: typing.Dict[str, typing.List[Handler]] = {}
+        self._reconnect_handlers: typing.List[ReconnectHandler] = []
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_reconnect(self, handler: ReconnectHandler) -> None:
+        """Call `handler` after the subscription was re-established, as messages may have been missed meanwhile."""
+        self._reconnect_handlers.append(handler)
+
+    async def publish(self, channel: str, message: str) -> None:
+        self._deliver(channel, message)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def _deliver(self, channel: str, message: str) -> None:
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(message)
+            except Exception:
+                logger.exception("Pub/sub handler for %s failed", channel)
+
+    def _reconnected(self) -> None:
+        for handler in self._reconnect_handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception("Pub/sub reconnect handler failed")
+
+
+class PostgresPubSub(InMemoryPubSub):
+    """Broadcasts through Postgres LISTEN/NOTIFY, so every process connected to the database receives messages.
+
+    Listening needs a session-level connection, so it uses its own direct connection outside the pool
+    (and must bypass PgBouncer in transaction mode). When that connection is lost it is re-established in
+    the background, retrying every `pubsub_reconnect_seconds`, and the `on_reconnect` handlers are called.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._connection: typing.Optional[asyncpg.Connection] = None
+        self._lock = asyncio.Lock()
+        self._lost = asyncio.Event()
+        self._supervisor: typing.Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self._connect()
+        self._supervisor = asyncio.create_task(self._reconnect_loop())
+
+    async def stop(self) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+
+    async def publish(self, channel: str, message: str) -> None:
+        if self._connection is None:
+            # Not started (e.g. a script or a Celery task) or reconnecting: only this process can be notified.
+            self._deliver(channel, message)
+            return
+        async with self._lock:
+            await self._connection.execute("SELECT pg_notify($1, $2)", channel, message)
+
+    async def _connect(self) -> None:
+        connection = await asyncpg.connect(
+            user=settings.db_user,
+            password=settings.db_password,
+            host=settings.db_host,
+            port=settings.db_port,
+            database=settings.db_name,
+        )
+        for channel in self._handlers:
+            await connection.add_listener(channel, self._on_notification)
+        connection.add_termination_listener(self._on_termination)
+        self._lost.clear()
+        self._connection = connection
+
+    async def _reconnect_loop(self) -> None:
+        while True:
+            await self._lost.wait()
+            self._connection = None
+            logger.warning("Pub/sub connection lost, reconnecting")
+            while True:
+                try:
+                    await self._connect()
+                    break
+                except (OSError, asyncpg.PostgresError) as e:
+                    logger.warning("Pub/sub reconnect failed: %s", e)
+                    await asyncio.sleep(settings.pubsub_reconnect_seconds)
+            self._reconnected()
+
+    def _on_termination(self, connection: typing.Any) -> None:
+        if connection is self._connection:
+            self._lost.set()
+
+    def _on_notification(self, connection: typing.Any, pid: int, channel: str, payload: str) -> None:
+        self._deliver(channel, payload)
+
+
+PubSub = typing.Union[InMemoryPubSub, PostgresPubSub]
+
+
+def build_pubsub() -> PubSub:
+    if settings.pubsub_backend == "postgres":
+        return PostgresPubSub()
+    return InMemoryPubSub()
+
+
+pubsub = build_pubsub()
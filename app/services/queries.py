@@ -1,101 +1,97 @@
 """Database query functions for analytics."""
 
-from datetime import date
+import typing
+from datetime import date, datetime, time, timedelta, timezone
 
-from db.models import Transaction, User
-from schemas.pydantic_models import CurrencyEnum
-from sqlalchemy import func, select
+from db.models import ExchangeRate, Transaction, User
+from services.exchange_rates import ExchangeRateService
+from sqlalchemy import and_, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
-class QueryService:
+def utc_day(column: typing.Any) -> typing.Any:
+    """SQL expression for the UTC calendar day of a timestamp column."""
+    return func.date(func.timezone("UTC", column))
+
+
+def utc_day_range(column: typing.Any, dt_gt: date, dt_lt: date) -> typing.Any:
+    """Half-open timestamp range covering the UTC days `dt_gt`..`dt_lt` inclusive.
 
-    EXCHANGE_RATES_TO_USD = {
-        CurrencyEnum.USD: 1,
-        CurrencyEnum.EUR: 0.9342,
-        CurrencyEnum.AUD: 0.5447,
-        CurrencyEnum.CAD: 0.6162,
-        CurrencyEnum.ARS: 0.0009,
-        CurrencyEnum.PLN: 0.2343,
-        CurrencyEnum.BTC: 100000.0,
-        CurrencyEnum.ETH: 3557.3476,
-        CurrencyEnum.DOGE: 0.3627,
-        CurrencyEnum.USDT: 0.9709,
-    }
+    Unlike comparing `utc_day(column)`, the bare column comparison can use an index on `column`.
+    """
+    return and_(
+        column >= datetime.combine(dt_gt, time.min, tzinfo=timezone.utc),
+        column < datetime.combine(dt_lt + timedelta(days=1), time.min, tzinfo=timezone.utc),
+    )
+
+
+class QueryService:
 
     @staticmethod
     async def get_registered_users_count(session: AsyncSession, dt_gt: date, dt_lt: date) -> int:
         """Get count of registered users in date range."""
-        q = select(User).where((func.date(User.created) >= dt_gt) & (func.date(User.created) <= dt_lt))
-        registered_users = await session.execute(q)
-        registered_users = registered_users.fetchall()
-        return len(registered_users)
+        q = select(func.count()).select_from(User).where(utc_day_range(User.created, dt_gt, dt_lt))
+        result = await session.execute(q)
+        return int(result.scalar_one())
 
     @staticmethod
     async def get_registered_and_deposit_users_count(session: AsyncSession, dt_gt: date, dt_lt: date) -> int:
         """Get count of registered users who made deposits in date range."""
-        result = 0
-        q = select(User).where((func.date(User.created) >= dt_gt) & (func.date(User.created) <= dt_lt))
-        registered_users = await session.execute(q)
-        registered_users = registered_users.scalars()
-        for user in registered_users:
-            q = select(Transaction).where((func.date(Transaction.created) >= dt_gt) & (func.date(Transaction.created) <= dt_lt) & (Transaction.user_id == user.id) & (Transaction.amount > 0))
-            deposits = await session.execute(q)
-            deposits = deposits.fetchall()
-            if len(deposits) > 0:
-                result += 1
-        return result
+        deposits = select(Transaction.id).where(
+            utc_day_range(Transaction.created, dt_gt, dt_lt) & (Transaction.user_id == User.id) & (Transaction.amount > 0))
+        q = select(func.count()).select_from(User).where(
+            utc_day_range(User.created, dt_gt, dt_lt) & deposits.exists())
+        result = await session.execute(q)
+        return int(result.scalar_one())
 
     @staticmethod
     async def get_registered_and_not_rollbacked_deposit_users_count(
         session: AsyncSession, dt_gt: date, dt_lt: date
     ) -> int:
         """Get count of registered users with non-rollbacked deposits in date range."""
-        result = 0
-        q = select(User).where((func.date(User.created) >= dt_gt) & (func.date(User.created) <= dt_lt))
-        registered_users = await session.execute(q)
-        registered_users = registered_users.scalars()
-        for user in registered_users:
-            q = select(Transaction).where(
-                (func.date(Transaction.created) >= dt_gt) & (func.date(Transaction.created) <= dt_lt) & (Transaction.user_id == user.id) & (Transaction.amount > 0) & (Transaction.status != "ROLLBACKED"))
-            not_rollbacked_deposits = await session.execute(q)
-            not_rollbacked_deposits = not_rollbacked_deposits.fetchall()
-            if len(not_rollbacked_deposits) > 0:
-                result += 1
-        return result
+        not_rollbacked_deposits = select(Transaction.id).where(
+            utc_day_range(Transaction.created, dt_gt, dt_lt) & (Transaction.user_id == User.id) & (Transaction.amount > 0) & (Transaction.status != "ROLLBACKED"))
+        q = select(func.count()).select_from(User).where(
+            utc_day_range(User.created, dt_gt, dt_lt) & not_rollbacked_deposits.exists())
+        result = await session.execute(q)
+        return int(result.scalar_one())
 
     @staticmethod
     async def get_not_rollbacked_deposit_amount(session: AsyncSession, dt_gt: date, dt_lt: date) -> float:
         """Get total amount of non-rollbacked deposits in USD in date range."""
-        q = select(Transaction).where((func.date(Transaction.created) >= dt_gt) & (func.date(Transaction.created) <= dt_lt) & (Transaction.amount > 0) & (Transaction.status != "ROLLBACKED"))
-        not_rollbacked_deposits = await session.execute(q)
-        not_rollbacked_deposits = not_rollbacked_deposits.scalars()
-        total = sum([float(x.amount) * QueryService.EXCHANGE_RATES_TO_USD[CurrencyEnum(x.currency)] for x in not_rollbacked_deposits])
-        return float(total)
+        q = (
+            select(func.coalesce(func.sum(Transaction.amount * ExchangeRate.rate_to_usd), 0))
+            .select_from(Transaction)
+            .join(ExchangeRate, ExchangeRateService.rate_in_effect(Transaction.currency, Transaction.created))
+            .where(utc_day_range(Transaction.created, dt_gt, dt_lt) & (Transaction.amount > 0) & (Transaction.status != "ROLLBACKED"))
+        )
+        result = await session.execute(q)
+        return float(result.scalar_one())
 
     @staticmethod
     async def get_not_rollbacked_withdraw_amount(session: AsyncSession, dt_gt: date, dt_lt: date) -> float:
         """Get total amount of non-rollbacked withdrawals in USD in date range."""
-        q = select(Transaction).where(
-            (func.date(Transaction.created) >= dt_gt) & (func.date(Transaction.created) <= dt_lt) & (Transaction.amount < 0) & (Transaction.status != "ROLLBACKED"))
-        not_rollbacked_withdraws = await session.execute(q)
-        not_rollbacked_withdraws = not_rollbacked_withdraws.scalars()
-        return float(sum([float(x.amount) * QueryService.EXCHANGE_RATES_TO_USD[CurrencyEnum(x.currency)] for x in not_rollbacked_withdraws]))
+        q = (
+            select(func.coalesce(func.sum(Transaction.amount * ExchangeRate.rate_to_usd), 0))
+            .select_from(Transaction)
+            .join(ExchangeRate, ExchangeRateService.rate_in_effect(Transaction.currency, Transaction.created))
+            .where(utc_day_range(Transaction.created, dt_gt, dt_lt) & (Transaction.amount < 0) & (Transaction.status != "ROLLBACKED"))
+        )
+        result = await session.execute(q)
+        return float(result.scalar_one())
 
     @staticmethod
     async def get_transactions_count(session: AsyncSession, dt_gt: date, dt_lt: date) -> int:
         """Get count of transactions in date range."""
-        q = select(Transaction).where(
-            (func.date(Transaction.created) >= dt_gt) & (func.date(Transaction.created) <= dt_lt))
-        transactions = await session.execute(q)
-        transactions = transactions.fetchall()
-        return len(transactions)
+        q = select(func.count()).select_from(Transaction).where(
+            utc_day_range(Transaction.created, dt_gt, dt_lt))
+        result = await session.execute(q)
+        return int(result.scalar_one())
 
     @staticmethod
     async def get_not_rollbacked_transactions_count(session: AsyncSession, dt_gt: date, dt_lt: date) -> int:
         """Get count of non-rollbacked transactions in date range."""
-        q = select(Transaction).where(
-            (func.date(Transaction.created) >= dt_gt) & (func.date(Transaction.created) <= dt_lt) & (Transaction.status != "ROLLBACKED"))
-        transactions = await session.execute(q)
-        transactions = transactions.fetchall()
-        return len(transactions)
+        q = select(func.count()).select_from(Transaction).where(
+            utc_day_range(Transaction.created, dt_gt, dt_lt) & (Transaction.status != "ROLLBACKED"))
+        result = await session.execute(q)
+        return int(result.scalar_one())
@@ -1,54 +1,82 @@
 """Database query functions for analytics."""
 
+import base64
+import hashlib
+import json
 import typing
-from typing import cast
+from datetime import datetime
 
-from db.db import commit_and_refresh
 from db.models import Transaction
 from fastapi import status
 from schemas.enums import TransactionStatusEnum, TransactionTypeEnum
-from schemas.exceptions import TransactionNotExistsException
+from schemas.exceptions import InvalidCursorException
 from schemas.pydantic_models import CurrencyEnum
-from sqlalchemy import select
+from services.ledger import TRANSACTION_COLUMNS
+from sqlalchemy import literal, select, tuple_
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class TransactionService:
 
     @staticmethod
-    async def create_transaction(session: AsyncSession, user_id: int, currency: CurrencyEnum, amount: float, type: TransactionTypeEnum) -> Transaction:
-        transaction = Transaction(user_id=user_id, currency=currency, amount=amount, type=type)
-        session.add(transaction)
-        await session.commit()
-        return transaction
+    async def select_transactions(
+        session: AsyncSession,
+        user_id: typing.Optional[int] = None,
+        currency: typing.Optional[CurrencyEnum] = None,
+        status: typing.Optional[TransactionStatusEnum] = None,
+        type: typing.Optional[TransactionTypeEnum] = None,
+        created_from: typing.Optional[datetime] = None,
+        created_to: typing.Optional[datetime] = None,
+        cursor: typing.Optional[typing.Tuple[datetime, int]] = None,
+        limit: typing.Optional[int] = None,
+    ) -> typing.List[Row]:
+        """Select transaction rows newest first, optionally one keyset page after `cursor`."""
+        q = select(*TRANSACTION_COLUMNS).order_by(Transaction.created.desc(), Transaction.id.desc())
+        if user_id is not None:
+            q = q.where(Transaction.user_id == user_id)
+        if currency is not None:
+            q = q.where(Transaction.currency == currency)
+        if status is not None:
+            q = q.where(Transaction.status == status)
+        if type is not None:
+            q = q.where(Transaction.type == type)
+        if created_from is not None:
+            q = q.where(Transaction.created >= created_from)
+        if created_to is not None:
+            q = q.where(Transaction.created < created_to)
+        if cursor is not None:
+            created, transaction_id = cursor
+            q = q.where(
+                tuple_(Transaction.created, Transaction.id)
+                < tuple_(literal(created, Transaction.created.type), literal(transaction_id, Transaction.id.type))
+            )
+        if limit is not None:
+            q = q.limit(limit)
+        transactions = await session.execute(q)
+        return list(transactions.all())
 
     @staticmethod
-    async def select_transaction(session: AsyncSession, transaction_id: int) -> Transaction:
-        q = select(Transaction).where(Transaction.id == transaction_id)
-        result = await session.execute(q)
-        transaction = result.scalar_one_or_none()
-
-        if not transaction:
-            raise TransactionNotExistsException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Transaction with id=`{transaction_id}` does not exist"
-            )
-        return cast(Transaction, transaction)
+    def encode_cursor(transaction: typing.Union[Transaction, Row], filters: typing.Mapping[str, typing.Any]) -> str:
+        """Encode the keyset position of `transaction`, and the filters of its page, as an opaque cursor."""
+        position = json.dumps([transaction.created.isoformat(), transaction.id, TransactionService._filters_digest(filters)])
+        return base64.urlsafe_b64encode(position.encode()).decode()
 
     @staticmethod
-    async def select_transactions(session: AsyncSession, user_id: typing.Optional[int] = None) -> typing.List[Transaction]:
-        if user_id is not None:
-            q = select(Transaction).where(Transaction.user_id == user_id).order_by(Transaction.created.desc())
-        else:
-            q = select(Transaction).order_by(Transaction.created.desc())
-        transactions = await session.execute(q)
-        transactions = transactions.scalars()
-        return list(transactions)
+    def decode_cursor(cursor: str, filters: typing.Mapping[str, typing.Any]) -> typing.Tuple[datetime, int]:
+        """Decode a cursor of `encode_cursor`, rejecting it when it was issued for other `filters`."""
+        try:
+            created, transaction_id, digest = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position = datetime.fromisoformat(created), int(transaction_id)
+        except (ValueError, TypeError):
+            raise InvalidCursorException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+        if digest != TransactionService._filters_digest(filters):
+            raise InvalidCursorException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Pagination cursor was issued for other filters"
+            )
+        return position
 
     @staticmethod
-    async def update_transaction(session: AsyncSession, transaction_id: int, status: TransactionStatusEnum) -> Transaction:
-        result = await session.execute(select(Transaction).where(Transaction.id == transaction_id))
-        transaction = result.scalar_one()
-        transaction.status = status
-        await commit_and_refresh(session, transaction)
-        return cast(Transaction, transaction)
+    def _filters_digest(filters: typing.Mapping[str, typing.Any]) -> str:
+        canonical = json.dumps({key: value for key, value in filters.items() if value is not None}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()[:16]
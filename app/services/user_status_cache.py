@@ -0,0 +1,91 @@
+"""Bounded in-process cache of user id -> (status, created) for the transaction hot path."""
+
+import time
+import typing
+from collections import OrderedDict
+from datetime import datetime
+
+from config.settings import settings
+from schemas.enums import UserStatusEnum
+from services.pubsub import pubsub
+
+USER_STATUS_CHANNEL = "user_status_changed"
+
+
+class CachedUser(typing.NamedTuple):
+    status: UserStatusEnum
+    created: datetime
+    expires_at: float
+
+
+class UserStatusCache:
+    """LRU cache with a TTL that bounds staleness.
+
+    Status changes invalidate the entry in every worker through `pubsub`, and the whole cache is cleared when
+    the pub/sub connection comes back, as invalidations sent meanwhile were missed. Should one still be lost,
+    an entry is never served for longer than `ttl` seconds after it was read from the database, so a
+    blocked user can be treated as active for at most `ttl` seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, CachedUser]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> typing.Optional[CachedUser]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry
+
+    def set(self, user_id: int, status: UserStatusEnum, created: datetime) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[user_id] = CachedUser(UserStatusEnum(status), created, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    async def publish_invalidation(self, user_id: int) -> None:
+        """Drop the user's entry here and in every other worker; call after the status change is committed."""
+        self.invalidate(user_id)
+        await pubsub.publish(USER_STATUS_CHANNEL, str(user_id))
+
+    def on_message(self, message: str) -> None:
+        self.invalidate(int(message))
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+user_status_cache = UserStatusCache(settings.user_status_cache_size, settings.user_status_cache_ttl_seconds)
+pubsub.subscribe(USER_STATUS_CHANNEL, user_status_cache.on_message)
+pubsub.on_reconnect(user_status_cache.clear)
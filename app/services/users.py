@@ -1,12 +1,21 @@
-from typing import Optional, cast
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, cast
 
-from db.models import User
+from db.models import User, UserBalance
 from fastapi import status
+from schemas.enums import UserStatusEnum
 from schemas.exceptions import UserAlreadyExistsException, UserNotExistsException
 from schemas.pydantic_models import RequestUserModel, RequestUserUpdateModel
-from sqlalchemy import select
+from services.balance import BalanceService
+from services.metrics_rollup import MetricsRollupService
+from services.user_status_cache import user_status_cache
+from sqlalchemy import ARRAY, String, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+
+# Emails inserted per statement by `UserService.create_users`; each chunk also inserts a balance row per currency.
+BULK_CHUNK_SIZE = 10_000
 
 
 class UserService:
@@ -37,8 +46,18 @@ class UserService:
         return list(users)
 
     @staticmethod
-    async def select_users_with_balances(session: AsyncSession, user_id: Optional[int] = None, email: Optional[str] = None, user_status: Optional[str] = None) -> list[User]:
-        q = select(User).options(joinedload(User.user_balance)).order_by(User.created.desc())
+    async def select_user_balance_rows(
+        session: AsyncSession, user_id: Optional[int] = None, email: Optional[str] = None, user_status: Optional[str] = None
+    ) -> List[Row]:
+        """Select one row per (user, balance), oldest user first and each user's balances by ascending amount.
+
+        Users without balances come back as a single row with NULL currency and amount.
+        """
+        q = (
+            select(User.id, User.email, User.status, User.created, UserBalance.currency, UserBalance.amount)
+            .outerjoin(UserBalance, UserBalance.user_id == User.id)
+            .order_by(User.created, User.id, UserBalance.amount)
+        )
         if user_id is not None:
             q = q.where(User.id == user_id)
         if email is not None:
@@ -46,28 +65,53 @@ class UserService:
         if user_status is not None:
             q = q.where(User.status == user_status)
         result = await session.execute(q)
-        users = result.unique().scalars().all()
-        return list(users)
+        return list(result.all())
 
     @staticmethod
-    async def create_user(session: AsyncSession, user: RequestUserModel) -> User:
-        db_user = await session.execute(select(User).where(User.email == user.email))
-        if db_user.scalar():
+    async def create_user(session: AsyncSession, user: RequestUserModel) -> Row:
+        """Create a user together with its balances in one database transaction."""
+        created, existing = await UserService.create_users(session, [user.email])
+        if existing:
             raise UserAlreadyExistsException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"User with email=`{user.email}` already exists"
             )
+        return created[0]
+
+    @staticmethod
+    async def create_users(session: AsyncSession, emails: Sequence[str]) -> Tuple[List[Row], List[str]]:
+        """Create active users with zero balances for every new email and commit once.
 
-        db_user = User(email=user.email, status="ACTIVE")
-        session.add(db_user)
+        Emails that are already registered are detected by the insert itself (`ON CONFLICT DO NOTHING`)
+        and returned separately, in request order.
+        """
+        emails = list(dict.fromkeys(emails))
+        created: Dict[str, Row] = {}
+        for start in range(0, len(emails), BULK_CHUNK_SIZE):
+            chunk = func.unnest(literal(emails[start:start + BULK_CHUNK_SIZE], ARRAY(String))).table_valued("email").render_derived()
+            source = select(
+                chunk.c.email,
+                literal(UserStatusEnum.ACTIVE, User.status.type),
+                literal(datetime.now(timezone.utc), User.created.type),
+            )
+            q = (
+                insert(User)
+                .from_select(["email", "status", "created"], source)
+                .on_conflict_do_nothing(index_elements=[User.email])
+                .returning(User.id, User.email, User.status, User.created)
+            )
+            rows = (await session.execute(q)).all()
+            await BalanceService.create_balances(session, [row.id for row in rows])
+            await MetricsRollupService.record_registrations(session, rows)
+            created.update((row.email, row) for row in rows)
         await session.commit()
-        await session.refresh(db_user)
 
-        return cast(User, db_user)
+        return [created[email] for email in emails if email in created], [email for email in emails if email not in created]
 
     @staticmethod
     async def update_user(session: AsyncSession, user: RequestUserUpdateModel, db_user: User) -> User:
         db_user.status = user.status
         await session.commit()
+        await user_status_cache.publish_invalidation(db_user.id)
         await session.refresh(db_user)
         return db_user
@@ -0,0 +1,273 @@
+"""Benchmark the API endpoints and the analysis against the Postgres database configured in settings.
+
+The real FastAPI app is driven in-process through httpx's ASGI transport, so the numbers include routing,
+validation, serialization and the database, but no network. Results are written as JSON; pass a previous
+report as `--baseline` to exit non-zero when latencies or query counts regress:
+
+    DB_HOST=localhost python benchmarks/bench_api.py --seed --scale 1m --output report.json
+    DB_HOST=localhost python benchmarks/bench_api.py --baseline report.json --max-regression 0.25
+
+Seeding truncates the application tables (see `seed.py`). Any Postgres 16 works, including an embedded
+one such as the `pgserver` package; the queries rely on Postgres-only SQL, so SQLite cannot stand in.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import typing
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+from seed import SCALES, seed  # noqa: E402
+from sqlalchemy import event, func, select  # noqa: E402
+
+# Metrics compared against the baseline, and whether a higher value is worse.
+COMPARED_METRICS = {"p50_ms": True, "p99_ms": True, "queries_per_request": True, "throughput_rps": False}
+
+
+class QueryCounter:
+    """Counts statements executed through an engine."""
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args: typing.Any) -> None:
+        self.count += 1
+
+
+def percentile(values: typing.Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, well defined for small samples."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+async def run_scenario(
+    name: str,
+    requests: int,
+    concurrency: int,
+    send: typing.Callable[[int], typing.Awaitable[httpx.Response]],
+    counter: QueryCounter,
+) -> typing.Dict[str, typing.Any]:
+    latencies: typing.List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    result = {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries_per_request": (counter.count - queries_before) / requests,
+    }
+    print(
+        f"{name:<24} {result['throughput_rps']:>8.1f} rps  p50 {result['p50_ms']:>7.2f} ms  "
+        f"p99 {result['p99_ms']:>7.2f} ms  {result['queries_per_request']:>5.1f} q/req  {errors} errors",
+        file=sys.stderr,
+    )
+    return result
+
+
+async def run_api(requests: int, concurrency: int, counter: QueryCounter) -> typing.Dict[str, typing.Any]:
+    from db.db import async_session_maker
+    from db.models import User
+    from main import app
+
+    async with async_session_maker() as session:
+        max_user_id = (await session.execute(select(func.max(User.id)))).scalar() or 0
+    if max_user_id == 0:
+        raise SystemExit("The database has no users; run with --seed first")
+
+    rng = random.Random(0)
+    user_ids = [rng.randint(1, max_user_id) for _ in range(requests)]
+    run_id = uuid.uuid4().hex[:8]
+    deposits: typing.List[typing.Tuple[int, int]] = []
+    results: typing.Dict[str, typing.Any] = {}
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+
+            async def deposit(i: int) -> httpx.Response:
+                response = await client.post(f"/transactions/{user_ids[i]}/deposit", json={"currency": "USD", "amount": "1"})
+                if response.status_code == 200:
+                    deposits.append((user_ids[i], response.json()["id"]))
+                return response
+
+            async def withdraw(i: int) -> httpx.Response:
+                return await client.post(f"/transactions/{user_ids[i]}/withdraw", json={"currency": "USD", "amount": "1"})
+
+            async def rollback(i: int) -> httpx.Response:
+                user_id, transaction_id = deposits[i % len(deposits)]
+                return await client.patch(f"/transactions/{user_id}/rollback/{transaction_id}")
+
+            async def create_user(i: int) -> httpx.Response:
+                return await client.post("/users", json={"email": f"bench-{run_id}-{i}@example.com"})
+
+            async def list_user_transactions(i: int) -> httpx.Response:
+                return await client.get("/transactions", params={"user_id": user_ids[i], "limit": 100})
+
+            async def list_transactions(i: int) -> httpx.Response:
+                return await client.get("/transactions", params={"limit": 100})
+
+            async def list_users(i: int) -> httpx.Response:
+                return await client.get("/users", params={"user_id": user_ids[i]})
+
+            scenarios: typing.Dict[str, typing.Callable[[int], typing.Awaitable[httpx.Response]]] = {
+                "deposit": deposit,
+                "withdraw": withdraw,
+                "rollback": rollback,
+                "create_user": create_user,
+                "list_user_transactions": list_user_transactions,
+                "list_transactions": list_transactions,
+                "list_users": list_users,
+            }
+            for name, send in scenarios.items():
+                count = min(requests, len(deposits)) if name == "rollback" else requests
+                results[name] = await run_scenario(name, count, concurrency, send, counter)
+    return results
+
+
+async def run_analysis(counter: QueryCounter) -> typing.Dict[str, typing.Any]:
+    from config.settings import settings
+    from db.db import async_session_maker
+    from services.analysis_jobs import (
+        WEEKLY_ANALYSIS_GRANULARITY,
+        WEEKLY_ANALYSIS_PERIODS,
+        analysis_buckets,
+        build_analysis_results,
+    )
+    from services.analytics import AnalyticsService
+    from services.metrics_rollup import MetricsRollupService
+
+    results = {}
+    end_date = datetime.now(timezone.utc).date()
+
+    async def analysis_job(session: typing.Any) -> typing.Any:
+        """What the workers compute for a 52-week analysis job: each chunk of periods, then the merge."""
+        buckets = analysis_buckets(WEEKLY_ANALYSIS_GRANULARITY, WEEKLY_ANALYSIS_PERIODS, end_date)
+        size = settings.analysis_job_chunk_periods
+        metrics = []
+        for i in range(0, len(buckets), size):
+            metrics.extend(await MetricsRollupService.get_bucket_analysis(session, buckets[i:i + size]))
+        return build_analysis_results(metrics)
+
+    jobs: typing.Dict[str, typing.Callable[[typing.Any], typing.Awaitable[typing.Any]]] = {
+        "analysis_job": analysis_job,
+        "scan_analysis": lambda session: AnalyticsService.get_weekly_analysis(session, end_date=end_date),
+    }
+    for name, job in jobs.items():
+        async with async_session_maker() as session:
+            queries_before = counter.count
+            started = time.perf_counter()
+            await job(session)
+            results[name] = {"wall_ms": (time.perf_counter() - started) * 1000, "queries": counter.count - queries_before}
+        print(f"{name:<24} {results[name]['wall_ms']:>8.1f} ms  {results[name]['queries']} queries", file=sys.stderr)
+    return results
+
+
+def compare(report: typing.Dict[str, typing.Any], baseline: typing.Dict[str, typing.Any], max_regression: float) -> typing.List[str]:
+    """Describe every metric that got worse than the baseline by more than `max_regression` (a fraction)."""
+    regressions = []
+    for name, metrics in report["scenarios"].items():
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            old = baseline.get("scenarios", {}).get(name, {}).get(metric)
+            new = metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old if higher_is_worse else (old - new) / old
+            if change > max_regression:
+                regressions.append(f"{name}.{metric}: {old:.2f} -> {new:.2f}")
+    for name, metrics in report["analysis"].items():
+        old_metrics = baseline.get("analysis", {}).get(name, {})
+        if old_metrics.get("wall_ms") and (metrics["wall_ms"] - old_metrics["wall_ms"]) / old_metrics["wall_ms"] > max_regression:
+            regressions.append(f"{name}.wall_ms: {old_metrics['wall_ms']:.1f} -> {metrics['wall_ms']:.1f}")
+        if "queries" in old_metrics and metrics["queries"] > old_metrics["queries"]:
+            regressions.append(f"{name}.queries: {old_metrics['queries']} -> {metrics['queries']}")
+    return regressions
+
+
+def git_revision() -> typing.Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the API and analysis against the configured database.")
+    parser.add_argument("--seed", action="store_true", help="truncate and seed the database first")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k", help="transactions to seed")
+    parser.add_argument("--users", type=int, default=None, help="users to seed, defaults to one per 10 transactions")
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="previous report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed relative slowdown per metric")
+    args = parser.parse_args()
+
+    from db.db import create_db_and_tables, engine
+
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, "before_cursor_execute", counter)
+
+    transactions = SCALES[args.scale]
+    if args.seed:
+        await create_db_and_tables()
+        await seed(engine, args.users or max(transactions // 10, 1), transactions)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "scale": args.scale,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "scenarios": await run_api(args.requests, args.concurrency, counter),
+        "analysis": await run_analysis(counter),
+    }
+    await engine.dispose()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Measure the overhead of the Prometheus instrumentation on requests and SQL statements.
+
+Requests go to a trivial in-memory route with and without `MetricsMiddleware`, so the difference is the
+middleware itself. With `--db`, `SELECT 1` also runs against the configured Postgres with and without
+the statement hooks of `instrument_engine`:
+
+    python benchmarks/bench_metrics.py --requests 20000
+    DB_HOST=localhost python benchmarks/bench_metrics.py --db --queries 20000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import typing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from middleware.metrics import MetricsMiddleware  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+ROUNDS = 5
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/users/{user_id}")
+    async def get_user(user_id: int) -> typing.Dict[str, typing.Any]:
+        return {"id": user_id, "status": "ACTIVE"}
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+async def time_requests(app: FastAPI, requests: int) -> float:
+    """Median over `ROUNDS` of the mean seconds per request."""
+    samples = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            for i in range(requests):
+                await client.get(f"/users/{i}")
+            samples.append((time.perf_counter() - started) / requests)
+    return statistics.median(samples)
+
+
+async def time_queries(queries: int, instrumented: bool) -> float:
+    """Median over `ROUNDS` of the mean seconds per `SELECT 1` on one connection."""
+    from config.settings import settings
+    from db.db import build_engine
+    from monitoring.metrics import instrument_engine
+
+    engine = build_engine(settings.database_url)
+    if instrumented:
+        instrument_engine(engine)
+    samples = []
+    async with engine.connect() as conn:
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            for _ in range(queries):
+                await conn.execute(text("SELECT 1"))
+            samples.append((time.perf_counter() - started) / queries)
+    await engine.dispose()
+    return statistics.median(samples)
+
+
+def report(name: str, plain: float, instrumented: float) -> None:
+    overhead = instrumented - plain
+    print(
+        f"{name:<10} plain {plain * 1e6:>8.1f} us  instrumented {instrumented * 1e6:>8.1f} us  "
+        f"overhead {overhead * 1e6:>6.1f} us ({overhead / plain:+.1%})"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the overhead of the Prometheus instrumentation.")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per round")
+    parser.add_argument("--db", action="store_true", help="also measure the statement hooks against Postgres")
+    parser.add_argument("--queries", type=int, default=5000, help="statements per round")
+    args = parser.parse_args()
+
+    report("request", await time_requests(build_app(False), args.requests), await time_requests(build_app(True), args.requests))
+    if args.db:
+        report("statement", await time_queries(args.queries, False), await time_queries(args.queries, True))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Compare the per-row Pydantic response path with the orjson fast path of the list endpoints.
+
+Rows are generated in memory, so the numbers isolate serialization from the database:
+
+    python benchmarks/bench_serialization.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import statistics
+import sys
+import time
+import typing
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from routers.responses import FastJSONResponse  # noqa: E402
+from schemas.enums import CurrencyEnum, TransactionStatusEnum, TransactionTypeEnum  # noqa: E402
+from schemas.pydantic_models import TransactionModel, TransactionPageModel  # noqa: E402
+
+TransactionRow = collections.namedtuple("TransactionRow", ["id", "user_id", "currency", "amount", "status", "type", "created"])
+
+
+def make_rows(count: int) -> typing.List[TransactionRow]:
+    now = datetime.now(timezone.utc)
+    currencies = list(CurrencyEnum)
+    return [
+        TransactionRow(
+            id=i,
+            user_id=i % 1000,
+            currency=currencies[i % len(currencies)].value,
+            amount=Decimal(i % 10_000) / 100,
+            status=TransactionStatusEnum.PROCESSED,
+            type=TransactionTypeEnum.DEPOSIT,
+            created=now - timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def build_app(rows: typing.List[TransactionRow]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/pydantic", response_model=TransactionPageModel)
+    async def pydantic_path() -> TransactionPageModel:
+        items = [
+            TransactionModel(
+                **{
+                    "id": t.id,
+                    "user_id": t.user_id,
+                    "currency": CurrencyEnum(t.currency),
+                    "amount": t.amount,
+                    "status": TransactionStatusEnum(t.status),
+                    "type": TransactionTypeEnum(t.type),
+                    "created": t.created,
+                }
+            )
+            for t in rows
+        ]
+        return TransactionPageModel(items=items, next_cursor=None)
+
+    @app.get("/fast", response_model=TransactionPageModel)
+    async def fast_path() -> FastJSONResponse:
+        return FastJSONResponse({"items": [t._asdict() for t in rows], "next_cursor": None})
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, repeat: int) -> typing.Tuple[float, bytes]:
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(path)
+        timings.append(time.perf_counter() - start)
+        body = response.content
+    return statistics.median(timings), body
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5, help="requests per size and path; the median is reported")
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'pydantic ms':>12} {'fast ms':>10} {'speedup':>8}  identical")
+    for size in args.sizes:
+        app = build_app(make_rows(size))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            slow, slow_body = await measure(client, "/pydantic", args.repeat)
+            fast, fast_body = await measure(client, "/fast", args.repeat)
+        identical = httpx.Response(200, content=slow_body).json() == httpx.Response(200, content=fast_body).json()
+        print(f"{size:>8} {slow * 1000:>12.1f} {fast * 1000:>10.1f} {slow / fast:>7.1f}x  {identical}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
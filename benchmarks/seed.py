@@ -0,0 +1,107 @@
+"""Seed the configured Postgres database with synthetic users, balances and transactions for benchmarks.
+
+Everything is generated server-side with `generate_series`, so 10M transactions take minutes rather than
+hours. The database is truncated first; never point this at data you want to keep:
+
+    DB_HOST=localhost python benchmarks/seed.py --users 100000 --transactions 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from schemas.enums import CurrencyEnum  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncEngine  # noqa: E402
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Starting balance of every seeded account, large enough that benchmark withdrawals never fail.
+INITIAL_BALANCE = 1_000_000
+
+TABLES = (
+    '"user"',
+    "user_balance",
+    '"transaction"',
+    "daily_transaction_metrics",
+    "daily_registration_metrics",
+    "analysis_job",
+)
+
+CHUNK_SIZE = 1_000_000
+
+
+async def seed(engine: AsyncEngine, users: int, transactions: int, days: int = 365) -> None:
+    """Replace the contents of the application tables with `users` users and `transactions` transactions."""
+    from db.db import async_session_maker
+    from services.exchange_rates import ExchangeRateService
+    from services.metrics_rollup import MetricsRollupService
+
+    currencies = "ARRAY[" + ", ".join(f"'{currency.value}'" for currency in CurrencyEnum) + "]"
+    async with engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+        await conn.execute(
+            text(
+                'INSERT INTO "user" (email, status, created) '
+                "SELECT 'bench' || g || '@example.com', 'ACTIVE', now() - random() * make_interval(days => :days) "
+                "FROM generate_series(1, CAST(:users AS integer)) g"
+            ),
+            {"users": users, "days": days},
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO user_balance (user_id, currency, amount, created) "
+                f'SELECT u.id, c, :balance, u.created FROM "user" u CROSS JOIN unnest({currencies}) c'
+            ),
+            {"balance": INITIAL_BALANCE},
+        )
+
+    for start in range(0, transactions, CHUNK_SIZE):
+        count = min(CHUNK_SIZE, transactions - start)
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(
+                    'INSERT INTO "transaction" (user_id, currency, amount, status, type, created) '
+                    f"SELECT 1 + (g % :users), ({currencies})[1 + g % {len(CurrencyEnum)}], "
+                    "round((random() * 1000)::numeric, 2) + 0.01, "
+                    "(CASE WHEN g % 20 = 0 THEN 'ROLLBACKED' ELSE 'PROCESSED' END)::transactionstatusenum, "
+                    "(CASE WHEN g % 3 = 0 THEN 'WITHDRAW' ELSE 'DEPOSIT' END)::transactiontypeenum, "
+                    "now() - random() * make_interval(days => :days) "
+                    "FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) g"
+                ),
+                {"users": users, "days": days, "start": start + 1, "stop": start + count},
+            )
+        print(f"transactions {start + count}/{transactions} ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+
+    async with engine.connect() as conn:
+        await (await conn.execution_options(isolation_level="AUTOCOMMIT")).execute(text("ANALYZE"))
+
+    today = datetime.now(timezone.utc).date()
+    async with async_session_maker() as session:
+        await ExchangeRateService.seed_default_rates(session)
+        await MetricsRollupService.backfill(session, today - timedelta(days=days + 1), today)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Seed the database configured in settings for benchmarks.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default=None, help="preset number of transactions")
+    parser.add_argument("--transactions", type=int, default=SCALES["10k"])
+    parser.add_argument("--users", type=int, default=None, help="defaults to one user per 10 transactions")
+    args = parser.parse_args()
+
+    from db.db import create_db_and_tables, engine
+
+    transactions = SCALES[args.scale] if args.scale else args.transactions
+    await create_db_and_tables()
+    await seed(engine, args.users or max(transactions // 10, 1), transactions)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""Fixtures shared by the tests: a migrated test database, sessions and an HTTP client for the app.
+
+The database named by DB_NAME (`fastapi_db_test` unless set) is created on the server configured by the
+DB_* variables and migrated once per run; the application tables are emptied before each test using it.
+The migration tests of pytest-alembic get a database of their own, `<DB_NAME>_migrations`, recreated
+empty for each test.
+"""
+
+import json
+import random
+import typing
+from datetime import date, datetime, timedelta, timezone
+
+import asyncpg
+import httpx
+import pytest
+from config.settings import settings
+from sqlalchemy import Engine, create_engine, make_url, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.pool import NullPool
+
+pytest_plugins = ["monitoring.pytest_plugin"]
+
+# Everything but the seeded exchange rates. Ids are not restarted, so that entries of the in-process
+# caches keyed by id (e.g. user statuses) never match rows of a later test.
+APP_TABLES = (
+    '"user"',
+    "user_balance",
+    '"transaction"',
+    "daily_transaction_metrics",
+    "daily_registration_metrics",
+    "analysis_job",
+)
+
+
+async def create_database(name: str) -> None:
+    connection = await asyncpg.connect(
+        user=settings.db_user, password=settings.db_password, host=settings.db_host, port=settings.db_port, database="postgres"
+    )
+    try:
+        if not await connection.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", name):
+            await connection.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await connection.close()
+
+
+@pytest.fixture(scope="session")
+async def migrated_database() -> None:
+    from db.db import prepare_database
+
+    await create_database(settings.db_name)
+    await prepare_database()
+
+
+@pytest.fixture
+async def database(migrated_database: None) -> None:
+    from db.db import engine
+
+    async with engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {', '.join(APP_TABLES)} CASCADE"))
+
+
+@pytest.fixture
+async def session(database: None) -> typing.AsyncIterator[AsyncSession]:
+    from db.db import async_session_maker
+
+    async with async_session_maker() as session:
+        yield session
+
+
+@pytest.fixture
+async def client(database: None) -> typing.AsyncIterator[httpx.AsyncClient]:
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            yield client
+
+
+# Registrations and transactions over these days (and the month after the last one), for comparing the
+# rollups and the analytics index with the raw per-range queries.
+HISTORY_START = date(2026, 1, 5)
+HISTORY_END = date(2026, 2, 22)
+
+
+@pytest.fixture
+async def history(session: AsyncSession) -> typing.Tuple[date, date]:
+    """Seed users with deposits, withdrawals and rollbacks at random times, and backfill the rollups.
+
+    Returns the first and last day with data.
+    """
+    from services.metrics_rollup import MetricsRollupService
+
+    rng = random.Random(0)
+    days = (HISTORY_END - HISTORY_START).days + 1
+    users, transactions = [], []
+    for i in range(60):
+        created = datetime.combine(HISTORY_START, datetime.min.time(), tzinfo=timezone.utc) + timedelta(
+            days=rng.randrange(days), seconds=rng.randrange(86400)
+        )
+        users.append({"email": f"history{i}@example.com", "created": created})
+    result = await session.execute(
+        text("INSERT INTO \"user\" (email, status, created) SELECT email, 'ACTIVE', created FROM json_to_recordset(:users) "
+             "AS u(email text, created timestamptz) RETURNING id, created"),
+        {"users": json.dumps(users, default=str)},
+    )
+    for user_id, created in result.all():
+        for _ in range(rng.randrange(5)):
+            deposit = rng.random() < 0.7
+            transactions.append({
+                "user_id": user_id,
+                "currency": rng.choice(["USD", "EUR", "ARS"]),
+                "amount": str(rng.randrange(1, 500) * (1 if deposit else -1)),
+                "status": "ROLLBACKED" if rng.random() < 0.2 else "PROCESSED",
+                "type": "DEPOSIT" if deposit else "WITHDRAW",
+                "created": str(created + timedelta(days=rng.randrange(40), seconds=rng.randrange(86400))),
+            })
+    await session.execute(
+        text("INSERT INTO \"transaction\" (user_id, currency, amount, status, type, created) "
+             "SELECT user_id, currency, amount, CAST(status AS transactionstatusenum), CAST(type AS transactiontypeenum), created "
+             "FROM json_to_recordset(:transactions) "
+             "AS t(user_id integer, currency text, amount numeric, status text, type text, created timestamptz)"),
+        {"transactions": json.dumps(transactions)},
+    )
+    await session.commit()
+    last = HISTORY_END + timedelta(days=41)
+    await MetricsRollupService.backfill(session, HISTORY_START, last)
+    return HISTORY_START, last
+
+
+RawAnalysis = typing.Callable[[AsyncSession, date, date], typing.Awaitable[typing.Dict[str, typing.Any]]]
+
+
+@pytest.fixture
+def raw_analysis() -> RawAnalysis:
+    """The analysis metrics of the days [start, end], from the per-metric queries over the raw tables."""
+    from services.analytics import ANALYSIS_FIELDS
+    from services.queries import QueryService
+
+    async def analysis(session: AsyncSession, start: date, end: date) -> typing.Dict[str, typing.Any]:
+        return {field: await getattr(QueryService, f"get_{field}")(session, start, end) for field in ANALYSIS_FIELDS}
+
+    return analysis
+
+
+@pytest.fixture
+def alembic_config() -> typing.Dict[str, typing.Any]:
+    return {"file": "app/alembic.ini"}
+
+
+@pytest.fixture
+def alembic_engine() -> typing.Iterator[Engine]:
+    url = make_url(settings.database_url).set(drivername="postgresql+psycopg2", database=f"{settings.db_name}_migrations")
+    server = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT", poolclass=NullPool)
+    with server.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{url.database}" WITH (FORCE)'))
+        conn.execute(text(f'CREATE DATABASE "{url.database}"'))
+    server.dispose()
+
+    engine = create_engine(url, poolclass=NullPool)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,75 @@
+import types
+import typing
+
+import httpx
+import pytest
+from db.pool import PoolWaitStats
+from fastapi import FastAPI
+from middleware.admission import AdmissionControlMiddleware
+from schemas.enums import RequestPriorityEnum
+
+HIGH, NORMAL, LOW, CRITICAL = (
+    RequestPriorityEnum.HIGH,
+    RequestPriorityEnum.NORMAL,
+    RequestPriorityEnum.LOW,
+    RequestPriorityEnum.CRITICAL,
+)
+
+
+@pytest.fixture
+def stats() -> PoolWaitStats:
+    return PoolWaitStats()
+
+
+@pytest.fixture
+def middleware(stats: PoolWaitStats) -> AdmissionControlMiddleware:
+    app = FastAPI()
+
+    @app.get("/users")
+    @app.get("/system/ready")
+    async def ok() -> typing.Dict[str, typing.Any]:
+        return {}
+
+    return AdmissionControlMiddleware(app, pool=typing.cast(typing.Any, types.SimpleNamespace(wait_stats=stats)))
+
+
+def admitted(middleware: AdmissionControlMiddleware) -> typing.Set[RequestPriorityEnum]:
+    return {priority for priority in RequestPriorityEnum if middleware.admit(priority)}
+
+
+def test_low_priority_is_shed_first_as_the_queue_grows(middleware: AdmissionControlMiddleware, stats: PoolWaitStats) -> None:
+    levels = []
+    for waiting in range(0, int(middleware.max_waiting[HIGH]) + 2):
+        stats.waiting = waiting
+        levels.append(admitted(middleware))
+
+    assert levels[0] == {HIGH, NORMAL, LOW, CRITICAL}
+    assert {HIGH, NORMAL, CRITICAL} in levels
+    assert {HIGH, CRITICAL} in levels
+    assert levels[-1] == {CRITICAL}
+    # Once a priority is shed, it stays shed while the queue keeps growing.
+    assert all(later <= earlier for earlier, later in zip(levels, levels[1:]))
+
+
+def test_recent_wait_sheds_by_priority(middleware: AdmissionControlMiddleware, stats: PoolWaitStats) -> None:
+    stats.waiting = 1
+    stats.recent_wait_seconds = (middleware.max_wait_seconds[LOW] + middleware.max_wait_seconds[NORMAL]) / 2
+    assert admitted(middleware) == {HIGH, NORMAL, CRITICAL}
+
+    stats.recent_wait_seconds = middleware.max_wait_seconds[HIGH] * 10
+    assert admitted(middleware) == {CRITICAL}
+
+    # The average is stale once nobody waits.
+    stats.waiting = 0
+    assert admitted(middleware) == {HIGH, NORMAL, LOW, CRITICAL}
+
+
+async def test_shed_requests_get_503_but_critical_ones_pass(middleware: AdmissionControlMiddleware, stats: PoolWaitStats) -> None:
+    stats.waiting = int(middleware.max_waiting[HIGH]) + 1
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test") as client:
+        shed = await client.get("/users")
+        critical = await client.get("/system/ready")
+
+    assert shed.status_code == 503
+    assert shed.headers["retry-after"]
+    assert critical.status_code == 200
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from config.settings import settings
+from db.db import async_session_maker
+from db.models import AnalysisJob
+from schemas.enums import AnalysisJobStatusEnum, AnalyticsGranularityEnum
+from services.analysis_jobs import AnalysisJobService
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+END_DATE = date(2026, 3, 10)
+
+
+@pytest.fixture
+def enqueued(monkeypatch: pytest.MonkeyPatch) -> list:
+    jobs: list = []
+    monkeypatch.setattr(AnalysisJobService, "enqueue_job", lambda job: jobs.append(job.id))
+    return jobs
+
+
+async def submit() -> int:
+    async with async_session_maker() as session:
+        job = await AnalysisJobService.submit_job(session, AnalyticsGranularityEnum.WEEK, 52, END_DATE)
+        return job.id
+
+
+async def test_concurrent_submits_share_one_job(session: AsyncSession, enqueued: list) -> None:
+    job_ids = await asyncio.gather(*(submit() for _ in range(10)))
+
+    assert len(set(job_ids)) == 1
+    assert enqueued == job_ids[:1]
+
+
+async def test_submit_fails_timed_out_job_and_queues_another(session: AsyncSession, enqueued: list) -> None:
+    stale_id = await submit()
+    await session.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == stale_id)
+        .values(
+            status=AnalysisJobStatusEnum.RUNNING,
+            created=datetime.now(timezone.utc) - timedelta(seconds=settings.analysis_job_timeout_seconds + 1),
+        )
+    )
+    await session.commit()
+
+    job_id = await submit()
+
+    assert job_id != stale_id
+    assert enqueued == [stale_id, job_id]
+    stale = (await session.execute(select(AnalysisJob).where(AnalysisJob.id == stale_id))).scalar_one()
+    assert stale.status == AnalysisJobStatusEnum.FAILED
@@ -0,0 +1,70 @@
+"""The analysis chord run eagerly, on the event loop and engine of `worker_resources` as in a worker process."""
+
+import asyncio
+import typing
+from datetime import date
+
+import pytest
+from db.models import AnalysisJob
+from schemas.enums import AnalysisJobStatusEnum, AnalyticsGranularityEnum
+from services.analysis_jobs import AnalysisJobService
+from services.celery import tasks
+from services.celery.celery import celery_app
+from services.celery.resources import worker_resources
+from services.metrics_rollup import MetricsRollupService
+
+WEEKS = 8
+
+
+@pytest.fixture
+def eager(monkeypatch: pytest.MonkeyPatch, database: None) -> typing.Iterator[None]:
+    loop = asyncio.get_event_loop_policy().get_event_loop()
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    monkeypatch.setattr(tasks.settings, "analysis_job_chunk_periods", 3)
+    yield
+    worker_resources.stop()
+    asyncio.set_event_loop(loop)
+
+
+def create_job(end_date: date) -> int:
+    job = worker_resources.run(
+        lambda session: AnalysisJobService.create_job(session, AnalyticsGranularityEnum.WEEK, WEEKS, end_date)
+    )
+    assert job is not None
+    return typing.cast(int, job.id)
+
+
+def select_job(job_id: int) -> AnalysisJob:
+    return worker_resources.run(lambda session: AnalysisJobService.select_job(session, job_id))
+
+
+def test_chunks_are_merged_into_the_job_result(history: typing.Tuple[date, date], eager: None) -> None:
+    _, end_date = history
+    job_id = create_job(end_date)
+
+    tasks.run_analysis_job.delay(job_id)
+
+    job = select_job(job_id)
+    assert job.status == AnalysisJobStatusEnum.SUCCESS
+    assert job.completed_periods == WEEKS
+    expected = worker_resources.run(lambda session: MetricsRollupService.get_weekly_analysis(session, end_date, WEEKS))
+    assert job.result == expected
+    assert len(expected) > 1
+
+
+def test_failed_merge_marks_the_job_failed(
+    history: typing.Tuple[date, date], eager: None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _, end_date = history
+    job_id = create_job(end_date)
+
+    def fail(buckets: typing.Any) -> typing.Any:
+        raise RuntimeError("merge failed")
+
+    monkeypatch.setattr(tasks, "build_analysis_results", fail)
+    tasks.run_analysis_job.delay(job_id)
+
+    job = select_job(job_id)
+    assert job.status == AnalysisJobStatusEnum.FAILED
+    assert job.error == "merge failed"
+    assert job.finished is not None
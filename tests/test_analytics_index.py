@@ -0,0 +1,135 @@
+import typing
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from db.models import DailyRegistrationMetrics, DailyTransactionMetrics
+from schemas.enums import AnalyticsGranularityEnum, CurrencyEnum
+from services.analytics import AMOUNT_FIELDS, ANALYSIS_FIELDS
+from services.analytics_index import REFRESH_OVERLAP, AnalyticsIndex
+from services.metrics_rollup import REGISTRATION_LAG_DAYS
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def new_index() -> AnalyticsIndex:
+    return AnalyticsIndex(REGISTRATION_LAG_DAYS, refresh_seconds=0, full_reload_seconds=3600)
+
+
+async def loaded(session: AsyncSession) -> AnalyticsIndex:
+    index = new_index()
+    await index.load(session)
+    return index
+
+
+def assert_same_metrics(actual: typing.Dict[str, typing.Any], expected: typing.Dict[str, typing.Any]) -> None:
+    for field in ANALYSIS_FIELDS:
+        if field in AMOUNT_FIELDS:
+            assert actual[field] == pytest.approx(expected[field]), field
+        else:
+            assert actual[field] == expected[field], field
+
+
+async def add_transactions_count(session: AsyncSession, day: date, count: int) -> None:
+    q = insert(DailyTransactionMetrics).values(
+        day=day,
+        currency=CurrencyEnum.USD,
+        transactions_count=count,
+        not_rollbacked_transactions_count=count,
+        not_rollbacked_deposit_amount=Decimal(0),
+        not_rollbacked_withdraw_amount=Decimal(0),
+        not_rollbacked_deposit_amount_usd=Decimal(0),
+        not_rollbacked_withdraw_amount_usd=Decimal(0),
+        updated=func.now(),
+    )
+    q = q.on_conflict_do_update(
+        index_elements=[DailyTransactionMetrics.day, DailyTransactionMetrics.currency],
+        set_={"transactions_count": DailyTransactionMetrics.transactions_count + count, "updated": func.now()},
+    )
+    await session.execute(q)
+    await session.commit()
+
+
+def transactions_count(index: AnalyticsIndex, day: date) -> int:
+    return typing.cast(int, index.query(day, day, AnalyticsGranularityEnum.DAY)[0]["transactions_count"])
+
+
+@pytest.mark.parametrize(
+    "granularity, dt_from, dt_to",
+    [
+        (AnalyticsGranularityEnum.DAY, date(2026, 1, 28), date(2026, 2, 8)),
+        (AnalyticsGranularityEnum.WEEK, date(2026, 1, 1), date(2026, 4, 3)),
+        (AnalyticsGranularityEnum.MONTH, date(2025, 12, 20), date(2026, 4, 3)),
+    ],
+)
+async def test_query_matches_the_raw_data(
+    session: AsyncSession,
+    history: typing.Tuple[date, date],
+    raw_analysis: typing.Any,
+    granularity: AnalyticsGranularityEnum,
+    dt_from: date,
+    dt_to: date,
+) -> None:
+    index = await loaded(session)
+
+    buckets = index.query(dt_from, dt_to, granularity)
+
+    assert sum(bucket["registered_users_count"] for bucket in buckets) > 0
+    for bucket in buckets:
+        assert_same_metrics(bucket, await raw_analysis(session, bucket["start_date"], bucket["end_date"]))
+
+
+async def test_refresh_applies_the_changed_days(session: AsyncSession, history: typing.Tuple[date, date]) -> None:
+    first, last = history
+    index = await loaded(session)
+    before = transactions_count(index, first)
+
+    await add_transactions_count(session, first, 3)
+    await add_transactions_count(session, last + timedelta(days=10), 5)
+    await index.refresh(session)
+
+    assert transactions_count(index, first) == before + 3
+    assert transactions_count(index, last + timedelta(days=10)) == 5
+    assert index.query(first, last + timedelta(days=10), AnalyticsGranularityEnum.WEEK) == (
+        await loaded(session)
+    ).query(first, last + timedelta(days=10), AnalyticsGranularityEnum.WEEK)
+
+
+async def test_refresh_rereads_rows_committed_within_the_overlap(session: AsyncSession, database: None) -> None:
+    day, late_day = date(2026, 3, 1), date(2026, 3, 2)
+    await add_transactions_count(session, day, 1)
+    index = await loaded(session)
+    watermark = (await session.execute(select(func.max(DailyTransactionMetrics.updated)))).scalar_one()
+
+    # A row stamped before the watermark but committed after the load, as a slow writer would leave it.
+    await add_transactions_count(session, late_day, 2)
+    await session.execute(
+        update(DailyTransactionMetrics)
+        .where(DailyTransactionMetrics.day == late_day)
+        .values(updated=watermark - REFRESH_OVERLAP / 2)
+    )
+    await session.commit()
+    await add_transactions_count(session, day, 1)
+    await index.refresh(session)
+
+    assert transactions_count(index, day) == 2
+    assert transactions_count(index, late_day) == 2
+
+
+async def test_refresh_reloads_when_a_rollup_shrinks(session: AsyncSession, history: typing.Tuple[date, date]) -> None:
+    first, last = history
+    index = await loaded(session)
+    # What a rollup backfill does to a day whose transactions were all deleted.
+    day = (await session.execute(select(func.max(DailyTransactionMetrics.day)))).scalar_one()
+    assert transactions_count(index, day) > 0
+
+    await session.execute(delete(DailyTransactionMetrics).where(DailyTransactionMetrics.day == day))
+    await session.execute(delete(DailyRegistrationMetrics).where(DailyRegistrationMetrics.day == first))
+    await session.commit()
+    await index.refresh(session)
+
+    assert transactions_count(index, day) == 0
+    assert index.query(first, last, AnalyticsGranularityEnum.WEEK) == (await loaded(session)).query(
+        first, last, AnalyticsGranularityEnum.WEEK
+    )
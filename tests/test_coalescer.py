@@ -0,0 +1,67 @@
+import asyncio
+import typing
+from decimal import Decimal
+
+import pytest
+from db.db import async_session_maker
+from schemas.enums import CurrencyEnum
+from schemas.exceptions import BadRequestDataException
+from schemas.pydantic_models import RequestUserModel
+from services.coalescer import DepositCoalescer
+from services.ledger import LedgerService
+from services.users import UserService
+from sqlalchemy.ext.asyncio import AsyncSession
+
+USD = CurrencyEnum.USD
+
+
+async def create_user(session: AsyncSession) -> int:
+    user = await UserService.create_user(session, RequestUserModel(email="user@example.com"))
+    return typing.cast(int, user.id)
+
+
+async def test_deposits_within_the_window_are_applied_together(session: AsyncSession) -> None:
+    user_id = await create_user(session)
+    coalescer = DepositCoalescer(async_session_maker, window_ms=50, max_batch_size=100)
+
+    rows = await asyncio.gather(*(coalescer.deposit(user_id, USD, Decimal(i + 1)) for i in range(5)))
+
+    assert [row.amount for row in rows] == [Decimal(1), Decimal(2), Decimal(3), Decimal(4), Decimal(5)]
+    assert len({row.id for row in rows}) == 5
+    assert (coalescer.stats.batches, coalescer.stats.max_batch_size) == (1, 5)
+
+
+async def test_a_full_batch_is_flushed_before_the_window_closes(session: AsyncSession) -> None:
+    user_id = await create_user(session)
+    coalescer = DepositCoalescer(async_session_maker, window_ms=60_000, max_batch_size=3)
+
+    rows = await asyncio.wait_for(
+        asyncio.gather(*(coalescer.deposit(user_id, USD, Decimal(10)) for _ in range(6))), timeout=5
+    )
+
+    assert len(rows) == 6
+    assert (coalescer.stats.batches, coalescer.stats.max_batch_size) == (2, 3)
+
+
+async def test_a_rejected_item_fails_only_its_own_request(
+    session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user_id = await create_user(session)
+    apply_batch = LedgerService.apply_batch
+    rejection = BadRequestDataException(status_code=400, detail="rejected")
+
+    async def reject_second(session: AsyncSession, items: typing.Any, atomic: bool) -> typing.Any:
+        assert not atomic
+        outcomes = await apply_batch(session, items[:1] + items[2:], atomic=atomic)
+        return outcomes[:1] + [(None, rejection)] + outcomes[1:]
+
+    monkeypatch.setattr(LedgerService, "apply_batch", reject_second)
+    coalescer = DepositCoalescer(async_session_maker, window_ms=50, max_batch_size=100)
+
+    results = await asyncio.gather(
+        *(coalescer.deposit(user_id, USD, Decimal(i + 1)) for i in range(3)), return_exceptions=True
+    )
+
+    first, second, third = results
+    assert second is rejection
+    assert first.amount == Decimal(1) and third.amount == Decimal(3)
@@ -0,0 +1,53 @@
+import asyncio
+import typing
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from db.db import async_session_maker
+from db.models import ExchangeRate
+from schemas.enums import CurrencyEnum
+from services.exchange_rates import DEFAULT_RATES_TO_USD, EPOCH, ExchangeRateService
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@pytest.fixture
+async def no_rates(session: AsyncSession) -> typing.AsyncIterator[None]:
+    await session.execute(delete(ExchangeRate))
+    await session.commit()
+    yield
+    await session.execute(delete(ExchangeRate))
+    await session.commit()
+    await ExchangeRateService.seed_default_rates(session)
+
+
+async def seed() -> None:
+    async with async_session_maker() as session:
+        await ExchangeRateService.seed_default_rates(session)
+
+
+async def test_concurrent_seeds_insert_each_rate_once(session: AsyncSession, no_rates: None) -> None:
+    await asyncio.gather(*(seed() for _ in range(5)))
+
+    counts = dict((await session.execute(select(ExchangeRate.currency, func.count()).group_by(ExchangeRate.currency))).all())
+    assert counts == {currency.value: 1 for currency in DEFAULT_RATES_TO_USD}
+
+
+async def test_set_rate_splits_the_interval(session: AsyncSession, no_rates: None) -> None:
+    await ExchangeRateService.seed_default_rates(session)
+    valid_from = datetime(2026, 3, 10, tzinfo=timezone.utc)
+
+    await ExchangeRateService.set_rate(session, CurrencyEnum.EUR, Decimal("0.95"), valid_from)
+
+    rates = (
+        await session.execute(
+            select(ExchangeRate.valid_from, ExchangeRate.valid_to, ExchangeRate.rate_to_usd)
+            .where(ExchangeRate.currency == CurrencyEnum.EUR.value)
+            .order_by(ExchangeRate.valid_from)
+        )
+    ).all()
+    assert [tuple(rate) for rate in rates] == [
+        (EPOCH, valid_from, DEFAULT_RATES_TO_USD[CurrencyEnum.EUR]),
+        (valid_from, None, Decimal("0.95")),
+    ]
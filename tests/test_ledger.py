@@ -0,0 +1,130 @@
+import asyncio
+import typing
+from decimal import Decimal
+
+import httpx
+import pytest
+from db.db import async_session_maker
+from db.models import Transaction, UserBalance
+from schemas.enums import CurrencyEnum, TransactionStatusEnum, TransactionTypeEnum
+from schemas.exceptions import (
+    CreateTransactionForBlockedUserException,
+    NegativeBalanceException,
+    TransactionAlreadyRollbackedException,
+    TransactionBatchRolledBackException,
+    TransactionDoesNotBelongToUserException,
+    UpdateTransactionForBlockedUserException,
+)
+from schemas.pydantic_models import RequestBatchTransactionItemModel, RequestUserModel
+from services.ledger import LedgerService
+from services.users import UserService
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+USD = CurrencyEnum.USD
+
+
+async def create_user(session: AsyncSession, email: str = "user@example.com") -> int:
+    user = await UserService.create_user(session, RequestUserModel(email=email))
+    return typing.cast(int, user.id)
+
+
+async def balance(session: AsyncSession, user_id: int, currency: CurrencyEnum = USD) -> Decimal:
+    q = select(UserBalance.amount).where(UserBalance.user_id == user_id, UserBalance.currency == currency)
+    return typing.cast(Decimal, (await session.execute(q)).scalar_one())
+
+
+async def withdraw(user_id: int, amount: Decimal) -> typing.Optional[Exception]:
+    async with async_session_maker() as session:
+        try:
+            await LedgerService.withdraw(session, user_id, USD, amount)
+        except NegativeBalanceException as e:
+            return e
+    return None
+
+
+def item(user_id: int, type: TransactionTypeEnum, amount: str) -> RequestBatchTransactionItemModel:
+    return RequestBatchTransactionItemModel(user_id=user_id, currency=USD, amount=Decimal(amount), type=type)
+
+
+async def test_concurrent_withdrawals_cannot_overdraw(session: AsyncSession) -> None:
+    user_id = await create_user(session)
+    await LedgerService.deposit(session, user_id, USD, Decimal(100))
+
+    errors = await asyncio.gather(*(withdraw(user_id, Decimal(30)) for _ in range(10)))
+
+    assert sum(error is None for error in errors) == 3
+    assert await balance(session, user_id) == Decimal(10)
+    withdrawals = select(func.count()).where(Transaction.user_id == user_id, Transaction.type == TransactionTypeEnum.WITHDRAW)
+    assert (await session.execute(withdrawals)).scalar_one() == 3
+
+
+async def test_blocked_user_is_rejected(client: httpx.AsyncClient, session: AsyncSession) -> None:
+    user_id = await create_user(session)
+    transaction = await LedgerService.deposit(session, user_id, USD, Decimal(100))
+    response = await client.patch(f"/users/{user_id}", json={"status": "BLOCKED"})
+    assert response.status_code == 200
+
+    with pytest.raises(CreateTransactionForBlockedUserException):
+        await LedgerService.deposit(session, user_id, USD, Decimal(10))
+    with pytest.raises(CreateTransactionForBlockedUserException):
+        await LedgerService.withdraw(session, user_id, USD, Decimal(10))
+    with pytest.raises(UpdateTransactionForBlockedUserException):
+        await LedgerService.rollback(session, user_id, transaction.id)
+    assert await balance(session, user_id) == Decimal(100)
+
+
+async def test_double_rollback_is_rejected(session: AsyncSession) -> None:
+    user_id = await create_user(session)
+    await LedgerService.deposit(session, user_id, USD, Decimal(100))
+    transaction = await LedgerService.withdraw(session, user_id, USD, Decimal(40))
+
+    rollbacked = await LedgerService.rollback(session, user_id, transaction.id)
+    assert rollbacked.status == TransactionStatusEnum.ROLLBACKED
+    with pytest.raises(TransactionAlreadyRollbackedException):
+        await LedgerService.rollback(session, user_id, transaction.id)
+    assert await balance(session, user_id) == Decimal(100)
+
+
+async def test_rollback_of_another_users_transaction_is_rejected(session: AsyncSession) -> None:
+    owner_id = await create_user(session, "owner@example.com")
+    other_id = await create_user(session, "other@example.com")
+    transaction = await LedgerService.deposit(session, owner_id, USD, Decimal(100))
+    await LedgerService.deposit(session, other_id, USD, Decimal(100))
+
+    with pytest.raises(TransactionDoesNotBelongToUserException):
+        await LedgerService.rollback(session, other_id, transaction.id)
+    assert await balance(session, owner_id) == Decimal(100)
+    assert await balance(session, other_id) == Decimal(100)
+
+
+async def test_atomic_batch_applies_nothing_when_an_item_is_rejected(session: AsyncSession) -> None:
+    user_id = await create_user(session)
+    items = [
+        item(user_id, TransactionTypeEnum.DEPOSIT, "50"),
+        item(user_id, TransactionTypeEnum.WITHDRAW, "80"),
+    ]
+
+    results = await LedgerService.apply_batch(session, items, atomic=True)
+
+    assert [row for row, _ in results] == [None, None]
+    assert isinstance(results[0][1], TransactionBatchRolledBackException)
+    assert isinstance(results[1][1], NegativeBalanceException)
+    assert await balance(session, user_id) == Decimal(0)
+
+
+async def test_best_effort_batch_applies_the_accepted_items_in_order(session: AsyncSession) -> None:
+    user_id = await create_user(session)
+    items = [
+        item(user_id, TransactionTypeEnum.DEPOSIT, "50"),
+        item(user_id, TransactionTypeEnum.WITHDRAW, "80"),
+        item(user_id, TransactionTypeEnum.WITHDRAW, "30"),
+    ]
+
+    results = await LedgerService.apply_batch(session, items, atomic=False)
+
+    (first, first_error), (second, second_error), (third, third_error) = results
+    assert first is not None and first_error is None and first.amount == Decimal(50)
+    assert second is None and isinstance(second_error, NegativeBalanceException)
+    assert third is not None and third_error is None and third.amount == Decimal(30)
+    assert await balance(session, user_id) == Decimal(20)
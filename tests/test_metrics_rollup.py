@@ -0,0 +1,65 @@
+import asyncio
+import typing
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from db.db import async_session_maker
+from db.models import DailyRegistrationMetrics
+from schemas.enums import CurrencyEnum
+from schemas.pydantic_models import RequestUserModel
+from services.analytics import AMOUNT_FIELDS
+from services.ledger import LedgerService
+from services.metrics_rollup import REGISTRATION_LAG_DAYS, MetricsRollupService
+from services.users import UserService
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+USERS = 20
+
+
+async def deposit(user_id: int, currency: CurrencyEnum) -> None:
+    async with async_session_maker() as session:
+        await LedgerService.deposit(session, user_id, currency, Decimal(10))
+
+
+async def test_concurrent_first_deposits_count_the_user_once(session: AsyncSession) -> None:
+    user_ids = []
+    for i in range(USERS):
+        user = await UserService.create_user(session, RequestUserModel(email=f"user{i}@example.com"))
+        user_ids.append(user.id)
+
+    # The first deposits of a user in two currencies lock different balances, so only the lock on the
+    # user keeps both from moving the user out of the "no deposit" bucket.
+    await asyncio.gather(
+        *(deposit(user_id, currency) for user_id in user_ids for currency in (CurrencyEnum.USD, CurrencyEnum.EUR))
+    )
+
+    deposited = DailyRegistrationMetrics.deposit_lag < REGISTRATION_LAG_DAYS
+    counts = {
+        row.deposited: row.users
+        for row in await session.execute(
+            select(deposited.label("deposited"), func.sum(DailyRegistrationMetrics.deposit_users_count).label("users"))
+            .group_by("deposited")
+        )
+    }
+    assert counts == {True: USERS, False: 0}
+
+
+async def test_weekly_analysis_from_the_rollups_matches_the_raw_queries(
+    session: AsyncSession, history: typing.Tuple[date, date], raw_analysis: typing.Any
+) -> None:
+    _, end_date = history
+    weeks = 12
+
+    results = await MetricsRollupService.get_weekly_analysis(session, end_date, weeks)
+
+    expected = []
+    for week in range(weeks):
+        week_end = end_date - timedelta(weeks=week)
+        metrics = await raw_analysis(session, week_end - timedelta(days=6), week_end)
+        if any(metrics.values()):
+            expected.append({"start_date": str(week_end - timedelta(days=6)), "end_date": str(week_end), **metrics})
+    assert len(results) == len(expected) > 1
+    for result, row in zip(results, expected):
+        assert result == {field: pytest.approx(row[field]) if field in AMOUNT_FIELDS else row[field] for field in row}
@@ -0,0 +1,73 @@
+import typing
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pytest_alembic import MigrationContext
+from pytest_alembic.tests import (  # noqa: F401
+    test_model_definitions_match_ddl,
+    test_single_head_revision,
+    test_up_down_consistency,
+    test_upgrade,
+)
+from sqlalchemy import Connection, Engine, text
+
+USER_ID = 7
+
+QUERIES = {
+    # Keyset pagination over a half-open range of `created`.
+    "ix_transaction_created_id": (
+        "SELECT id FROM \"transaction\" WHERE created >= :dt_from AND created < :dt_to ORDER BY created, id LIMIT 50"
+    ),
+    "ix_transaction_user_id_created": (
+        "SELECT id FROM \"transaction\" WHERE user_id = :user_id AND created >= :dt_from AND created < :dt_to"
+    ),
+    "ix_transaction_created_not_rollbacked": (
+        "SELECT count(*) FROM \"transaction\" WHERE created >= :dt_from AND created < :dt_to AND status <> 'ROLLBACKED'"
+    ),
+}
+
+
+def index_names(plan: typing.Any) -> typing.Iterator[str]:
+    if isinstance(plan, dict):
+        if "Index Name" in plan:
+            yield plan["Index Name"]
+        for value in plan.values():
+            yield from index_names(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from index_names(value)
+
+
+def parent_index(conn: Connection, name: str) -> str:
+    """The index of the partitioned `transaction` table that the index of one of its partitions belongs to."""
+    parent = conn.execute(
+        text(
+            "SELECT p.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE c.relname = :name"
+        ),
+        {"name": name},
+    ).scalar()
+    return typing.cast(str, parent or name)
+
+
+@pytest.mark.parametrize("index", list(QUERIES))
+def test_transaction_lookups_use_indexes(alembic_runner: MigrationContext, alembic_engine: Engine, index: str) -> None:
+    alembic_runner.migrate_up_to("heads")
+
+    with alembic_engine.connect() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO \"transaction\" (user_id, currency, amount, status, type, created) "
+                "SELECT g % 100, 'USD', 10, CAST(CASE WHEN g % 10 = 0 THEN 'ROLLBACKED' ELSE 'PROCESSED' END "
+                "AS transactionstatusenum), 'DEPOSIT', now() - g * interval '1 hour' FROM generate_series(1, 5000) g"
+            )
+        )
+        conn.execute(text('ANALYZE "transaction"'))
+        conn.execute(text("SET enable_seqscan = off"))
+        now = datetime.now(timezone.utc)
+        plan = conn.execute(
+            text(f"EXPLAIN (FORMAT JSON) {QUERIES[index]}"),
+            {"user_id": USER_ID, "dt_from": now - timedelta(days=30), "dt_to": now},
+        ).scalar()
+
+        assert index in {parent_index(conn, name) for name in index_names(plan)}
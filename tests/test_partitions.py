@@ -0,0 +1,79 @@
+import csv
+import gzip
+import typing
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import pytest
+from db.db import engine
+from services.partitions import DEFAULT_PARTITION, PartitionService, partition_name
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Far enough ahead that neither the migration nor the maintenance task has created these partitions.
+TODAY = date(2090, 1, 15)
+
+
+@pytest.fixture
+async def far_partitions(session: AsyncSession) -> typing.AsyncIterator[None]:
+    yield
+    months = [month for month in await PartitionService.list_partitions(session) if month >= TODAY.replace(day=1)]
+    # Release the locks the test's session holds on the partitions before dropping them.
+    await session.rollback()
+    async with engine.begin() as conn:
+        for month in months:
+            await conn.execute(text(f"DROP TABLE {partition_name(month)}"))
+
+
+async def add_transaction(session: AsyncSession, created: datetime) -> None:
+    await session.execute(
+        text("INSERT INTO \"transaction\" (user_id, currency, amount, status, type, created) VALUES (1, 'USD', 10, 'PROCESSED', 'DEPOSIT', :created)"),
+        {"created": created},
+    )
+    await session.commit()
+
+
+async def count(session: AsyncSession, table: str) -> int:
+    return typing.cast(int, (await session.execute(text(f"SELECT count(*) FROM {table}"))).scalar_one())
+
+
+async def test_ensure_partitions_creates_the_missing_months(session: AsyncSession, far_partitions: None) -> None:
+    created = await PartitionService.ensure_partitions(session, months_ahead=2, today=TODAY)
+
+    assert created == ["transaction_p209001", "transaction_p209002", "transaction_p209003"]
+    partitions = await PartitionService.list_partitions(session)
+    assert all(partitions[date(2090, month, 1)] for month in (1, 2, 3))
+    assert await PartitionService.ensure_partitions(session, months_ahead=2, today=TODAY) == []
+
+
+async def test_create_partition_moves_rows_out_of_the_default_partition(
+    session: AsyncSession, far_partitions: None
+) -> None:
+    await add_transaction(session, datetime(2090, 6, 10, tzinfo=timezone.utc))
+    assert await count(session, DEFAULT_PARTITION) == 1
+
+    created = await PartitionService.ensure_partitions(session, months_ahead=0, today=TODAY)
+
+    assert created == ["transaction_p209001", "transaction_p209006"]
+    assert await count(session, DEFAULT_PARTITION) == 0
+    assert await count(session, partition_name(date(2090, 6, 1))) == 1
+    assert await count(session, '"transaction"') == 1
+
+
+async def test_archive_partition_exports_and_drops_the_month(
+    session: AsyncSession, far_partitions: None, tmp_path: Path
+) -> None:
+    month = date(2090, 1, 1)
+    await PartitionService.create_partition(session, month)
+    await add_transaction(session, datetime(2090, 1, 20, tzinfo=timezone.utc))
+    await add_transaction(session, datetime(2090, 1, 21, tzinfo=timezone.utc))
+
+    path = await PartitionService.archive_partition(engine, month, str(tmp_path))
+
+    assert path == tmp_path / "transaction_p209001.csv.gz"
+    assert not path.with_suffix(".gz.partial").exists()
+    with gzip.open(path, "rt") as archive:
+        rows = list(csv.DictReader(archive))
+    assert [row["created"][:10] for row in rows] == ["2090-01-20", "2090-01-21"]
+    assert month not in await PartitionService.list_partitions(session)
+    assert await count(session, '"transaction"') == 0
@@ -0,0 +1,100 @@
+import asyncio
+import typing
+from datetime import datetime, timezone
+
+import pytest
+import services.pubsub
+import services.user_status_cache
+from schemas.enums import UserStatusEnum
+from services.pubsub import InMemoryPubSub, PostgresPubSub
+from services.user_status_cache import USER_STATUS_CHANNEL, UserStatusCache
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+ACTIVE = UserStatusEnum.ACTIVE
+CREATED = datetime(2026, 3, 10, tzinfo=timezone.utc)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(services.user_status_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    cache = UserStatusCache(max_size=2, ttl=60)
+    cache.set(1, ACTIVE, CREATED)
+    cache.set(2, ACTIVE, CREATED)
+    assert cache.get(1) is not None
+
+    cache.set(3, ACTIVE, CREATED)
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+    assert cache.evictions == 1
+
+
+def test_entry_expires_after_ttl(clock: Clock) -> None:
+    cache = UserStatusCache(max_size=10, ttl=5)
+    cache.set(1, ACTIVE, CREATED)
+
+    clock.now += 4.9
+    assert cache.get(1) == (ACTIVE, CREATED, 1005.0)
+    clock.now += 0.1
+    assert cache.get(1) is None
+    assert cache.as_dict()["size"] == 0
+
+
+async def test_invalidation_reaches_every_subscribed_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    pubsub = InMemoryPubSub()
+    monkeypatch.setattr(services.user_status_cache, "pubsub", pubsub)
+    caches = [UserStatusCache(max_size=10, ttl=60) for _ in range(2)]
+    for cache in caches:
+        pubsub.subscribe(USER_STATUS_CHANNEL, cache.on_message)
+        cache.set(1, ACTIVE, CREATED)
+        cache.set(2, ACTIVE, CREATED)
+
+    await caches[0].publish_invalidation(1)
+
+    assert [cache.get(1) for cache in caches] == [None, None]
+    assert all(cache.get(2) is not None for cache in caches)
+
+
+async def test_postgres_pubsub_reconnects_and_clears_the_cache(
+    session: AsyncSession, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(services.pubsub.settings, "pubsub_reconnect_seconds", 0.05)
+    pubsub = PostgresPubSub()
+    cache = UserStatusCache(max_size=10, ttl=60)
+    received: typing.List[str] = []
+    reconnected = asyncio.Event()
+    pubsub.subscribe(USER_STATUS_CHANNEL, received.append)
+    pubsub.on_reconnect(cache.clear)
+    pubsub.on_reconnect(reconnected.set)
+    await pubsub.start()
+    try:
+        cache.set(1, ACTIVE, CREATED)
+        pid = pubsub._connection.get_server_pid()  # type: ignore[union-attr]
+        await session.execute(text("SELECT pg_terminate_backend(:pid)"), {"pid": pid})
+        await session.commit()
+
+        await asyncio.wait_for(reconnected.wait(), timeout=5)
+        assert cache.get(1) is None
+
+        await pubsub.publish(USER_STATUS_CHANNEL, "7")
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+        assert received == ["7"]
+    finally:
+        await pubsub.stop()
@@ -0,0 +1,71 @@
+from datetime import date, datetime, timezone
+
+import pytest
+from db.db import engine
+from monitoring.query_budget import instrument_engine, track_queries
+from services.queries import QueryService
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DAY = date(2026, 3, 10)
+
+
+async def seed_depositing_users(session: AsyncSession, first: int, count: int) -> None:
+    """Insert `count` users registered on DAY, each with a processed and a rollbacked deposit."""
+    created = datetime(DAY.year, DAY.month, DAY.day, 12, tzinfo=timezone.utc)
+    result = await session.execute(
+        text(
+            "INSERT INTO \"user\" (email, status, created) "
+            "SELECT 'user' || g || '@example.com', 'ACTIVE', :created "
+            "FROM generate_series(CAST(:first AS integer), CAST(:last AS integer)) g RETURNING id"
+        ),
+        {"created": created, "first": first, "last": first + count - 1},
+    )
+    await session.execute(
+        text(
+            "INSERT INTO \"transaction\" (user_id, currency, amount, status, type, created) "
+            "SELECT user_id, 'USD', 10, status, 'DEPOSIT', :created "
+            "FROM unnest(CAST(:user_ids AS integer[])) user_id "
+            "CROSS JOIN unnest(CAST(ARRAY['PROCESSED', 'ROLLBACKED'] AS transactionstatusenum[])) status"
+        ),
+        {"created": created, "user_ids": list(result.scalars())},
+    )
+    await session.commit()
+
+
+@pytest.mark.parametrize(
+    "method",
+    [QueryService.get_registered_and_deposit_users_count, QueryService.get_registered_and_not_rollbacked_deposit_users_count],
+)
+async def test_deposit_users_count_statements_do_not_grow_with_users(session: AsyncSession, method) -> None:
+    instrument_engine(engine)
+    users = 20
+
+    await seed_depositing_users(session, 1, users)
+    with track_queries() as small:
+        assert await method(session, DAY, DAY) == users
+
+    await seed_depositing_users(session, users + 1, 4 * users)
+    with track_queries() as large:
+        assert await method(session, DAY, DAY) == 5 * users
+
+    assert large.count == small.count == 1
+
+
+@pytest.mark.parametrize(
+    "method, per_user",
+    [
+        (QueryService.get_registered_users_count, 1),
+        (QueryService.get_transactions_count, 2),
+        (QueryService.get_not_rollbacked_transactions_count, 1),
+    ],
+)
+async def test_counts_are_computed_in_the_database(session: AsyncSession, method, per_user: int) -> None:
+    instrument_engine(engine)
+    await seed_depositing_users(session, 1, 30)
+
+    with track_queries() as stats:
+        assert await method(session, DAY, DAY) == 30 * per_user
+
+    assert stats.count == 1
+    assert all(shape.startswith("SELECT count(*)") for shape in stats.shapes)
@@ -0,0 +1,61 @@
+import httpx
+import pytest
+from monitoring.pytest_plugin import QueryBudget
+
+DEPOSIT = {"currency": "USD", "amount": "10"}
+
+
+@pytest.fixture
+async def user_id(client: httpx.AsyncClient) -> int:
+    response = await client.post("/users", json={"email": "user@example.com"})
+    return int(response.json()["id"])
+
+
+async def test_post_user(client: httpx.AsyncClient, query_budget: QueryBudget) -> None:
+    with query_budget(max_queries=3):
+        response = await client.post("/users", json={"email": "new@example.com"})
+    assert response.status_code == 200
+
+
+async def test_first_deposit(client: httpx.AsyncClient, query_budget: QueryBudget, user_id: int) -> None:
+    # The first deposit also locks the user and moves them to their deposit lag bucket.
+    with query_budget(max_queries=7):
+        response = await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)
+    assert response.status_code == 200
+
+
+async def test_deposit(client: httpx.AsyncClient, query_budget: QueryBudget, user_id: int) -> None:
+    await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)
+
+    with query_budget(max_queries=4):
+        response = await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)
+    assert response.status_code == 200
+
+
+async def test_withdraw(client: httpx.AsyncClient, query_budget: QueryBudget, user_id: int) -> None:
+    await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)
+
+    with query_budget(max_queries=4):
+        response = await client.post(f"/transactions/{user_id}/withdraw", json=DEPOSIT)
+    assert response.status_code == 200
+
+
+async def test_rollback(client: httpx.AsyncClient, query_budget: QueryBudget, user_id: int) -> None:
+    await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)
+    transaction_id = (await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)).json()["id"]
+
+    with query_budget(max_queries=4):
+        response = await client.patch(f"/transactions/{user_id}/rollback/{transaction_id}")
+    assert response.status_code == 200
+
+
+async def test_get_transactions(client: httpx.AsyncClient, query_budget: QueryBudget, user_id: int) -> None:
+    for _ in range(10):
+        await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)
+
+    with query_budget(max_queries=1):
+        response = await client.get("/transactions", params={"user_id": user_id, "limit": 5})
+    assert len(response.json()["items"]) == 5
+    with query_budget(max_queries=1):
+        response = await client.get("/transactions", params={"user_id": user_id, "limit": 5, "cursor": response.json()["next_cursor"]})
+    assert len(response.json()["items"]) == 5
@@ -0,0 +1,98 @@
+import time
+import typing
+
+import httpx
+import pytest
+from db.db import PRIMARY_PIN_COOKIE, async_session_maker, build_engine, database_url, pinned_to_primary
+from db.replicas import ReplicaRouter
+from fastapi import FastAPI, HTTPException, Request
+from middleware.read_your_writes import ReadYourWritesMiddleware
+from sqlalchemy import make_url, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Nothing listens on port 1, so connecting to this "replica" fails at once.
+UNREACHABLE_URL = make_url(database_url).set(port=1).render_as_string(hide_password=False)
+
+
+@pytest.fixture
+async def engines(migrated_database: None) -> typing.AsyncIterator[typing.List[AsyncEngine]]:
+    engines = [build_engine(database_url), build_engine(database_url), build_engine(UNREACHABLE_URL, connect_timeout=1)]
+    yield engines
+    for engine in engines:
+        await engine.dispose()
+
+
+async def session_engines(router: ReplicaRouter, sessions: int) -> typing.List[typing.Any]:
+    binds = []
+    for _ in range(sessions):
+        async with await router.session() as session:
+            await session.execute(text("SELECT 1"))
+            binds.append(session.bind)
+    return binds
+
+
+async def test_sessions_go_round_robin_over_the_replicas(engines: typing.List[AsyncEngine]) -> None:
+    replicas = engines[:2]
+    router = ReplicaRouter(async_session_maker, replicas, retry_seconds=60)
+
+    binds = await session_engines(router, 4)
+
+    assert binds == [replicas[0], replicas[1], replicas[0], replicas[1]]
+    assert router.statistics() == {"replicas": 2, "healthy": 2, "replica_sessions": 4, "primary_fallbacks": 0}
+
+
+async def test_unreachable_replica_is_skipped(engines: typing.List[AsyncEngine]) -> None:
+    healthy, unreachable = engines[0], engines[2]
+    router = ReplicaRouter(async_session_maker, [unreachable, healthy], retry_seconds=60)
+
+    binds = await session_engines(router, 3)
+
+    assert binds == [healthy, healthy, healthy]
+    assert router.statistics()["healthy"] == 1
+
+
+async def test_primary_serves_reads_when_no_replica_is_reachable(engines: typing.List[AsyncEngine]) -> None:
+    router = ReplicaRouter(async_session_maker, [engines[2]], retry_seconds=60)
+
+    binds = await session_engines(router, 2)
+
+    assert binds == [async_session_maker.kw["bind"]] * 2
+    assert router.statistics()["primary_fallbacks"] == 2
+
+
+def pinning_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/write")
+    async def write(fail: bool = False) -> typing.Dict[str, typing.Any]:
+        if fail:
+            raise HTTPException(status_code=400, detail="rejected")
+        return {}
+
+    @app.get("/read")
+    async def read(request: Request) -> typing.Dict[str, typing.Any]:
+        return {"pinned": pinned_to_primary(request)}
+
+    app.add_middleware(ReadYourWritesMiddleware, pin_seconds=5)
+    return app
+
+
+async def test_client_reads_from_the_primary_after_a_write() -> None:
+    transport = httpx.ASGITransport(app=pinning_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/read")).json() == {"pinned": False}
+        assert PRIMARY_PIN_COOKIE not in (await client.post("/write", params={"fail": True})).cookies
+
+        response = await client.post("/write")
+
+        assert time.time() < float(response.cookies[PRIMARY_PIN_COOKIE]) <= time.time() + 5
+        assert PRIMARY_PIN_COOKIE not in (await client.get("/read")).cookies
+        assert (await client.get("/read")).json() == {"pinned": True}
+
+
+async def test_pin_expires() -> None:
+    transport = httpx.ASGITransport(app=pinning_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        client.cookies.set(PRIMARY_PIN_COOKIE, f"{time.time() - 1:.3f}")
+
+        assert (await client.get("/read")).json() == {"pinned": False}
@@ -0,0 +1,114 @@
+import typing
+
+import httpx
+import pytest
+
+DEPOSIT = {"currency": "USD", "amount": "10"}
+
+
+@pytest.fixture
+async def user_id(client: httpx.AsyncClient) -> int:
+    user_id = int((await client.post("/users", json={"email": "user@example.com"})).json()["id"])
+    for _ in range(5):
+        await client.post(f"/transactions/{user_id}/deposit", json=DEPOSIT)
+    await client.post(f"/transactions/{user_id}/withdraw", json=DEPOSIT)
+    return user_id
+
+
+async def test_pages_cover_every_transaction_once(client: httpx.AsyncClient, user_id: int) -> None:
+    params = {"user_id": user_id, "type": "DEPOSIT", "limit": 2}
+    pages = []
+    response = await client.get("/transactions", params=params)
+    while True:
+        page = response.json()
+        pages.append(page["items"])
+        if page["next_cursor"] is None:
+            break
+        response = await client.get("/transactions", params={**params, "cursor": page["next_cursor"]})
+
+    assert [len(items) for items in pages] == [2, 2, 1]
+    items = [item for items in pages for item in items]
+    assert all(item["type"] == "DEPOSIT" for item in items)
+    assert len({item["id"] for item in items}) == 5
+    assert [item["id"] for item in items] == sorted((item["id"] for item in items), reverse=True)
+
+
+async def test_cursor_of_other_filters_is_rejected(client: httpx.AsyncClient, user_id: int) -> None:
+    page = (await client.get("/transactions", params={"user_id": user_id, "status": "PROCESSED", "limit": 2})).json()
+
+    response = await client.get("/transactions", params={"user_id": user_id, "limit": 2, "cursor": page["next_cursor"]})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Pagination cursor was issued for other filters"
+
+
+async def test_malformed_cursor_is_rejected(client: httpx.AsyncClient) -> None:
+    response = await client.get("/transactions", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+async def post_batch(client: httpx.AsyncClient, mode: str, items: typing.List[typing.Dict[str, typing.Any]]) -> typing.Dict[str, typing.Any]:
+    response = await client.post("/transactions/batch", json={"mode": mode, "items": items})
+    assert response.status_code == 200
+    return typing.cast(typing.Dict[str, typing.Any], response.json())
+
+
+async def net_worth(client: httpx.AsyncClient, user_id: int) -> float:
+    return float((await client.get(f"/users/{user_id}/net-worth")).json()["amount_usd"])
+
+
+def batch_item(user_id: int, type: str, amount: str) -> typing.Dict[str, typing.Any]:
+    return {"user_id": user_id, "currency": "USD", "amount": amount, "type": type}
+
+
+@pytest.mark.parametrize("mode", ["ATOMIC", "BEST_EFFORT"])
+async def test_empty_batch(client: httpx.AsyncClient, mode: str) -> None:
+    assert await post_batch(client, mode, []) == {"applied_count": 0, "rejected_count": 0, "results": []}
+
+
+async def test_batch_applies_deposits_and_withdrawals_of_a_user_in_order(client: httpx.AsyncClient, user_id: int) -> None:
+    # The last withdrawal only fits after the deposit before it (the user starts with 40).
+    items = [
+        batch_item(user_id, "WITHDRAW", "35"),
+        batch_item(user_id, "DEPOSIT", "5"),
+        batch_item(user_id, "WITHDRAW", "10"),
+    ]
+
+    body = await post_batch(client, "ATOMIC", items)
+
+    assert (body["applied_count"], body["rejected_count"]) == (3, 0)
+    assert [(result["index"], result["transaction"]["type"]) for result in body["results"]] == [
+        (0, "WITHDRAW"), (1, "DEPOSIT"), (2, "WITHDRAW")
+    ]
+    assert await net_worth(client, user_id) == 0
+
+
+async def test_atomic_batch_rolls_back_every_item_when_one_fails(client: httpx.AsyncClient, user_id: int) -> None:
+    before = (await client.get("/transactions", params={"user_id": user_id})).json()["items"]
+    items = [batch_item(user_id, "DEPOSIT", "100"), batch_item(user_id, "WITHDRAW", "1000")]
+
+    body = await post_batch(client, "ATOMIC", items)
+
+    assert (body["applied_count"], body["rejected_count"]) == (0, 2)
+    assert [result["applied"] for result in body["results"]] == [False, False]
+    assert all(result["transaction"] is None and result["error"] for result in body["results"])
+    assert await net_worth(client, user_id) == 40
+    assert (await client.get("/transactions", params={"user_id": user_id})).json()["items"] == before
+
+
+async def test_best_effort_batch_reports_each_item(client: httpx.AsyncClient, user_id: int) -> None:
+    items = [
+        batch_item(user_id, "WITHDRAW", "1000"),
+        batch_item(user_id, "DEPOSIT", "100"),
+        batch_item(user_id + 1000, "DEPOSIT", "100"),
+    ]
+
+    body = await post_batch(client, "BEST_EFFORT", items)
+
+    assert (body["applied_count"], body["rejected_count"]) == (1, 2)
+    rejected, applied, unknown_user = body["results"]
+    assert not rejected["applied"] and rejected["transaction"] is None and rejected["error"]
+    assert applied["applied"] and applied["error"] is None and applied["transaction"]["amount"] == "100.00000000"
+    assert not unknown_user["applied"] and unknown_user["error"]
+    assert await net_worth(client, user_id) == 140
@@ -0,0 +1,58 @@
+import typing
+
+import httpx
+import pytest
+import services.users
+from db.db import engine
+from db.models import DailyRegistrationMetrics, User, UserBalance
+from monitoring.query_budget import instrument_engine, track_queries
+from schemas.enums import CurrencyEnum
+from services.metrics_rollup import REGISTRATION_LAG_DAYS
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def post_bulk(client: httpx.AsyncClient, emails: typing.List[str]) -> typing.Dict[str, typing.Any]:
+    response = await client.post("/users/bulk", json={"emails": emails})
+    assert response.status_code == 200
+    return typing.cast(typing.Dict[str, typing.Any], response.json())
+
+
+async def test_bulk_create_inserts_one_statement_per_chunk(
+    client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(services.users, "BULK_CHUNK_SIZE", 3)
+    instrument_engine(engine)
+    emails = [f"user{i}@example.com" for i in range(8)]
+
+    with track_queries() as stats:
+        body = await post_bulk(client, emails)
+
+    assert [user["email"] for user in body["created"]] == emails
+    inserts = sum(count for shape, count in stats.shapes.items() if shape.startswith('INSERT INTO "user"'))
+    assert inserts == 3
+
+
+async def test_bulk_create_skips_registered_and_repeated_emails(client: httpx.AsyncClient, session: AsyncSession) -> None:
+    await post_bulk(client, ["old@example.com"])
+
+    body = await post_bulk(client, ["new@example.com", "old@example.com", "new@example.com", "other@example.com"])
+
+    assert [user["email"] for user in body["created"]] == ["new@example.com", "other@example.com"]
+    assert body["existing"] == ["old@example.com"]
+    assert (await session.execute(select(func.count()).select_from(User))).scalar_one() == 3
+
+
+async def test_bulk_create_adds_balances_and_registrations(client: httpx.AsyncClient, session: AsyncSession) -> None:
+    body = await post_bulk(client, ["a@example.com", "b@example.com"])
+    user_ids = [user["id"] for user in body["created"]]
+
+    balances = await session.execute(
+        select(UserBalance.user_id, UserBalance.currency, UserBalance.amount).where(UserBalance.user_id.in_(user_ids))
+    )
+    assert sorted(balances.all()) == sorted((user_id, currency.value, 0) for user_id in user_ids for currency in CurrencyEnum)
+    registrations = await session.execute(
+        select(DailyRegistrationMetrics.deposit_lag, func.sum(DailyRegistrationMetrics.deposit_users_count))
+        .group_by(DailyRegistrationMetrics.deposit_lag)
+    )
+    assert registrations.all() == [(REGISTRATION_LAG_DAYS, 2)]